@@ -0,0 +1,159 @@
+"""
+Analisador de texto em português: usado pelo índice BM25 do assistente e
+pela busca de espécies da barra lateral.
+
+texto -> minúsculas, sem acento -> tokens -> sem stopwords -> radical
+
+O radical vem de um stemmer leve (só plural e vogal final: "Municípios" e
+"municipio" viram "municipi", "morcegos" vira "morceg"). Nomes científicos
+passam pelo mesmo caminho; como índice e consulta usam a mesma função,
+o que importa é ser consistente, não ser gramaticalmente certo.
+
+Para erros de digitação ("Sturnyra lilium"), `TrigramIndex` guarda os
+trigramas de cada termo do vocabulário. É montado junto com o índice; na
+consulta, só os termos que não existem no vocabulário são procurados nele.
+"""
+import re
+import unicodedata
+
+import numpy as np
+
+# similaridade (Dice entre trigramas) mínima para aceitar uma correção
+FUZZY_MIN = 0.5
+# termos curtos têm poucos trigramas: correção vira chute
+FUZZY_MIN_LEN = 4
+
+STOPWORDS = frozenset("""
+a ao aos as ate com como da das de do dos e ela elas ele eles em entre essa
+esse esta este eu foi foram ha isso isto la me mais mas meu minha na nas no
+nos o onde os ou para pela pelas pelo pelos por pra qual quais quando quanta
+quantas quanto quantos que quem sao se sem ser seu sua sobre tem tambem um
+uma umas uns voce
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# plural -> singular, na ordem (a primeira regra que casar vale)
+_PLURAL_RULES = [
+    ("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"), ("ois", "ol"),
+    ("ns", "m"), ("res", "r"), ("zes", "z"), ("ses", "s"),
+]
+
+
+def fold(text) -> str:
+    """
+    Minúsculas, sem acento e com espaços normalizados.
+    """
+    s = unicodedata.normalize("NFKD", str(text or ""))
+    s = "".join(ch for ch in s if not unicodedata.combining(ch)).lower()
+    return re.sub(r"\s+", " ", s).strip()
+
+
+def stem(token: str) -> str:
+    if len(token) <= 3 or not token.isalpha():
+        return token
+    for suffix, repl in _PLURAL_RULES:
+        if token.endswith(suffix):
+            token = token[:-len(suffix)] + repl
+            break
+    else:
+        # "us"/"is"/"ss" no fim quase sempre não é plural (velatus, lapis)
+        if token.endswith("s") and not token.endswith(("ss", "us", "is")):
+            token = token[:-1]
+    if len(token) > 4 and token[-1] in "aeo":
+        token = token[:-1]
+    return token
+
+
+def analyze(text) -> list[str]:
+    return [stem(t) for t in _TOKEN_RE.findall(fold(text)) if t not in STOPWORDS]
+
+
+def trigrams(term: str) -> set[str]:
+    t = f"${term}$"
+    return {t[i:i + 3] for i in range(len(t) - 2)}
+
+
+class TrigramIndex:
+    """
+    Trigrama -> termos que o contêm (CSR, como os postings do BM25).
+    Os ids são as posições em `terms` (no BM25, os mesmos ids do vocabulário).
+    """
+
+    def __init__(self, grams: list[str], indptr: np.ndarray, term_ids: np.ndarray, term_ngrams: np.ndarray):
+        self.grams = {g: i for i, g in enumerate(grams)}
+        self.indptr = indptr
+        self.term_ids = term_ids
+        self.term_ngrams = term_ngrams
+
+    @classmethod
+    def build(cls, terms) -> "TrigramIndex":
+        gram_ids: dict[str, int] = {}
+        pairs_g, pairs_t = [], []
+        term_ngrams = np.zeros(len(terms), dtype=np.int32)
+        for tid, term in enumerate(terms):
+            if len(term) < FUZZY_MIN_LEN or not term.isalpha():
+                continue
+            grams = trigrams(term)
+            term_ngrams[tid] = len(grams)
+            for g in grams:
+                pairs_g.append(gram_ids.setdefault(g, len(gram_ids)))
+                pairs_t.append(tid)
+        pairs_g = np.asarray(pairs_g, dtype=np.int64)
+        order = np.argsort(pairs_g, kind="stable")
+        indptr = np.zeros(len(gram_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(pairs_g, minlength=len(gram_ids)), out=indptr[1:])
+        return cls(list(gram_ids), indptr, np.asarray(pairs_t, dtype=np.int32)[order], term_ngrams)
+
+    def lookup(self, term: str, limit: int = 1, min_sim: float = FUZZY_MIN) -> list[tuple[float, int]]:
+        """
+        Termos parecidos com `term`: [(similaridade, id), ...], melhores primeiro.
+        """
+        if len(term) < FUZZY_MIN_LEN or not term.isalpha():
+            return []
+        grams = [self.grams[g] for g in trigrams(term) if g in self.grams]
+        if not grams:
+            return []
+        cand = np.concatenate([self.term_ids[self.indptr[g]:self.indptr[g + 1]] for g in grams])
+        ids, common = np.unique(cand, return_counts=True)
+        sims = 2.0 * common / (len(trigrams(term)) + self.term_ngrams[ids])
+        keep = sims >= min_sim
+        ids, sims = ids[keep], sims[keep]
+        best = np.argsort(-sims, kind="stable")[:limit]
+        return [(float(sims[i]), int(ids[i])) for i in best]
+
+
+class NameSearch:
+    """
+    Busca por nomes (científicos e comuns) da barra lateral: cada palavra da
+    busca tem que casar com o nome, exata (depois do analisador) ou pela
+    correção mais parecida.
+    """
+
+    def __init__(self, names):
+        self.names = sorted({str(n).strip() for n in names if str(n).strip()})
+        postings: dict[str, set[int]] = {}
+        for i, name in enumerate(self.names):
+            for t in analyze(name):
+                postings.setdefault(t, set()).add(i)
+        self.terms = list(postings)
+        self.postings = [postings[t] for t in self.terms]
+        self.vocab = {t: i for i, t in enumerate(self.terms)}
+        self.fuzzy = TrigramIndex.build(self.terms)
+
+    def search(self, query: str) -> tuple[list[str], dict[str, str]]:
+        """
+        Retorna (nomes encontrados, {termo da busca: termo corrigido}).
+        """
+        found: set[int] | None = None
+        fixed = {}
+        for t in dict.fromkeys(analyze(query)):
+            if t in self.vocab:
+                hits = self.postings[self.vocab[t]]
+            else:
+                best = self.fuzzy.lookup(t, limit=3)
+                hits = set().union(*(self.postings[i] for _, i in best)) if best else set()
+                if best:
+                    fixed[t] = self.terms[best[0][1]]
+            found = hits if found is None else found & hits
+        return [self.names[i] for i in sorted(found or ())], fixed
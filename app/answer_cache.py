@@ -0,0 +1,126 @@
+"""
+Cache de respostas do assistente.
+
+A chave é um hash de: pergunta normalizada + modelo + temperatura + ids dos
+trechos recuperados + fingerprint do dataset (+ resumo da conversa, se houver). A mesma pergunta, com o mesmo
+contexto, responde na hora sem chamar o Ollama (inclusive em outra sessão).
+
+Duas camadas:
+  - LRU em memória (por processo)
+  - SQLite em .cache_painel/respostas.sqlite, com limite de tamanho
+    (remove as respostas usadas há mais tempo)
+
+Quando a fingerprint do dataset muda, as respostas antigas são apagadas.
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from cache_painel import cache_path
+
+LRU_SIZE = 256
+MAX_BYTES = 20 * 1024 * 1024
+
+
+def normalize_question(question: str) -> str:
+    q = unicodedata.normalize("NFC", question or "").lower()
+    q = re.sub(r"\s+", " ", q).strip()
+    return q.strip(" ?!.")
+
+
+def answer_key(question: str, model: str, temperature: float, context_ids, dataset_fp: str,
+               history: str = "") -> str:
+    parts = [normalize_question(question), model, round(float(temperature), 3), [int(i) for i in context_ids], dataset_fp]
+    # o resumo da conversa muda a resposta de perguntas de seguimento;
+    # sem histórico a chave fica igual à de antes
+    if history:
+        parts.append(history)
+    payload = json.dumps(parts, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """
+    LRU em memória na frente de uma tabela SQLite.
+    """
+
+    def __init__(self, path=None, lru_size: int = LRU_SIZE, max_bytes: int = MAX_BYTES):
+        self.path = path or cache_path("respostas.sqlite")
+        self.lru_size = lru_size
+        self.max_bytes = max_bytes
+        self._lru: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(str(self.path), check_same_thread=False, timeout=5)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute(
+            "CREATE TABLE IF NOT EXISTS respostas ("
+            " chave TEXT PRIMARY KEY, dataset_fp TEXT, resposta TEXT,"
+            " tamanho INTEGER, criada REAL, usada REAL)"
+        )
+        self._con.execute("CREATE INDEX IF NOT EXISTS respostas_usada ON respostas (usada)")
+        self._con.commit()
+
+    def _remember(self, key: str, answer: str):
+        self._lru[key] = answer
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                return self._lru[key]
+            row = self._con.execute("SELECT resposta FROM respostas WHERE chave=?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._con.execute("UPDATE respostas SET usada=? WHERE chave=?", (time.time(), key))
+            self._con.commit()
+            self._remember(key, row[0])
+            return row[0]
+
+    def put(self, key: str, answer: str, dataset_fp: str):
+        size = len(answer.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._remember(key, answer)
+            self._con.execute(
+                "INSERT OR REPLACE INTO respostas VALUES (?, ?, ?, ?, ?, ?)",
+                (key, dataset_fp, answer, size, now, now),
+            )
+            self._evict()
+            self._con.commit()
+
+    def _evict(self):
+        total = self._con.execute("SELECT COALESCE(SUM(tamanho), 0) FROM respostas").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # apaga as menos usadas até voltar pra ~90% do limite
+        excess = total - int(self.max_bytes * 0.9)
+        rows = self._con.execute("SELECT chave, tamanho FROM respostas ORDER BY usada").fetchall()
+        drop = []
+        for key, size in rows:
+            if excess <= 0:
+                break
+            drop.append((key,))
+            excess -= size
+        self._con.executemany("DELETE FROM respostas WHERE chave=?", drop)
+        for (key,) in drop:
+            self._lru.pop(key, None)
+
+    def keep_only(self, dataset_fp: str) -> int:
+        """
+        Apaga as respostas de outras versões do dataset. Retorna quantas saíram.
+        """
+        with self._lock:
+            n = self._con.execute("DELETE FROM respostas WHERE dataset_fp<>?", (dataset_fp,)).rowcount
+            self._con.commit()
+            if n:
+                # a fingerprint faz parte da chave, então as do LRU já não casam mais
+                self._lru.clear()
+            return n
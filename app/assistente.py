@@ -0,0 +1,172 @@
+"""
+Caminho do assistente com RAG, sem Streamlit: recuperação (BM25 + vetores),
+montagem do prompt (contexto.py), cache de respostas e chamada ao Ollama.
+
+Usado pelo dashboard e pelo benchmark (bench_assistente.py).
+"""
+import bm25
+import contexto
+import embeddings
+import ollama_client
+from answer_cache import AnswerCache, answer_key
+
+# Espera máxima pelo vetor da pergunta, (conexão, leitura) em s. A recuperação
+# roda na thread da página, antes da fila (llm_queue.py): com o Ollama ocupado
+# gerando para outra sessão, a página ficaria parada até ele terminar.
+# Passou disso, só BM25.
+QUERY_EMBED_TIMEOUT = (2.0, 3.0)
+
+
+def should_use_rag(question: str) -> bool:
+    q = (question or "").strip().lower()
+
+    # muito curto: geralmente é conversa
+    if len(q) <= 4:
+        return False
+
+    # saudações / small talk comuns
+    small_talk = {
+        "oi", "olá", "ola", "eai", "e aí", "bom dia", "boa tarde", "boa noite",
+        "tudo bem", "td bem", "blz", "beleza", "valeu", "obrigado", "obrigada"
+    }
+    if q in small_talk:
+        return False
+
+    return True
+
+
+def retrieve(question: str, index, max_context_docs: int = 4, vectors=None) -> list[tuple[float, int]]:
+    """
+    Trechos relevantes: BM25 (acima do limiar) e, se os vetores estiverem
+    prontos e o Ollama responder logo (QUERY_EMBED_TIMEOUT), busca densa
+    fundida por RRF. Retorna [(score, doc_id), ...].
+    """
+    # Limiar mínimo (evita “oi” virar espécie aleatória)
+    # Ajuste fino: se tiver muitos falsos positivos, sobe para 2.0 / 3.0
+    MIN_SCORE = 1.2
+
+    if vectors is None or not vectors.ready:
+        scored = bm25.search_ids(index, question, top_k=max_context_docs)
+        return [(s, i) for (s, i) in scored if s >= MIN_SCORE]
+
+    # cada lista traz mais candidatos que o top-k final, pra fusão ter o que combinar
+    pool = max_context_docs * 3
+    lexical = [(s, i) for (s, i) in bm25.search_ids(index, question, top_k=pool) if s >= MIN_SCORE]
+    try:
+        qvec = ollama_client.embed(vectors.model, [question], timeout=QUERY_EMBED_TIMEOUT)[0]
+        dense = vectors.search(qvec, top_k=pool)
+    except Exception:
+        dense = []
+    return embeddings.fuse([lexical, dense], top_k=max_context_docs)
+
+
+def rag_messages(question: str, index, max_context_docs: int = 4, vectors=None, columns=None,
+                 history: str = "", context_tokens: int = contexto.CONTEXT_TOKENS) -> tuple[list[dict], list[int]]:
+    """
+    Monta as mensagens pro modelo: conversa simples, "sem dados" ou
+    pergunta + trechos recuperados (BM25 + vetores), dentro do orçamento
+    de tokens (ver contexto.py). `columns` e o resumo da conversa (`history`)
+    vão no prompt de sistema.
+    Retorna (mensagens, ids dos trechos usados no contexto).
+    """
+    # 1) Gate: small talk não usa RAG
+    if not should_use_rag(question):
+        return [
+            {"role": "system", "content": "Você é um assistente cordial. Responda em português, curto e direto."},
+            {"role": "user", "content": question},
+        ], []
+
+    extra = ""
+    if columns is not None:
+        schema = contexto.schema_prompt(columns)
+        if schema:
+            extra += f"\n\n{schema}"
+    if history:
+        extra += f"\n\nConversa até aqui (resumo):\n{history}"
+
+    # 2) Recupera com score (já filtrado pelos limiares)
+    scored = retrieve(question, index, max_context_docs=max_context_docs, vectors=vectors)
+
+    # 3) Trechos em ordem de score até encher o orçamento
+    lines, kept_ids = contexto.pack_context(
+        [(s, i, index["docs"][i]) for (s, i) in scored], budget=context_tokens,
+    )
+
+    # se nada relevante, responde SEM inventar
+    if not lines:
+        return [
+            {"role": "system", "content": "Você é um assistente do Painel. Se não tiver dados suficientes, diga isso e sugira o que perguntar." + extra},
+            {"role": "user", "content": f"Pergunta: {question}\n\nContexto: (nenhum trecho relevante encontrado)"},
+        ], []
+
+    context = "\n".join(lines)
+    if len(kept_ids) < len(scored):
+        context += "\n...(contexto cortado)"
+
+    system = (
+        "Você é um assistente do Painel de Coleção de Zoologia. "
+        "Responda em português, curto e objetivo. "
+        "Use SOMENTE o contexto fornecido. "
+        "Se a pergunta for geral demais, peça um 'N tombo coleção' ou um filtro (Município, Classe, etc.)."
+    ) + extra
+
+    user = f"Pergunta: {question}\n\nContexto (trechos recuperados do XLSX/KML):\n{context}"
+
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user},
+    ], kept_ids
+
+
+def _stream_and_store(chunks, cache: AnswerCache, key: str, dataset_fp: str):
+    # só grava se a resposta chegou inteira (erro no meio não vai pro cache)
+    parts = []
+    for piece in chunks:
+        parts.append(piece)
+        yield piece
+    answer = "".join(parts).strip()
+    if answer:
+        cache.put(key, answer, dataset_fp)
+
+
+def plan_answer(question: str, model: str, index, max_context_docs: int = 4, temperature: float = 0.2,
+                cache: AnswerCache | None = None, dataset_fp: str = "", vectors=None, columns=None,
+                history: str = "", context_tokens: int = contexto.CONTEXT_TOKENS):
+    """
+    Recuperação + consulta ao cache de respostas, sem chamar o modelo.
+    Retorna (resposta_em_cache ou None, função que gera os pedaços da resposta).
+    """
+    messages, context_ids = rag_messages(
+        question, index, max_context_docs=max_context_docs, vectors=vectors,
+        columns=columns, history=history, context_tokens=context_tokens,
+    )
+
+    key = answer_key(question, model, temperature, context_ids, dataset_fp, history=history)
+    cached = cache.get(key) if cache is not None else None
+
+    def make_chunks():
+        chunks = ollama_client.chat_stream(model=model, messages=messages, temperature=temperature)
+        return _stream_and_store(chunks, cache, key, dataset_fp) if cache is not None else chunks
+
+    return cached, make_chunks
+
+
+def answer_with_local_rag(question: str, model: str, index, max_context_docs: int = 4, stream: bool = False,
+                          temperature: float = 0.2, cache: AnswerCache | None = None, dataset_fp: str = "",
+                          vectors=None, columns=None, history: str = "",
+                          context_tokens: int = contexto.CONTEXT_TOKENS):
+    """
+    Resposta do assistente, chamando o modelo direto (sem a fila).
+    Com stream=True devolve um gerador de pedaços de texto; senão, a resposta inteira.
+    Com `cache`, pergunta repetida (mesmo contexto recuperado) não chama o Ollama.
+    """
+    cached, make_chunks = plan_answer(
+        question, model, index, max_context_docs=max_context_docs, temperature=temperature,
+        cache=cache, dataset_fp=dataset_fp, vectors=vectors,
+        columns=columns, history=history, context_tokens=context_tokens,
+    )
+    if cached is not None:
+        return iter([cached]) if stream else cached
+    if stream:
+        return make_chunks()
+    return "".join(make_chunks()).strip()
@@ -0,0 +1,402 @@
+"""
+Filtros da barra lateral, KPIs, contagens (município/mês) e estatísticas
+descritivas do painel, com dois motores atrás da mesma interface:
+
+  - pandas (padrão): posições de linha sobre o DataFrame compartilhado
+    (ver snapshot.py); as colunas dos filtros viram códigos uma vez só.
+  - SQL embutido: o dataset pronto (planilhas + coordenadas do KML) é gravado
+    uma vez por versão num arquivo DuckDB ou SQLite em .cache_painel/banco/,
+    e filtros, contagens e estatísticas viram SQL executado lá. Com DuckDB a
+    execução é colunar e o arquivo pode ser maior que a memória.
+
+PAINEL_BACKEND=pandas | sqlite | duckdb escolhe o motor. O DuckDB é opcional
+(pip install duckdb): sem ele, usa SQLite, que vem com o Python. Se o banco
+não abrir, o painel volta para pandas e mostra o motivo em `aviso`.
+
+Uso no painel:
+    filtro = backend.filtro()
+    filtro.isin("Municipio", ["Barbacena"])
+    filtro.date_between("Data entrada", inicio, fim)
+    filtro.kpis(), filtro.count_by("Municipio"), filtro.frame()
+"""
+import importlib.util
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+from cache_painel import CACHE_DIR
+
+BACKEND = os.environ.get("PAINEL_BACKEND", "pandas").strip().lower()
+DB_DIR = CACHE_DIR / "banco"
+KEEP_DBS = 2
+
+TABLE = "coletas"
+POS_COL = "_pos"
+EMPTY = "(vazio)"
+# colunas que o painel trata como número mas que misturam texto na planilha
+NUMERIC_COPIES = {"Peso (g)": "_peso"}
+
+KPI_CLASSES = ["Mammalia", "Aves", "Reptilia", "Amphibia"]
+KPI_DISTINCT = ["Ordem", "Familia", "Nome cientifico", "Municipio"]
+DESCRIBE_STATS = ["count", "mean", "std", "min", "25%", "50%", "75%", "max"]
+
+
+def quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+# -----------------------
+# pandas
+# -----------------------
+class PandasBackend:
+    engine = "pandas"
+
+    def __init__(self, df: pd.DataFrame, aviso: str | None = None):
+        self.df = df
+        self.aviso = aviso
+        self._codes: dict[str, tuple[np.ndarray, pd.Index]] = {}
+        self._lock = threading.Lock()
+
+    def codes(self, col: str) -> tuple[np.ndarray, pd.Index]:
+        """
+        (código por linha, rótulos ordenados) da coluna, com o mesmo critério
+        dos filtros (`fillna("(vazio)").astype(str)`). Calculado uma vez.
+        """
+        with self._lock:
+            if col not in self._codes:
+                self._codes[col] = pd.factorize(self.df[col].fillna(EMPTY).astype(str), sort=True)
+            return self._codes[col]
+
+    def filtro(self) -> "PandasFiltro":
+        return PandasFiltro(self)
+
+
+class PandasFiltro:
+    def __init__(self, backend: PandasBackend):
+        self.b = backend
+        self.rows = np.arange(len(backend.df))
+
+    def options(self, col: str) -> list[str]:
+        codes, labels = self.b.codes(col)
+        return labels[np.unique(codes[self.rows])].tolist()
+
+    def isin(self, col: str, selected, options=None):
+        # tudo marcado = sem condição
+        if options is not None and len(selected) == len(options):
+            return
+        codes, labels = self.b.codes(col)
+        self.rows = self.rows[np.isin(codes[self.rows], labels.get_indexer(list(selected)))]
+
+    def _dates(self, col: str) -> pd.Series:
+        # a coluna já vem como data do snapshot (ver snapshot.arrow_ready)
+        return pd.to_datetime(self.b.df[col], errors="coerce").iloc[self.rows]
+
+    def date_bounds(self, col: str):
+        dates = self._dates(col).dropna()
+        return (dates.min(), dates.max()) if len(dates) else None
+
+    def date_between(self, col: str, start, end):
+        dates = self._dates(col)
+        self.rows = self.rows[(dates.isna() | ((dates >= start) & (dates <= end))).to_numpy()]
+
+    def any_in(self, cols, values):
+        df = self.b.df
+        mask = np.zeros(len(self.rows), dtype=bool)
+        for c in cols:
+            if c in df.columns:
+                mask |= df[c].iloc[self.rows].astype(str).str.strip().isin(values).to_numpy()
+        self.rows = self.rows[mask]
+
+    def positions(self) -> np.ndarray:
+        return self.rows
+
+    def frame(self) -> pd.DataFrame:
+        # sem filtro nenhum, o próprio DF compartilhado (sem cópia)
+        df = self.b.df
+        return df if len(self.rows) == len(df) else df.take(self.rows)
+
+    def kpis(self) -> dict:
+        df = self.b.df
+        out = {"linhas": len(self.rows)}
+        if "Classe" in df.columns:
+            codes, labels = self.b.codes("Classe")
+            counts = np.bincount(codes[self.rows], minlength=len(labels))
+            out.update({c: int(counts[labels.get_loc(c)]) if c in labels else 0 for c in KPI_CLASSES})
+        else:
+            out.update({c: 0 for c in KPI_CLASSES})
+        for col in KPI_DISTINCT:
+            out[col] = int(df[col].iloc[self.rows].nunique()) if col in df.columns else 0
+        return out
+
+    def count_by(self, col: str) -> pd.DataFrame:
+        codes, labels = self.b.codes(col)
+        counts = np.bincount(codes[self.rows], minlength=len(labels))
+        keep = counts > 0
+        out = pd.DataFrame({col: labels[keep], "Contagem": counts[keep]})
+        return out.sort_values("Contagem", ascending=False, kind="stable").reset_index(drop=True)
+
+    def count_by_month(self, col: str) -> pd.DataFrame:
+        months = self._dates(col).dropna().dt.strftime("%Y-%m")
+        return months.rename("Mês").to_frame().groupby("Mês").size().reset_index(name="Contagem")
+
+    def describe(self, cols, require: str) -> pd.DataFrame:
+        """
+        Estatísticas das colunas numéricas de `cols`, nas linhas com `require` numérico.
+        """
+        df = self.b.df
+        rows = self.rows
+        if require in df.columns:
+            rows = rows[pd.to_numeric(df[require].iloc[rows], errors="coerce").notna().to_numpy()]
+        data = {}
+        for c in cols:
+            if c in NUMERIC_COPIES and c in df.columns:
+                data[c] = pd.to_numeric(df[c].iloc[rows], errors="coerce")
+            elif c in df.columns and pd.api.types.is_numeric_dtype(df[c]):
+                data[c] = df[c].iloc[rows]
+        if not data:
+            return pd.DataFrame(columns=DESCRIBE_STATS)
+        return pd.DataFrame(data).describe().T
+
+
+# -----------------------
+# SQL (DuckDB / SQLite)
+# -----------------------
+class _Quantile:
+    # quantile_cont do DuckDB para o SQLite (interpolação linear, igual ao pandas)
+    def __init__(self):
+        self.values = []
+        self.q = 0.5
+
+    def step(self, value, q):
+        if value is not None:
+            self.values.append(value)
+        self.q = q
+
+    def finalize(self):
+        return float(np.quantile(self.values, self.q)) if self.values else None
+
+
+class _StdSamp:
+    def __init__(self):
+        self.values = []
+
+    def step(self, value):
+        if value is not None:
+            self.values.append(value)
+
+    def finalize(self):
+        return float(np.std(self.values, ddof=1)) if len(self.values) > 1 else None
+
+
+def _build(path, df: pd.DataFrame, engine: str):
+    """
+    Grava o dataset no banco (arquivo temporário + os.replace).
+    """
+    extra = {POS_COL: np.arange(len(df))}
+    extra.update({dst: pd.to_numeric(df[src], errors="coerce") for src, dst in NUMERIC_COPIES.items() if src in df.columns})
+    data = df.assign(**extra)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".tmp-{os.getpid()}-{path.name}")
+    tmp.unlink(missing_ok=True)
+    if engine == "duckdb":
+        import duckdb
+
+        con = duckdb.connect(str(tmp))
+        con.register("dados", data)
+        con.execute(f"CREATE TABLE {TABLE} AS SELECT * FROM dados")
+        con.close()
+    else:
+        con = sqlite3.connect(tmp)
+        data.to_sql(TABLE, con, index=False)
+        con.commit()
+        con.close()
+    os.replace(tmp, path)
+
+
+def prune(keep: int = KEEP_DBS):
+    if not DB_DIR.exists():
+        return
+    files = sorted((p for p in DB_DIR.iterdir() if p.is_file() and not p.name.startswith(".")),
+                   key=lambda p: p.stat().st_mtime, reverse=True)
+    for p in files[keep:]:
+        try:
+            p.unlink(missing_ok=True)
+        except PermissionError:
+            pass  # Windows: aberto por outro processo; sai na próxima
+
+
+class SQLBackend:
+    def __init__(self, path, engine: str, df: pd.DataFrame):
+        self.path = path
+        self.engine = engine
+        self.aviso = None
+        # o DF compartilhado só é usado para montar a tabela/mapa das linhas filtradas
+        self.df = df
+        self._local = threading.local()
+        if engine == "duckdb":
+            import duckdb
+
+            self._db = duckdb.connect(str(path), read_only=True)
+            schema = self.query(f"SELECT column_name, data_type FROM information_schema.columns WHERE table_name = '{TABLE}'")
+        else:
+            schema = [(r[1], r[2]) for r in self.query(f"PRAGMA table_info({TABLE})")]
+        self.columns = {name for name, _ in schema}
+        numeric = ("INT", "REAL", "DOUBLE", "FLOAT", "DECIMAL", "NUMERIC")
+        self.numeric = {name for name, kind in schema if any(k in (kind or "").upper() for k in numeric)}
+
+    def _con(self):
+        # uma conexão por thread (cada sessão do Streamlit roda na sua)
+        con = getattr(self._local, "con", None)
+        if con is None:
+            if self.engine == "duckdb":
+                con = self._db.cursor()
+            else:
+                con = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+                con.create_aggregate("quantile_cont", 2, _Quantile)
+                con.create_aggregate("stddev_samp", 1, _StdSamp)
+            self._local.con = con
+        return con
+
+    def query(self, sql: str, params=()) -> list[tuple]:
+        return self._con().execute(sql, list(params)).fetchall()
+
+    def month(self, expr: str) -> str:
+        # datas: TIMESTAMP no DuckDB, texto "AAAA-MM-DD hh:mm:ss" no SQLite
+        return f"strftime({expr}, '%Y-%m')" if self.engine == "duckdb" else f"substr({expr}, 1, 7)"
+
+    def timestamp(self, value):
+        ts = pd.Timestamp(value)
+        return ts.to_pydatetime() if self.engine == "duckdb" else ts.strftime("%Y-%m-%d %H:%M:%S")
+
+    def filtro(self) -> "SQLFiltro":
+        return SQLFiltro(self)
+
+
+class SQLFiltro:
+    def __init__(self, backend: SQLBackend):
+        self.b = backend
+        self.conds: list[str] = []
+        self.params: list = []
+
+    def _where(self, *extra: str) -> str:
+        conds = self.conds + list(extra)
+        return (" WHERE " + " AND ".join(conds)) if conds else ""
+
+    @staticmethod
+    def _label(col: str) -> str:
+        return f"COALESCE(CAST({quote(col)} AS VARCHAR), '{EMPTY}')"
+
+    def options(self, col: str) -> list[str]:
+        rows = self.b.query(f"SELECT DISTINCT {self._label(col)} FROM {TABLE}{self._where()}", self.params)
+        return sorted(r[0] for r in rows)
+
+    def isin(self, col: str, selected, options=None):
+        if options is not None and len(selected) == len(options):
+            return
+        selected = list(selected)
+        if not selected:
+            self.conds.append("1 = 0")
+            return
+        self.conds.append(f"{self._label(col)} IN ({', '.join('?' * len(selected))})")
+        self.params += selected
+
+    def date_bounds(self, col: str):
+        lo, hi = self.b.query(f"SELECT MIN({quote(col)}), MAX({quote(col)}) FROM {TABLE}{self._where()}", self.params)[0]
+        return (pd.Timestamp(lo), pd.Timestamp(hi)) if lo is not None else None
+
+    def date_between(self, col: str, start, end):
+        q = quote(col)
+        self.conds.append(f"({q} IS NULL OR ({q} >= ? AND {q} <= ?))")
+        self.params += [self.b.timestamp(start), self.b.timestamp(end)]
+
+    def any_in(self, cols, values):
+        cols = [c for c in cols if c in self.b.columns]
+        values = list(values)
+        if not cols or not values:
+            self.conds.append("1 = 0")
+            return
+        marks = ", ".join("?" * len(values))
+        self.conds.append("(" + " OR ".join(f"TRIM(CAST({quote(c)} AS VARCHAR)) IN ({marks})" for c in cols) + ")")
+        self.params += values * len(cols)
+
+    def positions(self) -> np.ndarray:
+        rows = self.b.query(f"SELECT {POS_COL} FROM {TABLE}{self._where()} ORDER BY {POS_COL}", self.params)
+        return np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+
+    def frame(self) -> pd.DataFrame:
+        df = self.b.df
+        rows = self.positions()
+        return df if len(rows) == len(df) else df.take(rows)
+
+    def kpis(self) -> dict:
+        exprs, params = ["COUNT(*)"], []
+        for c in KPI_CLASSES:
+            if "Classe" in self.b.columns:
+                exprs.append(f"COALESCE(SUM(CASE WHEN CAST({quote('Classe')} AS VARCHAR) = ? THEN 1 ELSE 0 END), 0)")
+                params.append(c)
+            else:
+                exprs.append("0")
+        exprs += [f"COUNT(DISTINCT {quote(c)})" if c in self.b.columns else "0" for c in KPI_DISTINCT]
+        row = self.b.query(f"SELECT {', '.join(exprs)} FROM {TABLE}{self._where()}", params + self.params)[0]
+        return dict(zip(["linhas", *KPI_CLASSES, *KPI_DISTINCT], (int(v) for v in row)))
+
+    def count_by(self, col: str) -> pd.DataFrame:
+        rows = self.b.query(
+            f"SELECT {self._label(col)} AS v, COUNT(*) AS n FROM {TABLE}{self._where()} GROUP BY v ORDER BY n DESC, v",
+            self.params,
+        )
+        return pd.DataFrame(rows, columns=[col, "Contagem"])
+
+    def count_by_month(self, col: str) -> pd.DataFrame:
+        q = quote(col)
+        rows = self.b.query(
+            f"SELECT {self.b.month(q)} AS m, COUNT(*) AS n FROM {TABLE}{self._where(f'{q} IS NOT NULL')} GROUP BY m ORDER BY m",
+            self.params,
+        )
+        return pd.DataFrame(rows, columns=["Mês", "Contagem"])
+
+    def describe(self, cols, require: str) -> pd.DataFrame:
+        """
+        Estatísticas das colunas numéricas de `cols`, nas linhas com `require` numérico.
+        """
+        def source(c):
+            return NUMERIC_COPIES.get(c, c)
+
+        use = [c for c in cols if source(c) in self.b.numeric]
+        if not use:
+            return pd.DataFrame(columns=DESCRIBE_STATS)
+        exprs = []
+        for c in use:
+            x = quote(source(c))
+            exprs += [f"COUNT({x})", f"AVG({x})", f"stddev_samp({x})", f"MIN({x})",
+                      f"quantile_cont({x}, 0.25)", f"quantile_cont({x}, 0.5)", f"quantile_cont({x}, 0.75)", f"MAX({x})"]
+        cond = f"{quote(source(require))} IS NOT NULL" if source(require) in self.b.columns else "1 = 1"
+        row = self.b.query(f"SELECT {', '.join(exprs)} FROM {TABLE}{self._where(cond)}", self.params)[0]
+        values = np.array([np.nan if v is None else float(v) for v in row]).reshape(len(use), len(DESCRIBE_STATS))
+        return pd.DataFrame(values, index=use, columns=DESCRIBE_STATS)
+
+
+def open_backend(df: pd.DataFrame, dataset_fp: str, engine: str = BACKEND):
+    """
+    Backend do dataset: SQL se pedido (e o banco abrir), senão pandas.
+    O banco é montado na primeira vez para cada versão do dataset.
+    """
+    if engine not in ("duckdb", "sqlite"):
+        return PandasBackend(df)
+    aviso = None
+    if engine == "duckdb" and importlib.util.find_spec("duckdb") is None:
+        engine, aviso = "sqlite", "DuckDB não instalado; usando SQLite"
+    try:
+        path = DB_DIR / f"{TABLE}-{dataset_fp}.{engine}"
+        if not path.exists():
+            _build(path, df, engine)
+            prune()
+        backend = SQLBackend(path, engine, df)
+        backend.aviso = aviso
+        return backend
+    except Exception as e:
+        return PandasBackend(df, aviso=f"banco {engine} indisponível ({e}); usando pandas")
@@ -0,0 +1,137 @@
+"""
+Benchmark do assistente: roda o caminho completo do RAG (índice em disco,
+BM25, montagem do prompt, streaming do Ollama) e mede, por pergunta:
+  - recuperação + prompt (ms)
+  - tempo até o 1º token (TTFT)
+  - tempo total
+com p50/p95 e vazão (perguntas/s) no fim.
+
+Por padrão sobe o Ollama falso (mock_ollama.py) com o perfil pedido, então
+o número mede o painel e não o modelo. Com --host, mede um Ollama de verdade.
+
+Uso (na raiz do projeto):
+    python app/bench_assistente.py                      # 30 perguntas, mock
+    python app/bench_assistente.py --sem chat           # força o fallback /api/generate
+    python app/bench_assistente.py -n 100 -c 4 --tps 50 # 4 perguntas ao mesmo tempo
+    python app/bench_assistente.py --host http://127.0.0.1:11434 --modelo llama3.2:3b
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import mock_ollama
+
+PERGUNTAS = [
+    "onde foram coletados os morcegos de Barbacena?",
+    "fale sobre Sturnira lilium",
+    "quais anfíbios foram coletados em 2019?",
+    "exemplares de Didelphis com peso registrado",
+    "tombo CZ IFSEMG M 072",
+    "aves da família Thraupidae",
+    "serpentes coletadas em Barbacena",
+    "quem coletou os anuros da coleção?",
+]
+
+
+def percentiles(values) -> tuple[float, float]:
+    if not values:
+        return float("nan"), float("nan")
+    return float(np.percentile(values, 50)), float(np.percentile(values, 95))
+
+
+def run_one(assistente, index, question: str, model: str, args) -> dict:
+    t0 = time.perf_counter()
+    cached, make_chunks = assistente.plan_answer(
+        question, model, index, max_context_docs=args.topk, context_tokens=args.contexto,
+    )
+    t_prompt = time.perf_counter()
+    first = None
+    pieces = 0
+    for _ in make_chunks():
+        if first is None:
+            first = time.perf_counter()
+        pieces += 1
+    end = time.perf_counter()
+    return {
+        "prompt": t_prompt - t0,
+        "ttft": (first or end) - t0,
+        "total": end - t0,
+        "pedacos": pieces,
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark do assistente (RAG + Ollama)")
+    ap.add_argument("-n", type=int, default=30, help="número de perguntas")
+    ap.add_argument("-c", "--concorrencia", type=int, default=1, help="perguntas ao mesmo tempo")
+    ap.add_argument("--host", default=None, help="Ollama de verdade (sem isso, usa o mock)")
+    ap.add_argument("--modelo", default=None)
+    ap.add_argument("--topk", type=int, default=8)
+    ap.add_argument("--contexto", type=int, default=None, help="orçamento de tokens do contexto")
+    ap.add_argument("--aquecimento", type=int, default=2, help="perguntas descartadas no início")
+    mock_ollama.add_profile_args(ap)
+    args = ap.parse_args(argv)
+
+    server = None
+    if args.host:
+        host = args.host
+    else:
+        profile = mock_ollama.profile_from_args(args)
+        server, host = mock_ollama.start(profile)
+        print(f"Ollama falso em {host}: latência {profile.latency}s, prefill {profile.prefill_tps} tok/s, "
+              f"{profile.tps} tok/s, {profile.tokens} tokens" + (f", sem {sorted(profile.missing)}" if profile.missing else ""))
+    # o cliente lê o host do ambiente ao ser importado
+    os.environ["OLLAMA_HOST"] = host
+
+    import assistente
+    import contexto
+    import ollama_client
+    import rag_store
+    from cache_painel import BASE_DIR
+    from dados import ARQUIVOS, KML_PATH
+
+    args.contexto = args.contexto or contexto.CONTEXT_TOKENS
+    model = args.modelo or ollama_client.DEFAULT_OLLAMA_MODEL
+
+    t0 = time.perf_counter()
+    index = rag_store.load_or_build([str(BASE_DIR / p) for p in ARQUIVOS], str(BASE_DIR / KML_PATH))
+    print(f"Índice: {index['N']} trechos, aberto em {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+    questions = [PERGUNTAS[i % len(PERGUNTAS)] for i in range(args.aquecimento + args.n)]
+    for q in questions[:args.aquecimento]:
+        run_one(assistente, index, q, model, args)
+
+    lock = threading.Lock()
+    results = []
+
+    def task(q):
+        r = run_one(assistente, index, q, model, args)
+        with lock:
+            results.append(r)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.concorrencia)) as pool:
+        list(pool.map(task, questions[args.aquecimento:]))
+    wall = time.perf_counter() - t0
+
+    print(f"\n{len(results)} perguntas, concorrência {args.concorrencia}, modelo {model}, "
+          f"endpoint {'/api/chat' if ollama_client.capabilities(host).get('chat', True) else '/api/generate'}")
+    print(f"{'':22}{'p50':>10}{'p95':>10}")
+    for key, label, scale, unit in [("prompt", "recuperação + prompt", 1000, "ms"),
+                                    ("ttft", "1º token (TTFT)", 1, "s"),
+                                    ("total", "resposta completa", 1, "s")]:
+        p50, p95 = percentiles([r[key] * scale for r in results])
+        print(f"{label:22}{p50:>8.2f}{unit:>2}{p95:>8.2f}{unit:>2}")
+    print(f"vazão: {len(results) / wall:.2f} perguntas/s ({wall:.1f} s no total)")
+
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
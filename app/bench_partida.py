@@ -0,0 +1,126 @@
+"""
+Benchmark da partida a frio do painel: roda a página uma vez (AppTest do
+Streamlit) num processo novo com `python -X importtime` e mostra
+  - tempo da primeira execução da página
+  - tabela dos pacotes importados por ela (ms acumulados, do mais caro)
+O que o próprio Streamlit importa ao subir não entra na conta.
+
+Serve de guarda contra regressão: com --orcamento (ms de import da página)
+e --proibido (pacote que não pode aparecer), termina com código 1 se
+estourar, então dá para rodar depois de mexer nos imports.
+
+Uso (na raiz do projeto; rode antes `python app/prewarm.py` para medir só a página):
+    python app/bench_partida.py
+    python app/bench_partida.py --app app/dashboard_llm.py --top 25
+    python app/bench_partida.py --orcamento 400 --proibido openai
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from cache_painel import BASE_DIR
+
+APPS = ["app/dashboard.py", "app/dashboard_llm.py"]
+IMPORT_BUDGET_MS = float(os.environ.get("PAINEL_IMPORT_BUDGET_MS", "1200"))
+# importados à toa custavam ~1 s na partida (ver histórico do dashboard.py)
+FORBIDDEN = ["openai"]
+
+_MARK = "-- painel: inicio da pagina --"
+
+# roda no processo filho: Streamlit e AppTest primeiro, a página depois da marca
+_CHILD = f"""
+import sys, time, json
+from streamlit.testing.v1 import AppTest
+sys.stderr.write({_MARK!r} + "\\n"); sys.stderr.flush()
+t0 = time.perf_counter()
+at = AppTest.from_file(sys.argv[1], default_timeout=300).run()
+print(json.dumps({{"run": time.perf_counter() - t0, "erros": [str(e.value)[:300] for e in at.exception]}}))
+"""
+
+
+def parse_importtime(lines) -> list[tuple[str, int, int]]:
+    """
+    Linhas do -X importtime -> [(módulo, nível, acumulado em µs)].
+    """
+    rows = []
+    for line in lines:
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue  # cabeçalho
+        name = parts[2].rstrip()
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), level, int(parts[1])))
+    return rows
+
+
+def by_package(rows) -> list[tuple[str, float]]:
+    """
+    Tempo acumulado (ms) por pacote de topo, só dos imports feitos pela página.
+    """
+    top = min((lvl for _, lvl, _ in rows), default=0)
+    totals: dict[str, float] = {}
+    for name, lvl, cumulative in rows:
+        if lvl == top:
+            pkg = name.split(".")[0]
+            totals[pkg] = totals.get(pkg, 0.0) + cumulative / 1000
+    return sorted(totals.items(), key=lambda kv: kv[1], reverse=True)
+
+
+def measure(app: str) -> dict:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHILD, str(BASE_DIR / app)],
+        capture_output=True, text=True, cwd=str(BASE_DIR),
+        env={**os.environ, "PYTHONPATH": str(BASE_DIR / "app")},
+    )
+    if proc.returncode != 0 or not proc.stdout.strip():
+        raise RuntimeError(f"{app} falhou:\n{proc.stderr[-2000:]}")
+    stderr = proc.stderr.splitlines()
+    start = stderr.index(_MARK) + 1 if _MARK in stderr else 0
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    rows = parse_importtime(stderr[start:])
+    result["pacotes"] = by_package(rows)
+    result["todos"] = sorted({name.split(".")[0] for name, _, _ in rows})
+    result["imports"] = sum(ms for _, ms in result["pacotes"])
+    return result
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark da partida a frio (tempo de import da página)")
+    ap.add_argument("--app", action="append", default=None, help="página a medir (padrão: as duas); pode repetir")
+    ap.add_argument("--top", type=int, default=15, help="linhas da tabela")
+    ap.add_argument("--orcamento", type=float, default=IMPORT_BUDGET_MS, help="máximo de ms em imports da página")
+    ap.add_argument("--proibido", action="append", default=None, metavar="PACOTE",
+                    help=f"pacote que a página não pode importar (padrão: {', '.join(FORBIDDEN)})")
+    args = ap.parse_args(argv)
+    forbidden = args.proibido if args.proibido is not None else FORBIDDEN
+
+    falhas = []
+    for app in args.app or APPS:
+        r = measure(app)
+        print(f"\n{Path(app).name}: página em {r['run']:.2f} s, {r['imports']:.0f} ms em imports")
+        for e in r["erros"]:
+            print(f"  exceção na página: {e}")
+        print(f"  {'pacote':30}{'ms':>9}{'%':>7}")
+        for pkg, ms in r["pacotes"][:args.top]:
+            print(f"  {pkg:30}{ms:>9.1f}{100 * ms / (r['imports'] or 1):>6.0f}%")
+
+        if r["imports"] > args.orcamento:
+            falhas.append(f"{app}: {r['imports']:.0f} ms em imports (orçamento {args.orcamento:.0f} ms)")
+        falhas += [f"{app}: importa {pkg}" for pkg in forbidden if pkg in r["todos"]]
+        if r["erros"]:
+            falhas.append(f"{app}: exceção na página")
+
+    if falhas:
+        print("\nFALHOU:\n  " + "\n  ".join(falhas))
+        return 1
+    print("\nok")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""
+Índice invertido BM25 do assistente.
+
+O índice é montado uma vez (listas de postings em formato CSR, IDF e
+normas de tamanho de documento pré-calculados em arrays NumPy). A consulta
+só toca os postings dos termos da pergunta, então o custo não cresce com
+o tamanho total do corpus.
+
+Os termos passam pelo analisador de português (ver analisador.py). Termos
+da pergunta que não existem no vocabulário são trocados pelo mais parecido
+(trigramas, montados junto com o índice).
+"""
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from analisador import TrigramIndex, analyze
+
+K1 = 1.5
+B = 0.75
+
+# sobe quando a tokenização/formato muda (invalida os índices salvos em disco)
+INDEX_VERSION = 2
+
+
+def tokenize(text: str) -> list[str]:
+    return analyze(text)
+
+
+def _doc_norms(doc_len: np.ndarray, avgdl: float, k1: float, b: float) -> np.ndarray:
+    # parte do denominador do BM25 que só depende do documento
+    return (k1 * (1 - b + b * (doc_len / (avgdl or 1.0)))).astype(np.float32)
+
+
+def doc_postings(docs: list[str]) -> dict:
+    """
+    Tokeniza os documentos uma vez e devolve os postings "soltos" (sem CSR):
+      - 'terms'     vocabulário local (lista, id = posição)
+      - 'term_ids'  / 'doc_ids' / 'tf'   um item por (termo, documento)
+      - 'doc_len'   tamanho (em tokens) de cada documento
+    É o formato guardado por partição no índice em disco (ver rag_store.py).
+    """
+    vocab: dict[str, int] = {}
+    term_ids = []
+    doc_ids = []
+    tfs = []
+    doc_len = np.zeros(len(docs), dtype=np.float32)
+
+    for i, d in enumerate(docs):
+        toks = tokenize(d)
+        doc_len[i] = len(toks)
+        for term, f in Counter(toks).items():
+            tid = vocab.setdefault(term, len(vocab))
+            term_ids.append(tid)
+            doc_ids.append(i)
+            tfs.append(f)
+
+    return {
+        "terms": list(vocab),
+        "term_ids": np.asarray(term_ids, dtype=np.int64),
+        "doc_ids": np.asarray(doc_ids, dtype=np.int32),
+        "tf": np.asarray(tfs, dtype=np.float32),
+        "doc_len": doc_len,
+    }
+
+
+def merge_postings(parts: list[dict]) -> dict:
+    """
+    Junta postings de várias partições (doc_ids viram globais, na ordem das partes)
+    num único vocabulário.
+    """
+    if not parts:
+        return doc_postings([])
+    all_terms = [t for p in parts for t in p["terms"]]
+    codes, terms = pd.factorize(pd.Series(all_terms, dtype=object))
+    term_ids, doc_ids, tfs, lens = [], [], [], []
+    term_off = 0
+    doc_off = 0
+    for p in parts:
+        local_to_global = codes[term_off:term_off + len(p["terms"])]
+        term_ids.append(local_to_global[p["term_ids"]] if len(p["term_ids"]) else p["term_ids"])
+        doc_ids.append(p["doc_ids"].astype(np.int64) + doc_off)
+        tfs.append(p["tf"])
+        lens.append(p["doc_len"])
+        term_off += len(p["terms"])
+        doc_off += len(p["doc_len"])
+    return {
+        "terms": list(terms),
+        "term_ids": np.concatenate(term_ids).astype(np.int64),
+        "doc_ids": np.concatenate(doc_ids).astype(np.int32),
+        "tf": np.concatenate(tfs).astype(np.float32),
+        "doc_len": np.concatenate(lens).astype(np.float32),
+    }
+
+
+def index_from_postings(postings: dict, docs, k1: float = K1, b: float = B) -> dict:
+    """
+    Monta o índice invertido a partir dos postings:
+      - 'vocab'        termo -> id
+      - 'indptr'       início dos postings de cada termo (CSR, tamanho V+1)
+      - 'post_doc'     id do documento de cada posting (int32)
+      - 'post_tf'      frequência do termo no documento (float32)
+      - 'idf'          IDF de cada termo (float32)
+      - 'doc_len'      tamanho (em tokens) de cada documento
+      - 'doc_norm'     k1 * (1 - b + b * dl/avgdl), pré-calculado
+      - 'fuzzy'        trigramas do vocabulário (correção de digitação)
+    """
+    terms = postings["terms"]
+    term_ids = postings["term_ids"]
+    doc_len = postings["doc_len"]
+
+    order = np.argsort(term_ids, kind="stable")  # mantém doc_id crescente em cada termo
+    post_doc = postings["doc_ids"][order]
+    post_tf = postings["tf"][order]
+    df = np.bincount(term_ids, minlength=len(terms))
+    indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(df, out=indptr[1:])
+
+    N = len(doc_len)
+    idf = np.log(1 + (N - df + 0.5) / (df + 0.5)).astype(np.float32)
+    avgdl = float(doc_len.mean()) if N else 0.0
+
+    return {
+        "docs": docs,
+        "vocab": {t: i for i, t in enumerate(terms)},
+        "indptr": indptr,
+        "post_doc": post_doc,
+        "post_tf": post_tf,
+        "idf": idf,
+        "doc_len": doc_len,
+        "avgdl": avgdl,
+        "k1": k1,
+        "b": b,
+        "doc_norm": _doc_norms(doc_len, avgdl, k1, b),
+        "N": N,
+        "fuzzy": TrigramIndex.build(terms),
+    }
+
+
+def build_index(docs: list[str], k1: float = K1, b: float = B) -> dict:
+    """
+    Índice invertido em memória para uma lista de documentos.
+    """
+    return index_from_postings(doc_postings(docs), docs, k1=k1, b=b)
+
+
+def search(index: dict, query: str, top_k: int = 4, k1: float = K1, b: float = B) -> list[tuple[float, str]]:
+    """
+    Retorna [(score, doc), ...] em ordem decrescente de score (só score > 0).
+    """
+    ids = search_ids(index, query, top_k=top_k, k1=k1, b=b)
+    docs = index["docs"]
+    return [(s, docs[i]) for s, i in ids]
+
+
+def query_term_ids(index: dict, query: str) -> list[int]:
+    """
+    Ids dos termos da consulta; termo fora do vocabulário vira o mais parecido.
+    """
+    vocab = index["vocab"]
+    fuzzy = index.get("fuzzy")
+    ids = []
+    for t in dict.fromkeys(tokenize(query)):
+        if t in vocab:
+            ids.append(vocab[t])
+        elif fuzzy is not None:
+            ids.extend(i for _, i in fuzzy.lookup(t))
+    return list(dict.fromkeys(ids))
+
+
+def search_ids(index: dict, query: str, top_k: int = 4, k1: float = K1, b: float = B) -> list[tuple[float, int]]:
+    """
+    Igual a `search`, mas retorna [(score, doc_id), ...].
+    """
+    N = index["N"]
+    term_ids = query_term_ids(index, query)
+    if not term_ids or N == 0:
+        return []
+
+    if k1 == index["k1"] and b == index["b"]:
+        doc_norm = index["doc_norm"]
+    else:
+        doc_norm = _doc_norms(index["doc_len"], index["avgdl"], k1, b)
+
+    indptr = index["indptr"]
+    post_doc = index["post_doc"]
+    post_tf = index["post_tf"]
+    idf = index["idf"]
+
+    scores = np.zeros(N, dtype=np.float32)
+    for tid in term_ids:
+        lo, hi = indptr[tid], indptr[tid + 1]
+        d = post_doc[lo:hi]
+        f = post_tf[lo:hi]
+        # cada doc aparece 1 vez por termo, então a soma indexada é segura
+        scores[d] += idf[tid] * (f * (k1 + 1) / (f + doc_norm[d]))
+
+    # só docs tocados pelos postings têm score > 0
+    cand = np.flatnonzero(scores)
+    if cand.size == 0:
+        return []
+    if cand.size > top_k:
+        # top-k parcial (O(n)) e só depois ordena os k vencedores
+        part = np.argpartition(-scores[cand], top_k - 1)[:top_k]
+        cand = cand[part]
+    best = cand[np.argsort(-scores[cand], kind="stable")]
+    return [(float(scores[i]), int(i)) for i in best]
+
@@ -0,0 +1,45 @@
+"""
+Pasta de caches persistentes do painel e impressão digital (fingerprint) do dataset.
+
+A fingerprint é barata (só os.stat dos arquivos: nome, tamanho e mtime),
+então pode ser recalculada a cada rerun e usada como chave de cache:
+se nenhuma planilha nem o KML mudou, ela é a mesma.
+"""
+import hashlib
+import os
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+CACHE_DIR = Path(os.environ.get("PAINEL_CACHE_DIR", BASE_DIR / ".cache_painel"))
+
+
+def file_fingerprint(path) -> str:
+    """
+    Fingerprint de um arquivo (nome + tamanho + mtime). Arquivo ausente também conta.
+    """
+    p = Path(path)
+    try:
+        st = p.stat()
+        sig = f"{p.name}|{st.st_size}|{st.st_mtime_ns}"
+    except OSError:
+        sig = f"{p.name}|ausente"
+    return hashlib.sha1(sig.encode("utf-8")).hexdigest()[:16]
+
+
+def dataset_fingerprint(arquivos, kml_path=None) -> str:
+    """
+    Fingerprint do conjunto de planilhas + KML.
+    """
+    h = hashlib.sha1()
+    for caminho in list(arquivos) + ([kml_path] if kml_path else []):
+        h.update(file_fingerprint(caminho).encode("ascii"))
+    return h.hexdigest()[:16]
+
+
+def cache_path(*parts) -> Path:
+    """
+    Caminho dentro da pasta de cache (cria as pastas intermediárias).
+    """
+    p = CACHE_DIR.joinpath(*[str(x) for x in parts])
+    p.parent.mkdir(parents=True, exist_ok=True)
+    return p
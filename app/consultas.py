@@ -0,0 +1,384 @@
+"""
+Respostas exatas para perguntas de contagem/agrupamento, sem LLM.
+
+Perguntas como "quantos por município?", "quantas espécies de Chiroptera?",
+"quais famílias entre 2015 e 2019?" ou "onde foi coletado o tombo M 12?"
+não dá pra responder com meia dúzia de trechos do BM25. Aqui elas são
+reconhecidas por padrões simples e calculadas direto no DataFrame (ms).
+O que não for reconhecido volta None e segue para o assistente (RAG/LLM).
+
+Tipos de consulta:
+  - tombo        ficha de um exemplar pelo número de tombo (o atributo
+                 perguntado, ex.: "quanto pesa", vai no texto)
+  - agrupamento  contagem por coluna ("por município", "qual classe tem mais")
+  - distintos    valores distintos ("quantas espécies", "quais famílias")
+  - contagem     total de exemplares ("quantos morcegos em Barbacena")
+
+Filtros reconhecidos em qualquer tipo: valores conhecidos de
+Classe/Ordem/Familia/espécie/nome comum/município citados na pergunta e
+intervalo de anos da "Data entrada" ("em 2019", "entre 2015 e 2019",
+"desde 2018", "antes de 2010").
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+from analisador import fold
+from mapa import KML_COL
+from tombo import canonicalize_series
+
+DATE_COL = "Data entrada"
+TOMBO_COLS = ["N tombo coleção", "Unnamed: 0"]
+YEAR_COL = "Ano"
+
+# palavras da pergunta -> coluna do DF
+COLUMN_ALIASES = {
+    "Municipio": ["municipio", "municipios", "cidade", "cidades"],
+    "Classe": ["classe", "classes"],
+    "Ordem": ["ordem", "ordens"],
+    "Familia": ["familia", "familias"],
+    "Nome cientifico": ["especie", "especies", "nome cientifico", "nomes cientificos"],
+    "Nome comum": ["nome comum", "nomes comuns", "nome popular", "nomes populares"],
+    "Localidade": ["localidade", "localidades", "local", "locais"],
+    "Coletor": ["coletor", "coletores", "coletora", "coletoras"],
+    "Peça": ["peca", "pecas", "tipo de peca", "tipos de peca"],
+    "Sexo": ["sexo"],
+    "Idade": ["idade", "idades"],
+    YEAR_COL: ["ano", "anos"],
+}
+
+# colunas cujos valores citados na pergunta viram filtro (na ordem de prioridade)
+VALUE_COLUMNS = ["Classe", "Ordem", "Familia", "Nome cientifico", "Nome comum", "Municipio"]
+
+# valores curtos demais geram falso positivo ("rã", "?")
+MIN_VALUE_LEN = 4
+
+# campos mostrados na ficha de um tombo (na ordem)
+TOMBO_FIELDS = [
+    "Nome cientifico", "Nome comum", "Classe", "Ordem", "Familia",
+    "Localidade", "Municipio", DATE_COL, "Coletor", "Peça", "Sexo", "Idade",
+    "Pote", "Danificada", "Observação",
+]
+# medidas também entram na ficha (só as preenchidas): "Peso (g)" e as "Cp ... (mm)"
+WEIGHT_COL = "Peso (g)"
+
+# palavras da pergunta sobre um atributo do exemplar -> colunas citadas no texto da ficha
+# ("quanto pesa o tombo M 12?" responde o peso, não só a identificação)
+ATTRIBUTE_ALIASES = {
+    "peso": [WEIGHT_COL], "pesa": [WEIGHT_COL], "pesava": [WEIGHT_COL],
+    "sexo": ["Sexo"], "idade": ["Idade"], "coletor": ["Coletor"], "coletou": ["Coletor"],
+    "pote": ["Pote"], "observacao": ["Observação"], "observacoes": ["Observação"],
+}
+MEASURE_WORDS = ["medida", "medidas", "medicoes", "tamanho", "comprimento", "mede", "media"]
+
+_YEAR = r"((?:19|20)\d{2})"
+
+
+_ALIAS_TO_COL = {a: col for col, names in COLUMN_ALIASES.items() for a in names}
+# alternativas de nomes de coluna pros regex (mais longas primeiro)
+_ALIAS_GROUP = "|".join(re.escape(a) for a in sorted(_ALIAS_TO_COL, key=len, reverse=True))
+
+
+def prepare(df: pd.DataFrame) -> dict:
+    """
+    Estruturas auxiliares, montadas uma vez por dataset:
+      - 'df'        o DF (sem cópia)
+      - 'years'     ano da "Data entrada" por linha (float, NaN se vazio)
+      - 'tombos'    chave canônica do tombo -> posições das linhas
+      - 'values'    regex com os valores conhecidos + valor dobrado -> (coluna, valor)
+    """
+    n = len(df)
+    if DATE_COL in df.columns:
+        years = pd.to_datetime(df[DATE_COL], errors="coerce").dt.year.to_numpy(dtype="float64")
+    else:
+        years = np.full(n, np.nan)
+
+    tombo_col = None
+    for c in TOMBO_COLS:
+        if c in df.columns:
+            tombo_col = df[c] if tombo_col is None else tombo_col.combine_first(df[c])
+    tombos = {}
+    if tombo_col is not None:
+        keys = canonicalize_series(tombo_col)
+        codes = keys.cat.codes.to_numpy()
+        cats = keys.cat.categories
+        for code, pos in pd.Series(np.arange(n)).groupby(codes).indices.items():
+            if code >= 0:
+                tombos[cats[code]] = pos
+
+    # valor dobrado -> (coluna, valor); se o mesmo texto aparece em mais de uma
+    # coluna ("morcego" em Classe e em Nome comum), fica a que tem mais exemplares
+    value_map = {}
+    best = {}
+    for col in VALUE_COLUMNS:
+        if col not in df.columns:
+            continue
+        for v, cnt in df[col].dropna().astype(str).str.strip().value_counts().items():
+            f = fold(v)
+            if len(f) < MIN_VALUE_LEN or not re.search(r"[a-z]", f) or f in _ALIAS_TO_COL:
+                continue
+            if cnt > best.get(f, 0):
+                value_map[f] = (col, v)
+                best[f] = cnt
+    if value_map:
+        alts = sorted(value_map, key=len, reverse=True)
+        # aceita plural simples: "morcego" casa com "morcegos"
+        values_re = re.compile(r"\b(" + "|".join(re.escape(a) for a in alts) + r")(?:s|es)?\b")
+    else:
+        values_re = None
+
+    return {"df": df, "years": years, "tombos": tombos, "values_re": values_re, "value_map": value_map}
+
+
+# -----------------------------------------
+# FILTROS
+# -----------------------------------------
+def parse_year_range(q: str) -> tuple[int | None, int | None] | None:
+    """
+    Intervalo de anos citado na pergunta (já dobrada), ou None.
+    """
+    m = re.search(rf"\bentre {_YEAR} e {_YEAR}\b", q) or re.search(rf"\bde {_YEAR} (?:a|ate) {_YEAR}\b", q)
+    if m:
+        a, b = sorted([int(m.group(1)), int(m.group(2))])
+        return a, b
+    m = re.search(rf"\b(desde|a partir de|depois de|apos) {_YEAR}\b", q)
+    if m:
+        y = int(m.group(2))
+        return (y + 1 if m.group(1) in ("depois de", "apos") else y), None
+    m = re.search(rf"\b(antes de|ate) {_YEAR}\b", q)
+    if m:
+        y = int(m.group(2))
+        return None, (y - 1 if m.group(1) == "antes de" else y)
+    m = re.search(rf"\b(?:em|no ano de|do ano de|de) {_YEAR}\b", q)
+    if m:
+        y = int(m.group(1))
+        return y, y
+    return None
+
+
+def parse_filters(q: str, prep: dict, skip_cols=()) -> tuple[list[tuple[str, str]], tuple | None]:
+    """
+    Filtros de valor [(coluna, valor)] e intervalo de anos citados na pergunta.
+    """
+    filters = []
+    if prep["values_re"] is not None:
+        for m in prep["values_re"].finditer(q):
+            col, value = prep["value_map"][m.group(1)]
+            if col not in skip_cols and (col, value) not in filters:
+                filters.append((col, value))
+    return filters, parse_year_range(q)
+
+
+def apply_filters(prep: dict, filters, years) -> np.ndarray:
+    df = prep["df"]
+    mask = np.ones(len(df), dtype=bool)
+    # valores da mesma coluna somam (OU); colunas diferentes restringem (E)
+    by_col: dict[str, list[str]] = {}
+    for col, value in filters:
+        by_col.setdefault(col, []).append(value)
+    for col, values in by_col.items():
+        mask &= df[col].astype("string").str.strip().isin(values).fillna(False).to_numpy(dtype=bool)
+    if years is not None:
+        lo, hi = years
+        y = prep["years"]
+        if lo is not None:
+            mask &= y >= lo
+        if hi is not None:
+            mask &= y <= hi
+    return mask
+
+
+def describe_filters(filters, years) -> str:
+    parts = [f"{col} = {value}" for col, value in filters]
+    if years is not None:
+        lo, hi = years
+        if lo is not None and hi is not None:
+            parts.append(f"{DATE_COL} em {lo}" if lo == hi else f"{DATE_COL} entre {lo} e {hi}")
+        elif lo is not None:
+            parts.append(f"{DATE_COL} a partir de {lo}")
+        else:
+            parts.append(f"{DATE_COL} até {hi}")
+    return "; ".join(parts)
+
+
+def _column_values(prep: dict, col: str, mask: np.ndarray) -> pd.Series:
+    if col == YEAR_COL:
+        y = pd.Series(prep["years"][mask])
+        return y.dropna().astype(int).astype(str)
+    s = prep["df"].loc[mask, col]
+    return s.dropna().astype(str).str.strip().replace("", pd.NA).dropna()
+
+
+def _has_column(prep: dict, col: str) -> bool:
+    return col == YEAR_COL or col in prep["df"].columns
+
+
+# -----------------------------------------
+# TIPOS DE CONSULTA
+# -----------------------------------------
+def _find_tombos(q: str, prep: dict) -> list[str]:
+    keys = prep["tombos"]
+    if not keys:
+        return []
+    found = []
+    # "CZ IFSEMG M 012", "An 5", "av-12"
+    for m in re.finditer(r"\b(?:cz\s+)?(?:ifsemg\s+)?([a-z]{1,3})\s*[-_.]?\s*0*(\d{1,5})\b", q):
+        key = f"{m.group(1).upper()} {int(m.group(2))}"
+        if key in keys and key not in found:
+            found.append(key)
+    # "tombo 123", "tombo nº 45"
+    for m in re.finditer(r"\btombo\s+(?:n[o.º]?\s*)?0*(\d{1,5})\b", q):
+        key = str(int(m.group(1)))
+        if key in keys and key not in found:
+            found.append(key)
+    return found
+
+
+def _measure_cols(df: pd.DataFrame) -> list[str]:
+    return [c for c in df.columns if c == WEIGHT_COL or c.endswith("(mm)")]
+
+
+def _asked_cols(q: str, df: pd.DataFrame) -> tuple[list[str], bool]:
+    """
+    O que a pergunta (já dobrada) pede do exemplar: (colunas citadas, pediu as medidas?).
+    """
+    asked = []
+    for word, cols in ATTRIBUTE_ALIASES.items():
+        if re.search(rf"\b{word}\b", q):
+            asked += cols
+    medidas = any(re.search(rf"\b{w}\b", q) for w in MEASURE_WORDS)
+    return [c for c in dict.fromkeys(asked) if c in df.columns], medidas
+
+
+def _tombo_answer(prep: dict, keys: list[str], asked: list[str] | None = None, medidas: bool = False) -> dict:
+    df = prep["df"]
+    fields = TOMBO_FIELDS + _measure_cols(df)
+    linhas = []
+    fichas = []
+    for key in keys:
+        for pos in prep["tombos"][key]:
+            row = df.iloc[int(pos)]
+            tombo = next((row[c] for c in TOMBO_COLS if c in df.columns and pd.notna(row[c])), key)
+            campos = {"Tombo": str(tombo)}
+            for c in fields:
+                if c in df.columns and pd.notna(row[c]) and str(row[c]).strip():
+                    v = row[c]
+                    if c == DATE_COL:
+                        v = pd.to_datetime(v, errors="coerce")
+                        v = row[c] if pd.isna(v) else v
+                    if isinstance(v, float) and v.is_integer():
+                        v = int(v)
+                    campos[c] = v.strftime("%d/%m/%Y") if isinstance(v, pd.Timestamp) else str(v).strip()
+            if "lat" in df.columns and "lon" in df.columns:
+                lat, lon = float(row["lat"]), float(row["lon"])
+                do_kml = bool(row[KML_COL]) if KML_COL in df.columns else True
+                campos["Coordenadas"] = f"{lat:.5f}, {lon:.5f}" if do_kml else "sem ponto no KML"
+            linhas.append(campos)
+
+            nome = campos.get("Nome cientifico") or campos.get("Nome comum") or "(sem identificação)"
+            onde = ", ".join(x for x in [campos.get("Localidade"), campos.get("Municipio")] if x)
+            texto = f"**{campos['Tombo']}**: {nome}"
+            if onde:
+                texto += f", coletado em {onde}"
+            if DATE_COL in campos:
+                texto += f" ({campos[DATE_COL]})"
+            if "Coordenadas" in campos:
+                texto += f". Coordenadas: {campos['Coordenadas']}"
+            for c in asked or []:
+                texto += f". {c}: {campos[c]}" if c in campos else f". {c}: não registrado"
+            if medidas:
+                feitas = [f"{c}: {campos[c]}" for c in _measure_cols(df) if c in campos and c not in (asked or [])]
+                texto += (". " + "; ".join(feitas)) if feitas else ". Nenhuma medida registrada"
+            fichas.append(texto + ".")
+
+    tabela = pd.DataFrame(linhas)
+    return {"tipo": "tombo", "texto": "\n\n".join(fichas), "tabela": tabela}
+
+
+def _group_answer(prep: dict, col: str, filters, years, top_only: bool = False) -> dict:
+    mask = apply_filters(prep, filters, years)
+    vals = _column_values(prep, col, mask)
+    counts = vals.value_counts()
+    if col == YEAR_COL:
+        counts = counts.sort_index()
+    tabela = counts.rename_axis(col).reset_index(name="Exemplares")
+    filtro = describe_filters(filters, years)
+    sufixo = f" ({filtro})" if filtro else ""
+
+    if tabela.empty:
+        texto = f"Nenhum exemplar com {col} preenchido{sufixo}."
+    elif top_only:
+        top = counts.sort_values(ascending=False)
+        texto = f"**{top.index[0]}** é o {col.lower()} com mais exemplares: **{int(top.iloc[0])}**{sufixo}."
+    else:
+        texto = f"Exemplares por {col}{sufixo}: {len(tabela)} valores, {int(counts.sum())} exemplares."
+    return {"tipo": "agrupamento", "texto": texto, "tabela": tabela}
+
+
+def _distinct_answer(prep: dict, col: str, filters, years) -> dict:
+    mask = apply_filters(prep, filters, years)
+    counts = _column_values(prep, col, mask).value_counts()
+    tabela = counts.rename_axis(col).reset_index(name="Exemplares").sort_values(col, ignore_index=True)
+    filtro = describe_filters(filters, years)
+    sufixo = f" ({filtro})" if filtro else ""
+    texto = f"**{len(tabela)}** valores distintos de {col}{sufixo}."
+    return {"tipo": "distintos", "texto": texto, "tabela": tabela}
+
+
+def _count_answer(prep: dict, filters, years) -> dict:
+    n = int(apply_filters(prep, filters, years).sum())
+    filtro = describe_filters(filters, years)
+    texto = f"**{n}** exemplares" + (f" ({filtro})." if filtro else " na coleção.")
+    return {"tipo": "contagem", "texto": texto, "tabela": None}
+
+
+def answer(question: str, prep: dict) -> dict | None:
+    """
+    Resposta exata para a pergunta, ou None se não for uma consulta reconhecida.
+    Retorna {'tipo', 'texto' (markdown), 'tabela' (DF ou None)}.
+    """
+    q = fold(question)
+    if not q or prep is None or prep["df"].empty:
+        return None
+
+    # 1) tombo citado -> ficha do exemplar (com o atributo perguntado, se houver)
+    keys = _find_tombos(q, prep)
+    if keys:
+        asked, medidas = _asked_cols(q, prep["df"])
+        return _tombo_answer(prep, keys, asked, medidas)
+
+    # 2) "qual município tem mais exemplares"
+    m = re.search(rf"\bqu(?:al|ais) (?:o |a |os |as )?({_ALIAS_GROUP}) (?:tem|tiveram|teve|possui|com) mais\b", q)
+    if m and _has_column(prep, _ALIAS_TO_COL[m.group(1)]):
+        col = _ALIAS_TO_COL[m.group(1)]
+        filters, years = parse_filters(q, prep, skip_cols=(col,))
+        return _group_answer(prep, col, filters, years, top_only=True)
+
+    # 3) "quantos por município", "exemplares por classe", "distribuição por ano"
+    m = re.search(rf"\b(?:por|em cada|cada) ({_ALIAS_GROUP})\b", q)
+    if m and _has_column(prep, _ALIAS_TO_COL[m.group(1)]):
+        col = _ALIAS_TO_COL[m.group(1)]
+        filters, years = parse_filters(q, prep, skip_cols=(col,))
+        return _group_answer(prep, col, filters, years)
+
+    # 4) "quantas espécies", "quais famílias", "liste os municípios"
+    m = (
+        re.search(rf"\bquant[oa]s (?:\w+ )?({_ALIAS_GROUP})\b", q)
+        or re.search(rf"\bqu(?:ais|e) (?:sao )?(?:as |os )?({_ALIAS_GROUP})\b", q)
+        or re.search(rf"\blist(?:e|ar|a)(?: de| das| dos| as| os)? ({_ALIAS_GROUP})\b", q)
+    )
+    # ("quantos anos tem a coleção" não é pergunta de anos distintos)
+    if m and _ALIAS_TO_COL[m.group(1)] != YEAR_COL and _has_column(prep, _ALIAS_TO_COL[m.group(1)]):
+        col = _ALIAS_TO_COL[m.group(1)]
+        filters, years = parse_filters(q, prep, skip_cols=(col,))
+        return _distinct_answer(prep, col, filters, years)
+
+    # 5) "quantos exemplares", "quantos morcegos em Barbacena", "total de registros em 2019"
+    if re.search(r"\b(?:quant[oa]s|total de|numero de|quantidade de)\b", q):
+        filters, years = parse_filters(q, prep)
+        generic = re.search(r"\b(?:exemplares?|registros?|individuos?|animais|especimes?|tombos?|itens|pecas?)\b", q)
+        if filters or years is not None or generic:
+            return _count_answer(prep, filters, years)
+
+    return None
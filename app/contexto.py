@@ -0,0 +1,112 @@
+"""
+Montagem do prompt do assistente com orçamento de tokens.
+
+- Os trechos recuperados entram em ordem de score até encher o orçamento
+  (`CONTEXT_TOKENS`); cada trecho tem um teto próprio (`DOC_TOKENS`), para
+  um registro enorme não ocupar o espaço de todos.
+- As colunas do dataset vão no prompt de sistema (e não na pergunta, que
+  também é a consulta da busca).
+- As conversas anteriores entram como um resumo curto: as perguntas e o
+  começo de cada resposta, das mais recentes para as mais antigas, até o
+  limite `HISTORY_TOKENS`. Turnos antigos vão saindo do resumo.
+
+Não há tokenizador do modelo aqui (o Ollama não expõe um); `count_tokens`
+é uma estimativa conservadora (palavras longas contam como vários tokens,
+pontuação conta 1), boa o bastante para limitar o tamanho do prompt.
+"""
+import math
+import os
+import re
+
+CONTEXT_TOKENS = int(os.environ.get("PAINEL_CONTEXT_TOKENS", "1500"))
+HISTORY_TOKENS = int(os.environ.get("PAINEL_HISTORY_TOKENS", "300"))
+DOC_TOKENS = 200
+# abaixo disso não vale a pena incluir um trecho cortado
+MIN_DOC_TOKENS = 24
+# tokens por turno no resumo da conversa
+QUESTION_TOKENS = 40
+ANSWER_TOKENS = 60
+MAX_COLUMNS = 50
+
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def _piece_tokens(piece: str) -> int:
+    return max(1, math.ceil(len(piece) / 4))
+
+
+def count_tokens(text: str) -> int:
+    return sum(_piece_tokens(p) for p in _PIECE_RE.findall(text or ""))
+
+
+def truncate_tokens(text: str, budget: int, suffix: str = "...") -> str:
+    """
+    Corta `text` para caber em `budget` tokens (estimados), sem partir palavras.
+    """
+    text = (text or "").strip()
+    if count_tokens(text) <= budget:
+        return text
+    budget -= count_tokens(suffix)
+    used = 0
+    for m in _PIECE_RE.finditer(text):
+        used += _piece_tokens(m.group())
+        if used > budget:
+            return text[:m.start()].rstrip() + suffix
+    return text
+
+
+def pack_context(scored_docs, budget: int = CONTEXT_TOKENS,
+                 doc_budget: int = DOC_TOKENS) -> tuple[list[str], list[int]]:
+    """
+    `scored_docs`: [(score, doc_id, texto), ...] em ordem de relevância.
+    Retorna (linhas do contexto, ids que entraram).
+    """
+    lines, ids = [], []
+    left = budget
+    for score, doc_id, text in scored_docs:
+        line = f"- [score={score:.2f}] {truncate_tokens(text, doc_budget)}"
+        cost = count_tokens(line)
+        if cost > left:
+            # o último trecho entra cortado, se ainda sobrar espaço razoável
+            if left >= MIN_DOC_TOKENS:
+                lines.append(truncate_tokens(line, left))
+                ids.append(doc_id)
+            break
+        lines.append(line)
+        ids.append(doc_id)
+        left -= cost
+    return lines, ids
+
+
+def schema_prompt(columns) -> str:
+    cols = [str(c) for c in list(columns)[:MAX_COLUMNS]]
+    if not cols:
+        return ""
+    return "Colunas disponíveis nos dados: " + ", ".join(cols) + "."
+
+
+def history_summary(messages, budget: int = HISTORY_TOKENS) -> str:
+    """
+    Resumo das conversas anteriores a partir de `st.session_state.chat_messages`
+    (sem a pergunta atual). Só pares pergunta/resposta entram; os mais
+    recentes têm prioridade.
+    """
+    turns, question = [], None
+    for m in messages:
+        if m.get("role") == "user":
+            question = m.get("content", "")
+        elif m.get("role") == "assistant" and question is not None:
+            answer = (m.get("content") or "").strip().split("\n\n")[0]
+            turns.append((question, answer))
+            question = None
+
+    lines, left = [], budget
+    for question, answer in reversed(turns):
+        line = (f"- Pergunta: {truncate_tokens(question, QUESTION_TOKENS)} | "
+                f"Resposta: {truncate_tokens(answer, ANSWER_TOKENS)}")
+        cost = count_tokens(line)
+        if cost > left:
+            break
+        lines.append(line)
+        left -= cost
+    return "\n".join(reversed(lines))
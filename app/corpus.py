@@ -0,0 +1,48 @@
+"""
+Corpus de documentos do assistente (1 texto por exemplar + 1 por ponto do KML).
+O índice junta esses documentos por partição (ver rag_store.py).
+
+Montado com operações vetorizadas do pandas sobre as colunas escolhidas,
+sem iterrows e sem limite de linhas: a coleção inteira é indexada.
+"""
+import pandas as pd
+
+# campos de cada exemplar que entram no documento, nesta ordem
+DOC_FIELDS = ["N tombo coleção", "Nome cientifico", "Nome comum", "Municipio", "Familia", "Ordem", "Data entrada"]
+
+
+def _field_text(s: pd.Series, label: str) -> pd.Series:
+    # "Campo: valor" ou "" quando vazio
+    txt = s.astype("string").str.strip()
+    return (label + ": " + txt).where(txt.notna() & (txt != ""), "").astype(object)
+
+
+def _join_parts(parts: list[pd.Series], sep: str = " | ") -> pd.Series:
+    # junta as partes não vazias, linha a linha, sem sair do pandas
+    out = parts[0]
+    for p in parts[1:]:
+        both = (out != "") & (p != "")
+        out = out.where(~both, out + sep) + p
+    return out
+
+
+def dataframe_docs(df: pd.DataFrame, fields=DOC_FIELDS) -> list[str]:
+    """
+    Um documento por linha: "N tombo coleção: X | Nome cientifico: Y | ...".
+    """
+    if not isinstance(df, pd.DataFrame) or df.empty:
+        return []
+    cols = [c for c in fields if c in df.columns]
+    if not cols:
+        return [""] * len(df)
+    return _join_parts([_field_text(df[c], c) for c in cols]).tolist()
+
+
+def kml_docs(df_kml: pd.DataFrame) -> list[str]:
+    if not isinstance(df_kml, pd.DataFrame) or df_kml.empty:
+        return []
+    return (
+        "KML | N tombo coleção: " + df_kml["N tombo coleção"].astype(str)
+        + " | lat: " + df_kml["lat"].astype(str)
+        + " | lon: " + df_kml["lon"].astype(str)
+    ).tolist()
@@ -0,0 +1,436 @@
+"""
+Correções de registros feitas no painel, sem abrir a planilha no LibreOffice.
+
+As edições da tabela (modo "Corrigir registros") vão para um diário só de
+acréscimo (append-only) em dados_painel/correcoes.sqlite: cada célula
+alterada vira uma linha com planilha, linha da planilha, coluna, valor
+antigo e novo. Nada é apagado nem reescrito no diário.
+
+O painel não relê planilha nenhuma para mostrar uma correção: o dataset em
+cache (ver snapshot.py) recebe por cima as edições pendentes (`overlay`),
+copiando só as colunas editadas. O custo é proporcional ao número de
+correções, não ao tamanho das planilhas.
+
+A compactação é um passo separado, em lote (linha de comando), que grava as
+correções pendentes nas planilhas (.xlsx) e registra no diário até que
+edição cada planilha já foi gravada:
+    python app/correcoes.py              # lista as correções pendentes
+    python app/correcoes.py compactar    # grava nas planilhas
+    python app/correcoes.py compactar --simular
+
+Cada edição guarda a fingerprint da planilha em que foi feita. Se a planilha
+mudou por fora desde então (editada no LibreOffice), a linha só é usada se o
+tombo ainda bater; senão a edição é ignorada e aparece como conflito.
+A tabela, os filtros, as consultas exatas do assistente e as fichas por
+espécie já mostram as correções pendentes (caches chaveados pela versão do
+diário). Coordenadas (lat/lon do KML), o índice de trechos do assistente e o
+job em lote das fichas só as refletem depois da compactação.
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cache_painel import BASE_DIR, file_fingerprint
+from mapa import KML_COL
+import snapshot
+from tombo import canonical_tombo
+
+JOURNAL_PATH = Path(os.environ.get("PAINEL_CORRECOES", BASE_DIR / "dados_painel" / "correcoes.sqlite"))
+TOMBO_COL = "N tombo coleção"
+# colunas calculadas pelo painel (coordenadas do KML), não editáveis
+READONLY = ["lat", "lon", "long", KML_COL]
+BACKUP_DIR = "backup"
+
+
+def is_readonly(col: str) -> bool:
+    # também as de texto original de uma data (ver snapshot.arrow_ready): corrige-se a própria data
+    return col in READONLY or col.endswith(snapshot.ORIGINAL_SUFFIX)
+
+
+def _plain(value):
+    """
+    Valor de célula em forma de JSON (datas em ISO, vazio = None).
+    """
+    if value is None or value is pd.NaT:
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, (datetime, date)):
+        return pd.Timestamp(value).isoformat()
+    return value
+
+
+class Journal:
+    """
+    Diário das correções (SQLite). O arquivo só é criado na primeira correção.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path or JOURNAL_PATH)
+        self._con = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._con is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._con = sqlite3.connect(str(self.path), check_same_thread=False, timeout=5)
+            self._con.execute("PRAGMA journal_mode=WAL")
+            self._con.execute(
+                "CREATE TABLE IF NOT EXISTS edicoes ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, quando REAL, planilha TEXT, linha INTEGER,"
+                " base TEXT, tombo TEXT, coluna TEXT, antes TEXT, depois TEXT)"
+            )
+            self._con.execute(
+                "CREATE TABLE IF NOT EXISTS compactacoes ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, quando REAL, planilha TEXT, ate_id INTEGER,"
+                " fingerprint TEXT, gravadas INTEGER, conflitos INTEGER)"
+            )
+            self._con.commit()
+        return self._con
+
+    def version(self) -> int:
+        """
+        Muda a cada correção ou compactação (entra na chave dos caches do painel).
+        """
+        if self._con is None and not self.path.exists():
+            return 0
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT (SELECT COALESCE(MAX(id), 0) FROM edicoes)"
+                " + (SELECT COALESCE(MAX(id), 0) FROM compactacoes)"
+            ).fetchone()
+        return int(row[0])
+
+    def append(self, edits: list[dict]) -> int:
+        """
+        Acrescenta edições (numa transação só). Retorna quantas entraram.
+        """
+        if not edits:
+            return 0
+        now = time.time()
+        rows = [
+            (now, e["planilha"], int(e["linha"]), e["base"], e.get("tombo"), e["coluna"],
+             json.dumps(_plain(e.get("antes")), ensure_ascii=False),
+             json.dumps(_plain(e["depois"]), ensure_ascii=False))
+            for e in edits
+        ]
+        with self._lock:
+            con = self._connect()
+            with con:
+                con.executemany(
+                    "INSERT INTO edicoes (quando, planilha, linha, base, tombo, coluna, antes, depois)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+                )
+        return len(rows)
+
+    def pending(self, planilha: str | None = None) -> list[dict]:
+        """
+        Edições ainda não gravadas nas planilhas, na ordem em que foram feitas.
+        """
+        if self._con is None and not self.path.exists():
+            return []
+        sql = (
+            "SELECT e.id, e.quando, e.planilha, e.linha, e.base, e.tombo, e.coluna, e.antes, e.depois"
+            " FROM edicoes e"
+            " WHERE e.id > COALESCE((SELECT MAX(c.ate_id) FROM compactacoes c WHERE c.planilha = e.planilha), 0)"
+        )
+        params = []
+        if planilha is not None:
+            sql += " AND e.planilha = ?"
+            params.append(planilha)
+        with self._lock:
+            rows = self._connect().execute(sql + " ORDER BY e.id", params).fetchall()
+        keys = ["id", "quando", "planilha", "linha", "base", "tombo", "coluna", "antes", "depois"]
+        out = [dict(zip(keys, r)) for r in rows]
+        for e in out:
+            e["antes"], e["depois"] = json.loads(e["antes"]), json.loads(e["depois"])
+        return out
+
+    def pending_count(self) -> int:
+        return len(self.pending())
+
+    def record_compaction(self, planilha: str, ate_id: int, fingerprint: str, gravadas: int, conflitos: int):
+        with self._lock:
+            con = self._connect()
+            with con:
+                con.execute(
+                    "INSERT INTO compactacoes (quando, planilha, ate_id, fingerprint, gravadas, conflitos)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (time.time(), planilha, int(ate_id), fingerprint, int(gravadas), int(conflitos)),
+                )
+
+
+# -----------------------
+# dataset do painel
+# -----------------------
+def sources(report: dict, arquivos) -> dict[str, tuple[int, int, str, set]]:
+    """
+    {planilha: (primeira posição no dataset, linhas, fingerprint, colunas)}.
+    O dataset tem a união das colunas; `colunas` são as da própria planilha.
+    Snapshots antigos não trazem "planilhas" no relatório: aí conta as
+    linhas de cada planilha pelo snapshot dela.
+    """
+    origens = report.get("planilhas")
+    if origens is None:
+        origens = []
+        for c in arquivos:
+            if os.path.exists(c):
+                wb = snapshot.load_workbook(c)
+                origens.append([Path(c).name, len(wb), file_fingerprint(c), [str(x) for x in wb.columns]])
+    out, start = {}, 0
+    for nome, linhas, fp, colunas in origens:
+        out[nome] = (start, int(linhas), fp, set(colunas))
+        start += int(linhas)
+    return out
+
+
+def _same_row(edit: dict, fp: str, tombos, pos: int) -> bool:
+    # planilha igual à da edição: a linha é a mesma; senão, confere pelo tombo
+    if edit["base"] == fp:
+        return True
+    return tombos is not None and edit["tombo"] is not None and canonical_tombo(tombos[pos]) == edit["tombo"]
+
+
+def _coerce(values: list, dtype) -> np.ndarray:
+    s = pd.Series(values, dtype="object")
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        # format="mixed": cada valor com seu formato (sem isso o pandas infere o
+        # formato do primeiro e os outros viram NaT)
+        return pd.to_datetime(s, errors="coerce", format="mixed").to_numpy()
+    if pd.api.types.is_numeric_dtype(dtype):
+        return pd.to_numeric(s, errors="coerce").to_numpy(dtype="float64")
+    return np.array([None if v is None else str(v) for v in values], dtype="object")
+
+
+def overlay(dfs: pd.DataFrame, report: dict, arquivos, journal: Journal) -> pd.DataFrame:
+    """
+    Dataset com as correções pendentes aplicadas. Sem correções, o próprio
+    `dfs`; com correções, uma cópia rasa em que só as colunas editadas são novas.
+    """
+    edits = journal.pending()
+    if not edits or dfs.empty:
+        return dfs
+    origens = sources(report, arquivos)
+    tombos = dfs[TOMBO_COL].to_numpy(dtype="object") if TOMBO_COL in dfs.columns else None
+
+    changes: dict[str, dict[int, object]] = {}
+    for e in edits:
+        origem = origens.get(e["planilha"])
+        if origem is None or e["coluna"] not in dfs.columns or is_readonly(e["coluna"]):
+            continue
+        start, linhas, fp, colunas = origem
+        if e["coluna"] not in colunas:
+            # a compactação não teria onde gravar (ver compact_workbook)
+            continue
+        if not 0 <= e["linha"] < linhas:
+            continue
+        pos = start + e["linha"]
+        if _same_row(e, fp, tombos, pos):
+            changes.setdefault(e["coluna"], {})[pos] = e["depois"]
+
+    if not changes:
+        return dfs
+    out = dfs.copy(deep=False)
+    for col, values in changes.items():
+        s = dfs[col].copy()
+        s.iloc[list(values)] = _coerce(list(values.values()), s.dtype)
+        out[col] = s
+        # data corrigida: o texto original que não era data deixa de valer
+        original = col + snapshot.ORIGINAL_SUFFIX
+        if original in dfs.columns:
+            o = dfs[original].copy()
+            o.iloc[list(values)] = None
+            out[original] = o
+    return out
+
+
+def record_edits(journal: Journal, dfs: pd.DataFrame, report: dict, arquivos,
+                 changes: dict) -> tuple[int, list[str]]:
+    """
+    Grava no diário as edições da tabela: `changes` = {posição no dataset: {coluna: valor novo}}.
+    `dfs` é o dataset como o painel mostra (já com as correções anteriores).
+    Valores iguais aos atuais e colunas calculadas são ignorados.
+    Retorna (correções gravadas, células recusadas): célula de uma coluna que a
+    planilha da linha não tem (o dataset junta as colunas de todas) é recusada,
+    já que a compactação não teria onde gravá-la.
+    """
+    spans = sorted((start, linhas, nome, fp, colunas)
+                   for nome, (start, linhas, fp, colunas) in sources(report, arquivos).items())
+    starts = [s[0] for s in spans]
+    edits, recusadas = [], []
+    for pos, cols in changes.items():
+        i = int(np.searchsorted(starts, pos, side="right")) - 1
+        if i < 0 or pos >= spans[i][0] + spans[i][1]:
+            continue
+        start, _, nome, fp, colunas = spans[i]
+        tombo = canonical_tombo(dfs[TOMBO_COL].iat[pos]) if TOMBO_COL in dfs.columns else None
+        for col, value in cols.items():
+            if col not in dfs.columns or is_readonly(col):
+                continue
+            if col not in colunas:
+                recusadas.append(f"'{col}' não existe em {nome} (linha {pos - start + 2})")
+                continue
+            antes = _plain(dfs[col].iat[pos])
+            depois = _plain(value)
+            if isinstance(depois, str) and not depois.strip():
+                depois = None
+            if depois == antes:
+                continue
+            edits.append({"planilha": nome, "linha": pos - start, "base": fp, "tombo": tombo,
+                          "coluna": col, "antes": antes, "depois": depois})
+    return journal.append(edits), recusadas
+
+
+# -----------------------
+# compactação (planilhas)
+# -----------------------
+def lock_file(caminho: Path) -> Path:
+    # arquivo que o LibreOffice cria enquanto a planilha está aberta
+    return caminho.with_name(f".~lock.{caminho.name}#")
+
+
+def _excel_value(value, current):
+    if value is None:
+        return None
+    if isinstance(current, (datetime, date)):
+        ts = pd.to_datetime(value, errors="coerce")
+        return None if pd.isna(ts) else ts.to_pydatetime()
+    if isinstance(value, str) and isinstance(current, (int, float)) and not isinstance(current, bool):
+        num = pd.to_numeric(value.replace(",", "."), errors="coerce")
+        if not pd.isna(num):
+            return int(num) if float(num).is_integer() else float(num)
+    if isinstance(value, float) and value.is_integer() and isinstance(current, int):
+        return int(value)
+    return value
+
+
+def compact_workbook(journal: Journal, caminho, force: bool = False, dry_run: bool = False, log=print) -> dict:
+    """
+    Grava as correções pendentes de uma planilha (última edição de cada célula vence).
+    Guarda uma cópia da planilha original em <pasta>/backup/ antes de sobrescrever.
+    """
+    caminho = Path(caminho)
+    edits = journal.pending(caminho.name)
+    result = {"planilha": caminho.name, "pendentes": len(edits), "gravadas": 0, "conflitos": []}
+    if not edits:
+        return result
+    if lock_file(caminho).exists() and not force:
+        result["erro"] = f"aberta no LibreOffice ({lock_file(caminho).name}); feche ou use --forcar"
+        return result
+
+    import openpyxl
+
+    # nomes de coluna exatamente como o pandas leu (Unnamed: 0, "X.1" para repetidas...)
+    header = list(pd.read_excel(caminho, nrows=0, engine="openpyxl").columns)
+    col_index = {c: i + 1 for i, c in enumerate(header)}
+    fp = file_fingerprint(caminho)
+
+    wb = openpyxl.load_workbook(caminho)
+    ws = wb.worksheets[0]  # a mesma que o pandas lê (sheet_name=0)
+
+    latest: dict[tuple[int, str], dict] = {}
+    for e in edits:
+        latest[(e["linha"], e["coluna"])] = e
+    for (linha, coluna), e in sorted(latest.items()):
+        row = linha + 2  # linha 1 = cabeçalho
+        if coluna not in col_index:
+            result["conflitos"].append(f"#{e['id']} linha {linha + 2}: coluna '{coluna}' não existe na planilha")
+            continue
+        if e["base"] != fp:
+            tombo = canonical_tombo(ws.cell(row=row, column=col_index[TOMBO_COL]).value) if TOMBO_COL in col_index else None
+            if e["tombo"] is None or tombo is None:
+                result["conflitos"].append(f"#{e['id']} linha {row}: planilha mudou desde a edição e a linha não tem tombo para conferir")
+                continue
+            if tombo != e["tombo"]:
+                result["conflitos"].append(
+                    f"#{e['id']} linha {row}: planilha mudou desde a edição e o tombo não confere ({e['tombo']} != {tombo})"
+                )
+                continue
+        cell = ws.cell(row=row, column=col_index[coluna])
+        cell.value = _excel_value(e["depois"], cell.value)
+        result["gravadas"] += 1
+
+    if dry_run:
+        return result
+
+    if result["gravadas"]:
+        backup = caminho.parent / BACKUP_DIR / f"{caminho.stem}-{time.strftime('%Y%m%d-%H%M%S')}{caminho.suffix}"
+        backup.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(caminho, backup)
+        fd, tmp = tempfile.mkstemp(dir=caminho.parent, prefix=".tmp-", suffix=caminho.suffix)
+        os.close(fd)
+        try:
+            wb.save(tmp)
+            os.replace(tmp, caminho)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        result["backup"] = str(backup)
+    # conflitos também fecham: continuam no diário, mas não voltam a ser aplicados
+    journal.record_compaction(caminho.name, max(e["id"] for e in edits), file_fingerprint(caminho),
+                              result["gravadas"], len(result["conflitos"]))
+    return result
+
+
+def compact(journal: Journal, arquivos, force: bool = False, dry_run: bool = False, log=print) -> list[dict]:
+    results = []
+    for caminho in arquivos:
+        if not os.path.exists(caminho):
+            continue
+        r = compact_workbook(journal, caminho, force=force, dry_run=dry_run, log=log)
+        if not r["pendentes"]:
+            continue
+        results.append(r)
+        if "erro" in r:
+            log(f"{r['planilha']}: não gravada: {r['erro']}")
+            continue
+        verbo = "seriam gravadas" if dry_run else "gravadas"
+        log(f"{r['planilha']}: {r['gravadas']} célula(s) {verbo} de {r['pendentes']} edição(ões)")
+        for c in r["conflitos"]:
+            log(f"  conflito {c}")
+        if r.get("backup"):
+            log(f"  cópia da original: {r['backup']}")
+    if not results:
+        log("nenhuma correção pendente")
+    return results
+
+
+def main(argv=None):
+    from dados import ARQUIVOS
+
+    ap = argparse.ArgumentParser(description="Correções feitas no painel (diário e compactação nas planilhas)")
+    ap.add_argument("acao", nargs="?", choices=["listar", "compactar"], default="listar")
+    ap.add_argument("--forcar", action="store_true", help="grava mesmo com o arquivo de trava do LibreOffice")
+    ap.add_argument("--simular", action="store_true", help="mostra o que seria gravado, sem gravar")
+    args = ap.parse_args(argv)
+
+    journal = Journal()
+    arquivos = [str(BASE_DIR / p) for p in ARQUIVOS]
+    if args.acao == "listar":
+        edits = journal.pending()
+        for e in edits:
+            quando = time.strftime("%Y-%m-%d %H:%M", time.localtime(e["quando"]))
+            print(f"#{e['id']} {quando} {e['planilha']} linha {e['linha'] + 2} [{e['tombo'] or '-'}] "
+                  f"{e['coluna']}: {e['antes']!r} -> {e['depois']!r}")
+        print(f"{len(edits)} correção(ões) pendente(s)")
+        return 0
+    results = compact(journal, arquivos, force=args.forcar, dry_run=args.simular)
+    return 1 if any("erro" in r for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
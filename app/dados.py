@@ -0,0 +1,115 @@
+"""
+Leitura das fontes de dados do painel (planilhas e KML), sem Streamlit.
+
+Usado pelos dashboards e pelos processos que rodam fora do Streamlit
+(índice do assistente, prewarm do launcher etc.).
+"""
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+import pandas as pd
+
+# fontes padrão (relativas à raiz do projeto), usadas pelos scripts de linha de comando
+ARQUIVOS = [
+    "dados_painel/Referência Amphibia.xlsx",
+    "dados_painel/Referência Aves.xlsx",
+    "dados_painel/Referência Mammalia.xlsx",
+    "dados_painel/Referência Reptilia.xlsx",
+]
+KML_PATH = "assets/coordenadas/coletas.kml"
+FOTOS_DIR = "assets/fotos_colecao"
+
+
+def read_workbook(caminho) -> pd.DataFrame:
+    return pd.read_excel(caminho, engine="openpyxl")
+
+
+# Função para gerenciar o arquivo kml e fazer o de-para do nome da coordenada para o Id do individuo
+
+def parse_kml_points(kml_path: Path) -> pd.DataFrame:
+    """
+    Extrai pontos de um KML e retorna um DF com colunas:
+      - 'N tombo coleção'
+      - 'lat'
+      - 'lon'
+
+    Tenta obter o tombo em:
+      1) Placemark/name
+      2) Placemark/ExtendedData/Data[@name=...]/value (vários nomes possíveis)
+    """
+    if not kml_path.exists():
+        return pd.DataFrame(columns=["N tombo coleção", "lat", "lon"])
+
+    tree = ET.parse(kml_path)
+    root = tree.getroot()
+
+    # namespace KML (geralmente existe)
+    ns = {"kml": "http://www.opengis.net/kml/2.2"}
+
+    def _find_text(elem, path_no_ns, path_ns):
+        # tenta sem namespace e com namespace
+        t = elem.findtext(path_no_ns)
+        if t is None:
+            t = elem.findtext(path_ns, namespaces=ns)
+        return t
+
+    def _get_tombo(pm):
+        # 1) <name>
+        name = _find_text(pm, "name", "kml:name")
+        if name and name.strip():
+            return name.strip()
+
+        # 2) ExtendedData/Data
+        # tenta alguns nomes comuns de campo
+        candidates = {"N tombo coleção", "N_tombo_colecao", "tombo", "Tombo", "N_tombo"}
+        # percorre todos Data
+        for data in pm.findall(".//Data"):
+            key = data.get("name")
+            if key in candidates:
+                val = data.findtext("value")
+                if val and val.strip():
+                    return val.strip()
+
+        for data in pm.findall(".//kml:Data", namespaces=ns):
+            key = data.get("name")
+            if key in candidates:
+                val = data.findtext("kml:value", namespaces=ns)
+                if val and val.strip():
+                    return val.strip()
+
+        return None
+
+    rows = []
+
+    # pega placemarks com ponto
+    placemarks = root.findall(".//Placemark") or root.findall(".//kml:Placemark", namespaces=ns)
+    for pm in placemarks:
+        tombo = _get_tombo(pm)
+
+        # Point/coordinates: "lon,lat,alt" (alt opcional)
+        coords = (
+            _find_text(pm, ".//Point/coordinates", ".//kml:Point/kml:coordinates")
+            or _find_text(pm, ".//coordinates", ".//kml:coordinates")
+        )
+        if not coords:
+            continue
+
+        # pode ter espaços/linhas; pegue o primeiro par
+        coord_str = coords.strip().split()[0]
+        parts = coord_str.split(",")
+        if len(parts) < 2:
+            continue
+
+        try:
+            lon = float(parts[0])
+            lat = float(parts[1])
+        except ValueError:
+            continue
+
+        if tombo is None:
+            # se não achou tombo, ignora (ou você pode guardar como None)
+            continue
+
+        rows.append({"N tombo coleção": tombo, "lat": lat, "lon": lon})
+
+    return pd.DataFrame(rows).drop_duplicates(subset=["N tombo coleção"])
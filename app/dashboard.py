@@ -3,19 +3,20 @@ import streamlit as st
 st.set_page_config(page_title="Painel Coleção - Zoologia", layout="wide")
 
 # agora sim, resto dos imports
-import sys
-import typing_extensions
+# (plotly e pydeck são importados nas seções que os usam, para o topo da
+# página aparecer antes deles carregarem; ver bench_partida.py)
 import pandas as pd
-import plotly.express as px
 import os
 from pathlib import Path
-import pydeck as pdk
 import re
-import xml.etree.ElementTree as ET
-from openai import OpenAI
 import json
 import hashlib
-import time
+import banco
+import correcoes
+from cache_painel import dataset_fingerprint
+import snapshot
+from taxonomia import build_taxonomy, children, node_path
+from mapa import KML_COL, aggregate_payload, aggregate_points, point_payload
 
 # ✅ debug SEM usar st.* aqui em cima
 # se quiser debugar, faça depois, lá embaixo no app, ou use print()
@@ -23,20 +24,6 @@ import time
 # -----------------------------------------
 # FUNÇÕES
 # -----------------------------------------
-@st.cache_data(show_spinner=False)
-def load_data(arquivos):
-    dfs_list = []
-    for caminho in arquivos:
-        if os.path.exists(caminho):
-            try:
-                df_temp = pd.read_excel(caminho, engine="openpyxl")
-                dfs_list.append(df_temp)
-            except Exception as e:
-                st.error(f"Erro ao ler {caminho}: {e}")
-    if not dfs_list:
-        return pd.DataFrame()
-    return pd.concat(dfs_list, ignore_index=True)
-
 # Função usada para localizar arquivos de foto pelo número de ID do indivíduo
 def find_photos_by_tombo(tombo_value: str, fotos_dir: Path):
     """
@@ -50,14 +37,9 @@ def find_photos_by_tombo(tombo_value: str, fotos_dir: Path):
     if not tombo:
         return []
 
-    # busca em extensões comuns
-    exts = {".png", ".jpg", ".jpeg", ".webp"}
-    matches = []
-    for p in fotos_dir.iterdir():
-        if p.is_file() and p.suffix.lower() in exts:
-            if tombo.lower() in p.name.lower():
-                matches.append(p)
-    return sorted(matches)
+    # nomes das fotos vêm do índice em disco (refeito só quando a pasta muda)
+    tombo = tombo.lower()
+    return [fotos_dir / name for name in snapshot.photo_files(fotos_dir) if tombo in name.lower()]
 
 def sidebar_multiselect_filter(df_source_for_options, col_name, key_prefix="f"):
     # opções sempre a partir do DF "base" (estável)
@@ -125,9 +107,11 @@ def cascade_multiselect(df_current, col_name, key_prefix="f"):
 
     return selected
 
-def cascade_filter_autoall(df_current, col_name, key_prefix="f"):
-    s = df_current[col_name].fillna("(vazio)").astype(str)
-    options = sorted(s.unique())
+def cascade_filter_autoall(df_current, col_name, key_prefix="f", options=None):
+    # options pode vir pronto (ex.: filhos na árvore taxonômica)
+    if options is None:
+        s = df_current[col_name].fillna("(vazio)").astype(str)
+        options = sorted(s.unique())
 
     key_ms = f"{key_prefix}_{col_name}_ms"
     key_touched = f"{key_prefix}_{col_name}_touched"
@@ -168,16 +152,16 @@ def cascade_filter_autoall(df_current, col_name, key_prefix="f"):
 
     return selected
 
-def date_range_filter(df, date_col, key_prefix="d"):
-    df = df.copy()
-    df[date_col] = pd.to_datetime(df[date_col], errors="coerce")
-
-    valid_dates = df[date_col].dropna()
-    if valid_dates.empty:
-        return df
+def date_range_filter(filtro, date_col, key_prefix="d"):
+    """
+    Filtro de datas: aplica em `filtro` (ver banco.py) o intervalo escolhido.
+    """
+    bounds = filtro.date_bounds(date_col)
+    if bounds is None:
+        return
 
-    min_date = valid_dates.min().date()
-    max_date = valid_dates.max().date()
+    min_date = bounds[0].date()
+    max_date = bounds[1].date()
 
     with st.sidebar.expander(f"Filtro: {date_col}", expanded=False):
         key_date = f"{key_prefix}_{date_col}_range"
@@ -191,11 +175,7 @@ def date_range_filter(df, date_col, key_prefix="d"):
         )
 
     if isinstance(data_range, tuple) and len(data_range) == 2:
-        start_date, end_date = pd.to_datetime(data_range[0]), pd.to_datetime(data_range[1])
-        mask = (df[date_col].isna()) | ((df[date_col] >= start_date) & (df[date_col] <= end_date))
-        return df[mask]
-
-    return df
+        filtro.date_between(date_col, pd.to_datetime(data_range[0]), pd.to_datetime(data_range[1]))
 
 def clear_all_filters():
     # remove tudo que termina com _ms (multiselects) e _range (datas)
@@ -204,95 +184,74 @@ def clear_all_filters():
         del st.session_state[k]
     st.rerun()
 
-# Função para gerenciar o arquivo kml e fazer o de-para do nome da coordenada para o Id do individuo
 
-def parse_kml_points(kml_path: Path) -> pd.DataFrame:
+# cache_resource: um só DataFrame, somente leitura, para todas as sessões
+# (st.cache_data devolveria uma cópia nova a cada rerun)
+@st.cache_resource(show_spinner=False, max_entries=2)
+def load_data_with_coords(arquivos, kml_path: str, kml_mtime: float, edicoes: int):
     """
-    Extrai pontos de um KML e retorna um DF com colunas:
-      - 'N tombo coleção'
-      - 'lat'
-      - 'lon'
-
-    Tenta obter o tombo em:
-      1) Placemark/name
-      2) Placemark/ExtendedData/Data[@name=...]/value (vários nomes possíveis)
+    Planilhas + lat/lon do KML, juntados pela chave canônica do tombo
+    (ver tombo.py). Vem do snapshot em disco (ver snapshot.py), que o
+    launcher já deixa pronto antes da primeira visita; as colunas de texto
+    ficam mapeadas do arquivo, compartilhadas entre processos.
+    Por cima vêm as correções ainda não gravadas nas planilhas (ver
+    correcoes.py); `edicoes` (versão do diário) só entra na chave do cache.
+    Retorna (dfs, relatorio_da_juncao).
     """
-    if not kml_path.exists():
-        return pd.DataFrame(columns=["N tombo coleção", "lat", "lon"])
-
-    tree = ET.parse(kml_path)
-    root = tree.getroot()
-
-    # namespace KML (geralmente existe)
-    ns = {"kml": "http://www.opengis.net/kml/2.2"}
-
-    def _find_text(elem, path_no_ns, path_ns):
-        # tenta sem namespace e com namespace
-        t = elem.findtext(path_no_ns)
-        if t is None:
-            t = elem.findtext(path_ns, namespaces=ns)
-        return t
-
-    def _get_tombo(pm):
-        # 1) <name>
-        name = _find_text(pm, "name", "kml:name")
-        if name and name.strip():
-            return name.strip()
-
-        # 2) ExtendedData/Data
-        # tenta alguns nomes comuns de campo
-        candidates = {"N tombo coleção", "N_tombo_colecao", "tombo", "Tombo", "N_tombo"}
-        # percorre todos Data
-        for data in pm.findall(".//Data"):
-            key = data.get("name")
-            if key in candidates:
-                val = data.findtext("value")
-                if val and val.strip():
-                    return val.strip()
-
-        for data in pm.findall(".//kml:Data", namespaces=ns):
-            key = data.get("name")
-            if key in candidates:
-                val = data.findtext("kml:value", namespaces=ns)
-                if val and val.strip():
-                    return val.strip()
-
-        return None
-
-    rows = []
-
-    # pega placemarks com ponto
-    placemarks = root.findall(".//Placemark") or root.findall(".//kml:Placemark", namespaces=ns)
-    for pm in placemarks:
-        tombo = _get_tombo(pm)
-
-        # Point/coordinates: "lon,lat,alt" (alt opcional)
-        coords = (
-            _find_text(pm, ".//Point/coordinates", ".//kml:Point/kml:coordinates")
-            or _find_text(pm, ".//coordinates", ".//kml:coordinates")
-        )
-        if not coords:
-            continue
-
-        # pode ter espaços/linhas; pegue o primeiro par
-        coord_str = coords.strip().split()[0]
-        parts = coord_str.split(",")
-        if len(parts) < 2:
-            continue
-
-        try:
-            lon = float(parts[0])
-            lat = float(parts[1])
-        except ValueError:
-            continue
-
-        if tombo is None:
-            # se não achou tombo, ignora (ou você pode guardar como None)
-            continue
-
-        rows.append({"N tombo coleção": tombo, "lat": lat, "lon": lon})
-
-    return pd.DataFrame(rows).drop_duplicates(subset=["N tombo coleção"])
+    dfs, report, erros = snapshot.load_with_coords(list(arquivos), kml_path)
+    for e in erros:
+        st.error(e)
+    return correcoes.overlay(dfs, report, arquivos, get_journal()), report
+
+# Diário das correções feitas na tabela (um só por processo)
+@st.cache_resource(show_spinner=False)
+def get_journal() -> correcoes.Journal:
+    return correcoes.Journal()
+
+# Árvore taxonômica montada uma vez por dataset (só leitura -> cache_resource)
+@st.cache_resource(show_spinner=False)
+def taxonomy_tree(arquivos, kml_path: str, kml_mtime: float, edicoes: int) -> dict:
+    dfs, _ = load_data_with_coords(arquivos, kml_path, kml_mtime, edicoes)
+    return build_taxonomy(dfs)
+
+# Motor dos filtros/KPIs/contagens (ver banco.py): pandas sobre o DF
+# compartilhado ou SQL embutido (PAINEL_BACKEND=sqlite|duckdb)
+@st.cache_resource(show_spinner=False, max_entries=2)
+def query_backend(arquivos, kml_path: str, kml_mtime: float, edicoes: int):
+    dfs, _ = load_data_with_coords(arquivos, kml_path, kml_mtime, edicoes)
+    # cada versão do diário tem seu banco (o SQL não enxerga o overlay)
+    dataset_fp = dataset_fingerprint(arquivos, kml_path)
+    return banco.open_backend(dfs, f"{dataset_fp}-e{edicoes}" if edicoes else dataset_fp)
+
+def apply_taxonomy_node(tree: dict, node_id: str, key_prefix="f"):
+    """
+    Ajusta os filtros em cascata para o caminho do nó (ex.: Mammalia › Chiroptera):
+    níveis do caminho ficam com 1 valor, níveis abaixo voltam para "tudo".
+    Tem que rodar ANTES dos widgets da barra lateral serem criados.
+    """
+    path = node_path(tree, node_id)
+    for depth, col in enumerate(tree["levels"]):
+        key_ms = f"{key_prefix}_{col}_ms"
+        key_touched = f"{key_prefix}_{col}_touched"
+        if depth < len(path):
+            st.session_state[key_ms] = [path[depth]]
+            st.session_state[key_touched] = True
+        else:
+            st.session_state.pop(key_ms, None)
+            st.session_state[key_touched] = False
+
+# Agregados do mapa: recalculados só quando o estado dos filtros muda
+# (o DF vem com "_" para o Streamlit não precisar hashear ele a cada rerun)
+@st.cache_data(show_spinner=False, max_entries=32)
+def map_aggregates(filter_key: str, _df_geo: pd.DataFrame) -> pd.DataFrame:
+    return aggregate_points(_df_geo)
+
+# Payload mínimo da camada (posição + tooltip), pelo mesmo critério de cache
+@st.cache_data(show_spinner=False, max_entries=32)
+def map_layer_data(filter_key: str, agrupar: bool, _df_geo: pd.DataFrame) -> list[dict]:
+    if agrupar:
+        return aggregate_payload(map_aggregates(filter_key, _df_geo))
+    return point_payload(_df_geo)
 
 # -----------------------------------------
 # APP
@@ -307,7 +266,11 @@ FOTOS_DIR = Path("assets/fotos_colecao")
 FOTOS_DIR.mkdir(parents=True, exist_ok=True)
 
 KML_PATH = Path("assets/coordenadas/coletas.kml")
-df_kml = parse_kml_points(KML_PATH)
+
+# mapa base: servidor local de tiles (subido pelo run_painel.py) ou Mapbox online
+TILES_URL = os.environ.get("PAINEL_TILES_URL", "").rstrip("/")
+MAP_STYLE = f"{TILES_URL}/style.json" if TILES_URL else "mapbox://styles/mapbox/satellite-streets-v12"
+kml_mtime = KML_PATH.stat().st_mtime if KML_PATH.exists() else 0.0
 
 if logo_path.exists():
     st.image(str(logo_path))
@@ -319,48 +282,18 @@ arquivos = [
     "dados_painel/Referência Reptilia.xlsx",
 ]
 
-dfs = load_data(arquivos)
-
 # ===============================
 # COORDENADAS (KML + FALLBACK)  ✅ ÚNICO BLOCO
 # ===============================
-dfs = dfs.copy()
-
-# garante chave limpa
-if "N tombo coleção" in dfs.columns:
-    dfs["N tombo coleção"] = dfs["N tombo coleção"].astype(str).str.strip()
-
-# remove qualquer coluna antiga de coordenadas pra evitar colisão
-for c in ["lat", "lon", "long"]:
-    if c in dfs.columns:
-        dfs.drop(columns=[c], inplace=True)
-
-# merge com KML (se existir)
-if "N tombo coleção" in dfs.columns and not df_kml.empty:
-    df_kml = df_kml.copy()
-    df_kml["N tombo coleção"] = df_kml["N tombo coleção"].astype(str).str.strip()
-    dfs = dfs.merge(df_kml, on="N tombo coleção", how="left")
-
-# garante que as colunas existam SEMPRE (mesmo se não tiver KML)
-if "lat" not in dfs.columns:
-    dfs["lat"] = pd.NA
-if "lon" not in dfs.columns:
-    dfs["lon"] = pd.NA
-
-# fallback só onde estiver vazio
-dfs["lat"] = pd.to_numeric(dfs["lat"], errors="coerce").fillna(-21.2264)
-dfs["lon"] = pd.to_numeric(dfs["lon"], errors="coerce").fillna(-43.7742)
-
-# seu padrão antigo usava "long"
-dfs["long"] = dfs["lon"]
+journal = get_journal()
+edicoes = journal.version()
+dfs, kml_report = load_data_with_coords(arquivos, str(KML_PATH), kml_mtime, edicoes)
 
 if dfs.empty:
     st.warning("Nenhum arquivo foi carregado. Verifique a pasta `dados_painel/` e os nomes dos arquivos.")
     st.stop()
 
 
-df_filtered = dfs.copy()
-
 # -----------------------
 # SIDEBAR: FILTROS (dinâmicos)
 # -----------------------
@@ -369,7 +302,7 @@ st.sidebar.header("Filtros")
 if st.sidebar.button("Limpar TODOS os filtros"):
     keys_to_delete = [
         k for k in st.session_state.keys()
-        if k.endswith("_ms") or k.endswith("_touched") or k.endswith("_range")
+        if k.endswith("_ms") or k.endswith("_touched") or k.endswith("_range") or k.startswith("tax_")
     ]
     for k in keys_to_delete:
         del st.session_state[k]
@@ -389,16 +322,58 @@ filter_order = [
     "Sexo",
 ]
 
-df_filtered = dfs.copy()
+# condições dos filtros acumuladas num Filtro (posições de linha ou SQL);
+# o DF filtrado só é montado uma vez, no fim
+backend = query_backend(arquivos, str(KML_PATH), kml_mtime, edicoes)
+filtro = backend.filtro()
+if backend.aviso:
+    st.sidebar.caption(backend.aviso)
+elif backend.engine != "pandas":
+    st.sidebar.caption(f"Consultas no {backend.engine}")
+
+tax_tree = taxonomy_tree(arquivos, str(KML_PATH), kml_mtime, edicoes)
+tax_levels = tax_tree["levels"]
+
+# clique no sunburst (rodada anterior): aplica nos filtros antes de criar os widgets
+tax_pending = st.session_state.pop("tax_pending", None)
+if tax_pending:
+    apply_taxonomy_node(tax_tree, tax_pending)
+
+# estado dos filtros (vira a chave dos caches que dependem do filtro)
+filter_state = {"_linhas": int(dfs.shape[0])}
+
+tax_parents = None  # ids dos nós selecionados no nível taxonômico anterior
 
 for col in filter_order:
-    if col in df_filtered.columns:
-        selected = cascade_filter_autoall(df_filtered, col)
-        s = df_filtered[col].fillna("(vazio)").astype(str)
-        df_filtered = df_filtered[s.isin(selected)]
+    if col in dfs.columns:
+        if col in tax_levels:
+            # níveis taxonômicos: opções saem da árvore (sem varrer o DF)
+            nodes = children(tax_tree, tax_levels.index(col), tax_parents)
+            options = sorted(nodes["label"].unique())
+            selected = cascade_filter_autoall(dfs, col, options=options)
+            filter_state[col] = selected
+            tax_parents = nodes.loc[nodes["label"].isin(selected), "id"].tolist()
+            # rótulos da árvore = mesmos valores da coluna, então vira um isin comum
+            filtro.isin(col, selected, options)
+            continue
 
-if "Data entrada" in df_filtered.columns:
-    df_filtered = date_range_filter(df_filtered, "Data entrada")
+        # opções = valores presentes nas linhas que sobraram
+        options = filtro.options(col)
+        selected = cascade_filter_autoall(dfs, col, options=options)
+        filter_state[col] = selected
+        filtro.isin(col, selected, options)
+
+if "Data entrada" in dfs.columns:
+    date_range_filter(filtro, "Data entrada")
+    filter_state["Data entrada"] = st.session_state.get("d_Data entrada_range")
+
+# sem filtro nenhum, o próprio DF compartilhado (sem cópia)
+df_filtered = filtro.frame()
+
+# (a versão do diário de correções entra junto: uma correção muda os agregados)
+filter_key = hashlib.sha1(
+    json.dumps([filter_state, edicoes], sort_keys=True, default=str, ensure_ascii=False).encode("utf-8")
+).hexdigest()
 
 
 # -----------------------
@@ -406,44 +381,126 @@ if "Data entrada" in df_filtered.columns:
 # -----------------------
 kpi1, kpi2, kpi3, kpi4, kpi5 = st.columns(5)
 
+kpi = filtro.kpis()
+
 with kpi1:
-    st.metric("Quantidade de indivíduos", int(df_filtered.shape[0]))
+    st.metric("Quantidade de indivíduos", kpi["linhas"])
 
 with kpi2:
-    st.metric("Mamíferos", int(df_filtered.loc[df_filtered.get("Classe").astype(str) == "Mammalia"].shape[0]) if "Classe" in df_filtered.columns else 0)
+    st.metric("Mamíferos", kpi["Mammalia"])
 
 with kpi3:
-    st.metric("Aves", int(df_filtered.loc[df_filtered.get("Classe").astype(str) == "Aves"].shape[0]) if "Classe" in df_filtered.columns else 0)
+    st.metric("Aves", kpi["Aves"])
 
 with kpi4:
-    st.metric("Répteis", int(df_filtered.loc[df_filtered.get("Classe").astype(str) == "Reptilia"].shape[0]) if "Classe" in df_filtered.columns else 0)
+    st.metric("Répteis", kpi["Reptilia"])
 
 with kpi5:
-    st.metric("Anfíbios", int(df_filtered.loc[df_filtered.get("Classe").astype(str) == "Amphibia"].shape[0]) if "Classe" in df_filtered.columns else 0)
+    st.metric("Anfíbios", kpi["Amphibia"])
 
 
 kpi6, kpi7, kpi8, kpi9 = st.columns(4)
 
 with kpi6:
-    st.metric("Quantidade de ordens distintas", int(df_filtered.get("Ordem").nunique()))
+    st.metric("Quantidade de ordens distintas", kpi["Ordem"])
 with kpi7:
-    st.metric("Quantidade de famílias distintas", int(df_filtered.get("Familia").nunique()))
+    st.metric("Quantidade de famílias distintas", kpi["Familia"])
 with kpi8:
-    st.metric("Quantidade de espécies distintas", int(df_filtered.get("Nome cientifico").nunique()))
+    st.metric("Quantidade de espécies distintas", kpi["Nome cientifico"])
 with kpi9:
-    st.metric("Quantidade de municípios com coleta", int(df_filtered.get("Municipio").nunique()))
+    st.metric("Quantidade de municípios com coleta", kpi["Municipio"])
+
+# -----------------------
+# TAXONOMIA (sunburst com drill-down)
+# -----------------------
+import plotly.graph_objects as go
+
+if not tax_tree["nodes"].empty:
+    st.subheader("Taxonomia (clique num grupo para filtrar)")
+
+    tax_nodes = tax_tree["nodes"]
+    fig_tax = go.Figure(go.Sunburst(
+        ids=tax_nodes["id"],
+        labels=tax_nodes["label"],
+        parents=tax_nodes["parent"],
+        values=tax_nodes["count"],
+        customdata=tax_nodes["id"],
+        branchvalues="total",
+        maxdepth=3,
+        level=st.session_state.get("tax_applied") or "",
+        hovertemplate="<b>%{label}</b><br>%{value} exemplares<extra></extra>",
+    ))
+    fig_tax.update_layout(margin=dict(t=10, l=10, r=10, b=10), height=520)
+
+    tax_event = st.plotly_chart(
+        fig_tax,
+        use_container_width=True,
+        on_select="rerun",
+        selection_mode="points",
+        key="tax_sunburst",
+    )
+
+    tax_points = (tax_event or {}).get("selection", {}).get("points", []) if tax_event else []
+    if tax_points:
+        p = tax_points[0]
+        node_id = p.get("customdata") or p.get("id")
+        if node_id is None:
+            idx = p.get("point_index", p.get("point_number"))
+            node_id = tax_nodes["id"].iloc[idx] if idx is not None else None
+        if isinstance(node_id, list):
+            node_id = node_id[0] if node_id else None
+        if node_id and node_id != st.session_state.get("tax_applied"):
+            st.session_state["tax_applied"] = node_id
+            st.session_state["tax_pending"] = node_id
+            st.rerun()
 
 st.subheader("Amostragem dos Dados (clique numa linha para ver foto)")
 
-# Mostra a tabela com seleção de linha
-event = st.dataframe(
-    df_filtered,
-    use_container_width=True,
-    hide_index=True,
-    selection_mode="single-row",
-    on_select="rerun",
+modo_edicao = st.toggle(
+    "Corrigir registros",
+    key="modo_edicao",
+    help="Edite as células e salve: as correções aparecem na hora e ficam num diário "
+         "até serem gravadas nas planilhas (python app/correcoes.py compactar).",
 )
 
+event = None
+if modo_edicao:
+    # a chave muda com os filtros e com o diário: edição não salva não vai parar em outra linha
+    editor_key = f"editor_{filter_key}"
+    st.data_editor(
+        df_filtered,
+        use_container_width=True,
+        hide_index=True,
+        num_rows="fixed",
+        disabled=[c for c in df_filtered.columns if correcoes.is_readonly(c)],
+        key=editor_key,
+    )
+    alteradas = st.session_state.get(editor_key, {}).get("edited_rows", {})
+    if st.button(f"Salvar correções ({len(alteradas)} linha(s))", disabled=not alteradas):
+        # linha da tabela -> posição no dataset (o índice do df_filtered)
+        changes = {int(df_filtered.index[int(i)]): cols for i, cols in alteradas.items()}
+        n, recusadas = correcoes.record_edits(journal, dfs, kml_report, arquivos, changes)
+        st.toast(f"{n} correção(ões) salva(s)")
+        for motivo in recusadas:
+            st.toast(f"Não salva: coluna {motivo}", icon="⚠️")
+        st.rerun()
+else:
+    # Mostra a tabela com seleção de linha
+    event = st.dataframe(
+        df_filtered,
+        use_container_width=True,
+        hide_index=True,
+        selection_mode="single-row",
+        on_select="rerun",
+    )
+
+pendentes = journal.pending_count() if edicoes else 0
+if pendentes:
+    st.caption(
+        f"{pendentes} correção(ões) ainda não gravada(s) nas planilhas "
+        "(`python app/correcoes.py compactar`)."
+    )
+
 selected_tombo = None
 if event and "selection" in event and event["selection"].get("rows"):
     row_idx = event["selection"]["rows"][0]  # índice na visão atual do df_filtered
@@ -505,15 +562,10 @@ if uploaded_files:
 # -----------------------
 # CONTAGEM POR MUNICÍPIO
 # -----------------------
+import plotly.express as px
+
 if "Municipio" in df_filtered.columns:
-    municipio_count = (
-        df_filtered.assign(Municipio=df_filtered["Municipio"].fillna("(vazio)").astype(str))
-        .groupby("Municipio")
-        .size()
-        .reset_index(name="Contagem")
-        .sort_values(by="Contagem", ascending=False)
-        .reset_index(drop=True)
-    )
+    municipio_count = filtro.count_by("Municipio")
 
     fig_municipio = px.bar(
         municipio_count,
@@ -528,17 +580,7 @@ if "Municipio" in df_filtered.columns:
 # CONTAGEM POR MÊS
 # -----------------------
 if "Data entrada" in df_filtered.columns:
-    df_tmp = df_filtered.copy()
-    df_tmp["Data entrada"] = pd.to_datetime(df_tmp["Data entrada"], errors="coerce")
-    df_tmp["Mês"] = df_tmp["Data entrada"].dt.to_period("M").astype(str)
-
-    mes_count = (
-        df_tmp.dropna(subset=["Mês"])
-        .groupby("Mês")
-        .size()
-        .reset_index(name="Contagem")
-        .sort_values("Mês")
-    )
+    mes_count = filtro.count_by_month("Data entrada")
 
     fig_mes = px.bar(
         mes_count,
@@ -553,9 +595,9 @@ if "Data entrada" in df_filtered.columns:
 # BOXPLOT DO PESO
 # -----------------------
 if "Peso (g)" in df_filtered.columns:
-    df_box = df_filtered.copy()
-    df_box["Peso (g)"] = pd.to_numeric(df_box["Peso (g)"], errors="coerce")
-    df_box = df_box.dropna(subset=["Peso (g)"])
+    # só as linhas com peso (e o peso já como número)
+    peso = pd.to_numeric(df_filtered["Peso (g)"], errors="coerce")
+    df_box = df_filtered.loc[peso.notna()].assign(**{"Peso (g)": peso.dropna()})
 
     st.subheader("Boxplot do Peso (g) por variável categórica")
 
@@ -610,9 +652,9 @@ if "Peso (g)" in df_filtered.columns:
             "Cp internasal (mm)",
             "Cp carpo (mm)",
         ]
-        columns_to_describe = [c for c in columns_to_describe if c in df_box.columns]
-        if columns_to_describe:
-            st.dataframe(df_box[columns_to_describe].describe().T.round(2), use_container_width=True)
+        stats = filtro.describe(columns_to_describe, "Peso (g)")
+        if not stats.empty:
+            st.dataframe(stats.round(2), use_container_width=True)
     else:
         st.info("Nenhuma coluna categórica padrão (Nome cientifico/Familia/Sexo/Idade/Municipio) foi encontrada para o boxplot.")
 else:
@@ -622,56 +664,90 @@ else:
 # -----------------------
 # MAPA (pydeck)
 # -----------------------
+import pydeck as pdk
+
 st.subheader("Mapa de Coordenadas (WIP)")
 
-df_geo = df_filtered.copy()
+# só as colunas que o mapa usa (nada de mandar o DF inteiro pro navegador)
+geo_cols = ["lat", "lon", KML_COL, "N tombo coleção", "Nome cientifico"]
+df_geo = df_filtered.reindex(columns=geo_cols)
 df_geo["lat"] = pd.to_numeric(df_geo["lat"], errors="coerce")
 df_geo["lon"] = pd.to_numeric(df_geo["lon"], errors="coerce")
 df_geo = df_geo.dropna(subset=["lat", "lon"])
+df_geo["N tombo coleção"] = df_geo["N tombo coleção"].fillna("").astype(str)
+df_geo["Nome cientifico"] = df_geo["Nome cientifico"].fillna("").astype(str)
 
 if df_geo.empty:
     st.info("Sem coordenadas válidas para exibir no mapa.")
 else:
-    # enquadramento automático
-    view_state = pdk.data_utils.compute_view(df_geo[["lon", "lat"]])
-    view_state.pitch = 0
-    view_state.bearing = 0
+    agrupar = st.toggle(
+        "Agrupar pontos próximos",
+        value=True,
+        help="Agrupa os exemplares por região (com contagem). "
+             "Os exemplares sem coordenada no KML aparecem como um único marcador no local padrão.",
+    )
 
-    # garante colunas pro tooltip
-    if "N tombo coleção" not in df_geo.columns:
-        df_geo["N tombo coleção"] = ""
-    if "Nome cientifico" not in df_geo.columns:
-        df_geo["Nome cientifico"] = ""
+    layer_data = map_layer_data(filter_key, agrupar, df_geo)
+
+    # enquadramento automático
+    view_state = pdk.data_utils.compute_view([r["p"] for r in layer_data])
+
+    if agrupar:
+        df_map = map_aggregates(filter_key, df_geo)
+
+        layer = pdk.Layer(
+            "ScatterplotLayer",
+            data=layer_data,
+            get_position="p",
+            get_fill_color="c",
+            get_radius="r",
+            radius_units="pixels",
+            pickable=True,
+            auto_highlight=True,
+            highlight_color=[0, 0, 0, 255],
+        )
+        tooltip_html = """
+            <b>{t}</b><br/>
+            <b>Espécies:</b> {e}
+            """
+        st.caption(
+            f"{int(df_map['n'].sum())} exemplares em {len(df_map)} marcadores "
+            f"({int(df_map.loc[df_map['fallback'], 'n'].sum())} sem coordenada no KML)."
+        )
+    else:
+        layer = pdk.Layer(
+            "ScatterplotLayer",
+            data=layer_data,
+            get_position="p",
 
-    layer = pdk.Layer(
-        "ScatterplotLayer",
-        data=df_geo,
-        get_position="[lon, lat]",
+            # 🔴 cor forte (vermelho) com leve transparência
+            get_fill_color=[220, 38, 38, 180],   # RGBA
 
-        # 🔴 cor forte (vermelho) com leve transparência
-        get_fill_color=[220, 38, 38, 180],   # RGBA
+            # 🔹 ponto menor, consistente em qualquer zoom
+            get_radius=.004,
+            radius_units="pixels",
 
-        # 🔹 ponto menor, consistente em qualquer zoom
-        get_radius=.004,
-        radius_units="pixels",
+            pickable=True,
+            auto_highlight=True,
 
-        pickable=True,
-        auto_highlight=True,
+            # destaque no hover
+            highlight_color=[0, 0, 0, 255],
+        )
+        tooltip_html = """
+            <b>N tombo coleção — Nome científico:</b><br/>
+            {t}
+            """
 
-        # destaque no hover
-        highlight_color=[0, 0, 0, 255],
-    )
+    view_state.pitch = 0
+    view_state.bearing = 0
 
     st.pydeck_chart(
         pdk.Deck(
-            map_style="mapbox://styles/mapbox/satellite-streets-v12",
+            map_style=MAP_STYLE,
             initial_view_state=view_state,
             layers=[layer],
             tooltip={
-                "html": """
-                <b>N tombo coleção:</b> {N tombo coleção}<br/>
-                <b>Nome científico:</b> {Nome cientifico}
-                """,
+                "html": tooltip_html,
                 "style": {
                     "backgroundColor": "rgba(255,255,255,0.95)",
                     "color": "black",
@@ -682,5 +758,18 @@ else:
         )
     )
 
+with st.expander("Junção com o KML (tombos sem coordenada)", expanded=False):
+    st.write(
+        f"{kml_report['casadas']} de {kml_report['linhas']} exemplares com coordenada do KML; "
+        f"{kml_report['sem_tombo']} sem 'N tombo coleção'."
+    )
+    c1, c2 = st.columns(2)
+    with c1:
+        st.caption(f"Na planilha, sem ponto no KML ({len(kml_report['tombos_sem_kml'])})")
+        st.dataframe(pd.DataFrame({"Tombo": kml_report["tombos_sem_kml"]}), hide_index=True, use_container_width=True)
+    with c2:
+        st.caption(f"No KML, sem exemplar na planilha ({len(kml_report['kml_sem_tombo'])})")
+        st.dataframe(pd.DataFrame({"Tombo": kml_report["kml_sem_tombo"]}), hide_index=True, use_container_width=True)
+
 st.subheader("Assistente (pergunte sobre os arquivos)")
 
@@ -3,21 +3,34 @@ import streamlit as st
 st.set_page_config(page_title="Painel Coleção - Zoologia", layout="wide")
 
 # agora sim, resto dos imports
-import sys
-import typing_extensions
+# (plotly e pydeck são importados nas seções que os usam, para o topo da
+# página aparecer antes deles carregarem; ver bench_partida.py)
 import pandas as pd
-import plotly.express as px
 import os
 from pathlib import Path
-import pydeck as pdk
 import re
-import xml.etree.ElementTree as ET
-import requests
-from collections import Counter, defaultdict
-import math
 import json
 import hashlib
 import time
+import uuid
+import analisador
+import consultas
+import contexto
+import embeddings
+import especies
+import ollama_client
+from answer_cache import AnswerCache
+from assistente import plan_answer
+from llm_queue import LLMQueue
+from warm_keeper import WarmKeeper
+import rag_store
+from cache_painel import dataset_fingerprint
+import banco
+import correcoes
+import snapshot
+from taxonomia import build_taxonomy, children, node_path
+from mapa import KML_COL, aggregate_payload, aggregate_points, point_payload
+from ollama_client import DEFAULT_OLLAMA_MODEL, OLLAMA_HOST
 
 # ✅ debug SEM usar st.* aqui em cima
 # se quiser debugar, faça depois, lá embaixo no app, ou use print()
@@ -25,20 +38,6 @@ import time
 # -----------------------------------------
 # FUNÇÕES
 # -----------------------------------------
-@st.cache_data(show_spinner=False)
-def load_data(arquivos):
-    dfs_list = []
-    for caminho in arquivos:
-        if os.path.exists(caminho):
-            try:
-                df_temp = pd.read_excel(caminho, engine="openpyxl")
-                dfs_list.append(df_temp)
-            except Exception as e:
-                st.error(f"Erro ao ler {caminho}: {e}")
-    if not dfs_list:
-        return pd.DataFrame()
-    return pd.concat(dfs_list, ignore_index=True)
-
 # Função usada para localizar arquivos de foto pelo número de ID do indivíduo
 def find_photos_by_tombo(tombo_value: str, fotos_dir: Path):
     """
@@ -52,14 +51,9 @@ def find_photos_by_tombo(tombo_value: str, fotos_dir: Path):
     if not tombo:
         return []
 
-    # busca em extensões comuns
-    exts = {".png", ".jpg", ".jpeg", ".webp"}
-    matches = []
-    for p in fotos_dir.iterdir():
-        if p.is_file() and p.suffix.lower() in exts:
-            if tombo.lower() in p.name.lower():
-                matches.append(p)
-    return sorted(matches)
+    # nomes das fotos vêm do índice em disco (refeito só quando a pasta muda)
+    tombo = tombo.lower()
+    return [fotos_dir / name for name in snapshot.photo_files(fotos_dir) if tombo in name.lower()]
 
 def sidebar_multiselect_filter(df_source_for_options, col_name, key_prefix="f"):
     # opções sempre a partir do DF "base" (estável)
@@ -127,9 +121,11 @@ def cascade_multiselect(df_current, col_name, key_prefix="f"):
 
     return selected
 
-def cascade_filter_autoall(df_current, col_name, key_prefix="f"):
-    s = df_current[col_name].fillna("(vazio)").astype(str)
-    options = sorted(s.unique())
+def cascade_filter_autoall(df_current, col_name, key_prefix="f", options=None):
+    # options pode vir pronto (ex.: filhos na árvore taxonômica)
+    if options is None:
+        s = df_current[col_name].fillna("(vazio)").astype(str)
+        options = sorted(s.unique())
 
     key_ms = f"{key_prefix}_{col_name}_ms"
     key_touched = f"{key_prefix}_{col_name}_touched"
@@ -170,16 +166,16 @@ def cascade_filter_autoall(df_current, col_name, key_prefix="f"):
 
     return selected
 
-def date_range_filter(df, date_col, key_prefix="d"):
-    df = df.copy()
-    df[date_col] = pd.to_datetime(df[date_col], errors="coerce")
-
-    valid_dates = df[date_col].dropna()
-    if valid_dates.empty:
-        return df
+def date_range_filter(filtro, date_col, key_prefix="d"):
+    """
+    Filtro de datas: aplica em `filtro` (ver banco.py) o intervalo escolhido.
+    """
+    bounds = filtro.date_bounds(date_col)
+    if bounds is None:
+        return
 
-    min_date = valid_dates.min().date()
-    max_date = valid_dates.max().date()
+    min_date = bounds[0].date()
+    max_date = bounds[1].date()
 
     with st.sidebar.expander(f"Filtro: {date_col}", expanded=False):
         key_date = f"{key_prefix}_{date_col}_range"
@@ -193,11 +189,7 @@ def date_range_filter(df, date_col, key_prefix="d"):
         )
 
     if isinstance(data_range, tuple) and len(data_range) == 2:
-        start_date, end_date = pd.to_datetime(data_range[0]), pd.to_datetime(data_range[1])
-        mask = (df[date_col].isna()) | ((df[date_col] >= start_date) & (df[date_col] <= end_date))
-        return df[mask]
-
-    return df
+        filtro.date_between(date_col, pd.to_datetime(data_range[0]), pd.to_datetime(data_range[1]))
 
 def clear_all_filters():
     # remove tudo que termina com _ms (multiselects) e _range (datas)
@@ -206,355 +198,186 @@ def clear_all_filters():
         del st.session_state[k]
     st.rerun()
 
-# Função para gerenciar o arquivo kml e fazer o de-para do nome da coordenada para o Id do individuo
 
-def parse_kml_points(kml_path: Path) -> pd.DataFrame:
+# cache_resource: um só DataFrame, somente leitura, para todas as sessões
+# (st.cache_data devolveria uma cópia nova a cada rerun)
+@st.cache_resource(show_spinner=False, max_entries=2)
+def load_data_with_coords(arquivos, kml_path: str, kml_mtime: float, edicoes: int):
     """
-    Extrai pontos de um KML e retorna um DF com colunas:
-      - 'N tombo coleção'
-      - 'lat'
-      - 'lon'
-
-    Tenta obter o tombo em:
-      1) Placemark/name
-      2) Placemark/ExtendedData/Data[@name=...]/value (vários nomes possíveis)
+    Planilhas + lat/lon do KML, juntados pela chave canônica do tombo
+    (ver tombo.py). Vem do snapshot em disco (ver snapshot.py), que o
+    launcher já deixa pronto antes da primeira visita; as colunas de texto
+    ficam mapeadas do arquivo, compartilhadas entre processos.
+    Por cima vêm as correções ainda não gravadas nas planilhas (ver
+    correcoes.py); `edicoes` (versão do diário) só entra na chave do cache.
+    Retorna (dfs, relatorio_da_juncao).
     """
-    if not kml_path.exists():
-        return pd.DataFrame(columns=["N tombo coleção", "lat", "lon"])
-
-    tree = ET.parse(kml_path)
-    root = tree.getroot()
-
-    # namespace KML (geralmente existe)
-    ns = {"kml": "http://www.opengis.net/kml/2.2"}
-
-    def _find_text(elem, path_no_ns, path_ns):
-        # tenta sem namespace e com namespace
-        t = elem.findtext(path_no_ns)
-        if t is None:
-            t = elem.findtext(path_ns, namespaces=ns)
-        return t
-
-    def _get_tombo(pm):
-        # 1) <name>
-        name = _find_text(pm, "name", "kml:name")
-        if name and name.strip():
-            return name.strip()
-
-        # 2) ExtendedData/Data
-        # tenta alguns nomes comuns de campo
-        candidates = {"N tombo coleção", "N_tombo_colecao", "tombo", "Tombo", "N_tombo"}
-        # percorre todos Data
-        for data in pm.findall(".//Data"):
-            key = data.get("name")
-            if key in candidates:
-                val = data.findtext("value")
-                if val and val.strip():
-                    return val.strip()
-
-        for data in pm.findall(".//kml:Data", namespaces=ns):
-            key = data.get("name")
-            if key in candidates:
-                val = data.findtext("kml:value", namespaces=ns)
-                if val and val.strip():
-                    return val.strip()
-
-        return None
-
-    rows = []
-
-    # pega placemarks com ponto
-    placemarks = root.findall(".//Placemark") or root.findall(".//kml:Placemark", namespaces=ns)
-    for pm in placemarks:
-        tombo = _get_tombo(pm)
-
-        # Point/coordinates: "lon,lat,alt" (alt opcional)
-        coords = (
-            _find_text(pm, ".//Point/coordinates", ".//kml:Point/kml:coordinates")
-            or _find_text(pm, ".//coordinates", ".//kml:coordinates")
-        )
-        if not coords:
-            continue
-
-        # pode ter espaços/linhas; pegue o primeiro par
-        coord_str = coords.strip().split()[0]
-        parts = coord_str.split(",")
-        if len(parts) < 2:
-            continue
-
-        try:
-            lon = float(parts[0])
-            lat = float(parts[1])
-        except ValueError:
-            continue
+    dfs, report, erros = snapshot.load_with_coords(list(arquivos), kml_path)
+    for e in erros:
+        st.error(e)
+    return correcoes.overlay(dfs, report, arquivos, get_journal()), report
 
-        if tombo is None:
-            # se não achou tombo, ignora (ou você pode guardar como None)
-            continue
+# Diário das correções feitas na tabela (um só por processo)
+@st.cache_resource(show_spinner=False)
+def get_journal() -> correcoes.Journal:
+    return correcoes.Journal()
 
-        rows.append({"N tombo coleção": tombo, "lat": lat, "lon": lon})
+# Árvore taxonômica montada uma vez por dataset (só leitura -> cache_resource)
+@st.cache_resource(show_spinner=False)
+def taxonomy_tree(arquivos, kml_path: str, kml_mtime: float, edicoes: int) -> dict:
+    dfs, _ = load_data_with_coords(arquivos, kml_path, kml_mtime, edicoes)
+    return build_taxonomy(dfs)
+
+# Versão do dataset mostrada: fingerprint das planilhas + versão do diário
+def data_version(dataset_fp: str, edicoes: int) -> str:
+    return f"{dataset_fp}-e{edicoes}" if edicoes else dataset_fp
+
+# Motor dos filtros/KPIs/contagens (ver banco.py): pandas sobre o DF
+# compartilhado ou SQL embutido (PAINEL_BACKEND=sqlite|duckdb)
+@st.cache_resource(show_spinner=False, max_entries=2)
+def query_backend(arquivos, kml_path: str, kml_mtime: float, edicoes: int):
+    dfs, _ = load_data_with_coords(arquivos, kml_path, kml_mtime, edicoes)
+    # cada versão do diário tem seu banco (o SQL não enxerga o overlay)
+    dataset_fp = dataset_fingerprint(arquivos, kml_path)
+    return banco.open_backend(dfs, data_version(dataset_fp, edicoes))
+
+# Busca de espécies da barra lateral (mesmo analisador do assistente, ver analisador.py)
+@st.cache_resource(show_spinner=False)
+def name_search(arquivos, kml_path: str, kml_mtime: float, edicoes: int) -> analisador.NameSearch:
+    dfs, _ = load_data_with_coords(arquivos, kml_path, kml_mtime, edicoes)
+    names = [dfs[c].dropna() for c in SEARCH_COLUMNS if c in dfs.columns]
+    return analisador.NameSearch(pd.concat(names) if names else [])
 
-    return pd.DataFrame(rows).drop_duplicates(subset=["N tombo coleção"])
+def apply_taxonomy_node(tree: dict, node_id: str, key_prefix="f"):
+    """
+    Ajusta os filtros em cascata para o caminho do nó (ex.: Mammalia › Chiroptera):
+    níveis do caminho ficam com 1 valor, níveis abaixo voltam para "tudo".
+    Tem que rodar ANTES dos widgets da barra lateral serem criados.
+    """
+    path = node_path(tree, node_id)
+    for depth, col in enumerate(tree["levels"]):
+        key_ms = f"{key_prefix}_{col}_ms"
+        key_touched = f"{key_prefix}_{col}_touched"
+        if depth < len(path):
+            st.session_state[key_ms] = [path[depth]]
+            st.session_state[key_touched] = True
+        else:
+            st.session_state.pop(key_ms, None)
+            st.session_state[key_touched] = False
+
+# Agregados do mapa: recalculados só quando o estado dos filtros muda
+# (o DF vem com "_" para o Streamlit não precisar hashear ele a cada rerun)
+@st.cache_data(show_spinner=False, max_entries=32)
+def map_aggregates(filter_key: str, _df_geo: pd.DataFrame) -> pd.DataFrame:
+    return aggregate_points(_df_geo)
+
+# Payload mínimo da camada (posição + tooltip), pelo mesmo critério de cache
+@st.cache_data(show_spinner=False, max_entries=32)
+def map_layer_data(filter_key: str, agrupar: bool, _df_geo: pd.DataFrame) -> list[dict]:
+    if agrupar:
+        return aggregate_payload(map_aggregates(filter_key, _df_geo))
+    return point_payload(_df_geo)
 ## FUNÇÕES LLM ------------------
-OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://127.0.0.1:11434")
-DEFAULT_OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "llama3.2:3b")
-
-def _ollama_is_up() -> bool:
-    try:
-        r = requests.get(f"{OLLAMA_HOST}/api/tags", timeout=2.0)
-        return r.status_code == 200
-    except Exception:
-        return False
+# chamadas ao Ollama ficam em ollama_client.py e o caminho do RAG em assistente.py
+# (usados também fora do Streamlit)
+
+# Índice do assistente persistido em disco (ver rag_store.py), chaveado pela
+# fingerprint do dataset: na inicialização só abre os arquivos (mmap), e se uma
+# planilha mudar só a partição dela é refeita
+@st.cache_resource(show_spinner=False, max_entries=2)
+def build_bm25_index(dataset_fp: str, arquivos: tuple, kml_path: str):
+    return rag_store.load_or_build(list(arquivos), kml_path, dataset_fp=dataset_fp)
+
+# Consultas exatas (contagem, agrupamento, tombo...) sem LLM, ver consultas.py;
+# chaveadas pela versão com o diário, para verem as correções pendentes
+@st.cache_resource(show_spinner=False, max_entries=2)
+def query_engine(versao: str, _dfs: pd.DataFrame) -> dict:
+    return consultas.prepare(_dfs)
+
+# Fichas por espécie (ver especies.py): um banco por processo; os resumos do
+# modelo vêm do job em lote
+@st.cache_resource(show_spinner=False)
+def species_store() -> especies.SpeciesStore:
+    return especies.SpeciesStore()
 
-def _ollama_chat(model: str, messages: list[dict], temperature: float = 0.2) -> str:
+def ensure_species_facts(store: especies.SpeciesStore, versao: str, dfs: pd.DataFrame):
     """
-    Tenta usar /api/chat. Se não existir (404), cai para /api/generate.
-    Assim funciona em versões/instalações do Ollama que não suportam /api/chat.
+    Calcula na hora os fatos desta versão (planilhas + correções pendentes) se
+    ainda não estão no banco: o job em lote e o prewarm só conhecem as planilhas.
     """
-    temperature = float(temperature)
-
-    # --------
-    # 1) Tenta /api/chat
-    # --------
-    try:
-        payload = {
-            "model": model,
-            "messages": messages,
-            "stream": False,
-            "options": {"temperature": temperature},
-        }
-        r = requests.post(f"{OLLAMA_HOST}/api/chat", json=payload, timeout=180)
-
-        if r.status_code == 404:
-            raise RuntimeError("Ollama sem endpoint /api/chat (404)")
-
-        r.raise_for_status()
-        data = r.json()
-        content = (data.get("message") or {}).get("content", "")
-        content = (content or "").strip()
-        if content:
-            return content
-
-        # fallback se veio num formato inesperado
-        return str(data)
-
-    except Exception:
-        # --------
-        # 2) Fallback: /api/generate
-        # --------
-        # Converte messages -> um prompt único
-        # (mantém o comportamento "chat", mas usando generate)
-        system_parts = [m["content"] for m in messages if m.get("role") == "system" and m.get("content")]
-        user_parts = [m["content"] for m in messages if m.get("role") == "user" and m.get("content")]
-        assistant_parts = [m["content"] for m in messages if m.get("role") == "assistant" and m.get("content")]
-
-        system_text = "\n".join(system_parts).strip()
-        convo_text = ""
-        for m in messages:
-            role = m.get("role", "")
-            content = (m.get("content") or "").strip()
-            if not content:
-                continue
-            if role == "system":
-                continue
-            if role == "user":
-                convo_text += f"\nUSUÁRIO:\n{content}\n"
-            elif role == "assistant":
-                convo_text += f"\nASSISTENTE:\n{content}\n"
-            else:
-                convo_text += f"\n{role.upper()}:\n{content}\n"
-
-        prompt = ""
-        if system_text:
-            prompt += f"SISTEMA:\n{system_text}\n"
-        prompt += convo_text.strip()
-        prompt += "\n\nASSISTENTE:\n"
-
-        payload = {
-            "model": model,
-            "prompt": prompt,
-            "stream": False,
-            "options": {"temperature": temperature},
-        }
-        r = requests.post(f"{OLLAMA_HOST}/api/generate", json=payload, timeout=180)
-        r.raise_for_status()
-        data = r.json()
-        resp = (data.get("response") or "").strip()
-        return resp if resp else str(data)
-
-def _tokenize(text: str) -> list[str]:
-    text = (text or "").lower()
-    return re.findall(r"[a-zà-ú0-9]+", text)
-
-def _should_use_rag(question: str) -> bool:
-    q = (question or "").strip().lower()
-
-    # muito curto: geralmente é conversa
-    if len(q) <= 4:
-        return False
-
-    # saudações / small talk comuns
-    small_talk = {
-        "oi", "olá", "ola", "eai", "e aí", "bom dia", "boa tarde", "boa noite",
-        "tudo bem", "td bem", "blz", "beleza", "valeu", "obrigado", "obrigada"
-    }
-    if q in small_talk:
-        return False
-
-    return True
-
-def _row_to_doc(row: dict) -> str:
-    keys = ["N tombo coleção", "Nome cientifico", "Nome comum", "Municipio", "Familia","Ordem", "Data entrada"]
-    parts = []
-    for k in keys:
-        v = row.get(k)
-        if v is None or pd.isna(v):
-            continue
-        s = str(v).strip()
-        if not s:
-            continue
-        parts.append(f"{k}: {s}")
-    return " | ".join(parts)
-
-
+    if not store.has_dataset(versao):
+        especies.refresh_facts(store, dfs, versao, FOTOS_DIR)
+
+# Vetores (embeddings) do índice atual, calculados em segundo plano
+@st.cache_resource(show_spinner=False, max_entries=2)
+def get_vector_index(dataset_fp: str, embed_model: str, _index) -> embeddings.VectorIndex:
+    return embeddings.VectorIndex(_index, embed_model, ollama_client.embed)
+
+# Cache de respostas (ver answer_cache.py): um por versão do dataset;
+# ao trocar de versão, as respostas antigas são apagadas do disco
+@st.cache_resource(show_spinner=False, max_entries=1)
+def get_answer_cache(dataset_fp: str) -> AnswerCache:
+    cache = AnswerCache()
+    cache.keep_only(dataset_fp)
+    return cache
+
+# Fila compartilhada de pedidos ao modelo (ver llm_queue.py): uma por processo,
+# atende as sessões em ordem e com concorrência limitada
 @st.cache_resource(show_spinner=False)
-def build_bm25_index(docs: list[str]):
-    doc_tokens = []
-    df = Counter()
-    lengths = []
-
-    for d in docs:
-        toks = _tokenize(d)
-        doc_tokens.append(toks)
-        lengths.append(len(toks))
-        for t in set(toks):
-            df[t] += 1
-
-    avgdl = (sum(lengths) / len(lengths)) if lengths else 0.0
-    return {
-        "docs": docs,
-        "doc_tokens": doc_tokens,
-        "df": df,
-        "avgdl": avgdl,
-        "N": len(docs),
-    }
-
-def bm25_search(index, query: str, top_k: int = 4, k1: float = 1.5, b: float = 0.75):
-    q_tokens = _tokenize(query)
-    if not q_tokens or index["N"] == 0:
-        return []
-
-    scores = []
-    N = index["N"]
-    avgdl = index["avgdl"] or 1.0
-    df = index["df"]
-    docs = index["docs"]
-    doc_tokens = index["doc_tokens"]
-
-    q_counts = Counter(q_tokens)
-
-    for i, toks in enumerate(doc_tokens):
-        if not toks:
-            continue
-        dl = len(toks)
-        tf = Counter(toks)
-        score = 0.0
-
-        for term, qf in q_counts.items():
-            n_q = df.get(term, 0)
-            if n_q == 0:
-                continue
-            idf = math.log(1 + (N - n_q + 0.5) / (n_q + 0.5))
-            f = tf.get(term, 0)
-            if f == 0:
-                continue
-            denom = f + k1 * (1 - b + b * (dl / avgdl))
-            score += idf * (f * (k1 + 1) / denom)
-
-        if score > 0:
-            scores.append((score, docs[i]))
-
-    scores.sort(reverse=True, key=lambda x: x[0])
-    return scores[:top_k]
-
-def build_corpus_from_dataframes(dfs_full: pd.DataFrame, df_kml: pd.DataFrame) -> list[str]:
-    docs = []
-
-    if isinstance(dfs_full, pd.DataFrame) and not dfs_full.empty:
-        max_rows = min(len(dfs_full), 5000)
-        df_use = dfs_full.head(max_rows)
-        for _, r in df_use.iterrows():
-            docs.append(_row_to_doc(r.to_dict()))
-
-    if isinstance(df_kml, pd.DataFrame) and not df_kml.empty:
-        for _, r in df_kml.iterrows():
-            docs.append(
-                f"KML | N tombo coleção: {r.get('N tombo coleção')} | lat: {r.get('lat')} | lon: {r.get('lon')}"
-            )
-
-    return docs
-
-
-def answer_with_local_rag(question: str, model: str, index, max_context_docs: int = 4) -> str:
-    # 1) Gate: small talk não usa RAG
-    if not _should_use_rag(question):
-        return _ollama_chat(
-            model=model,
-            messages=[
-                {"role": "system", "content": "Você é um assistente cordial. Responda em português, curto e direto."},
-                {"role": "user", "content": question},
-            ],
-            temperature=0.2,
-        )
-
-    # 2) Recupera com score
-    scored = bm25_search(index, question, top_k=max_context_docs)
-
-    # 3) Limiar mínimo (evita “oi” virar espécie aleatória)
-    #    Ajuste fino: se tiver muitos falsos positivos, sobe para 2.0 / 3.0
-    MIN_SCORE = 1.2
-    kept = [(s, d) for (s, d) in scored if s >= MIN_SCORE]
-
-    # se nada relevante, responde SEM inventar
-    if not kept:
-        return _ollama_chat(
-            model=model,
-            messages=[
-                {"role": "system", "content": "Você é um assistente do Painel. Se não tiver dados suficientes, diga isso e sugira o que perguntar."},
-                {"role": "user", "content": f"Pergunta: {question}\n\nContexto: (nenhum trecho relevante encontrado)"},
-            ],
-            temperature=0.2,
-        )
-
-    # 4) Contexto curto e limitado
-    retrieved_docs = []
-    for s, d in kept:
-        d = d.strip()
-        if len(d) > 600:
-            d = d[:600] + "..."
-        retrieved_docs.append(f"[score={s:.2f}] {d}")
-
-    context = "\n".join([f"- {d}" for d in retrieved_docs])
-    if len(context) > 4000:
-        context = context[:4000] + "\n...(contexto cortado)"
-
-    system = (
-        "Você é um assistente do Painel de Coleção de Zoologia. "
-        "Responda em português, curto e objetivo. "
-        "Use SOMENTE o contexto fornecido. "
-        "Se a pergunta for geral demais, peça um 'N tombo coleção' ou um filtro (Município, Classe, etc.)."
-    )
-
-    user = f"Pergunta: {question}\n\nContexto (trechos recuperados do XLSX/KML):\n{context}"
+def get_llm_queue() -> LLMQueue:
+    return LLMQueue()
+
+def _job_status(queue: LLMQueue, job) -> str:
+    if job.status == "na_fila":
+        return f"Na fila (posição {queue.position(job)}) · {job.elapsed():.0f} s"
+    if job.first_token is None:
+        return f"Pensando (local)... {job.elapsed():.0f} s"
+    return f"Gerando · 1º token em {job.ttft():.1f} s · {job.elapsed():.0f} s"
+
+def _finish_job(job) -> dict:
+    # mensagem final do histórico a partir do job terminado
+    answer = job.text.strip()
+    if job.status == "erro":
+        answer = (answer + f"\n\nErro ao consultar o Ollama/local RAG: {job.error}").strip()
+    elif job.status == "cancelado":
+        answer = (answer + "\n\n_(resposta cancelada)_").strip()
+    caption = f"Respondido em {job.elapsed():.1f} s"
+    if job.ttft() is not None:
+        caption += f" (1º token em {job.ttft():.1f} s)"
+    return {"role": "assistant", "content": answer, "caption": caption}
+
+# Mantém os modelos carregados no Ollama (ver warm_keeper.py); começa a
+# carregar assim que o processo sobe, sem esperar a primeira pergunta
+@st.cache_resource(show_spinner=False)
+def get_warm_keeper() -> WarmKeeper:
+    return WarmKeeper([DEFAULT_OLLAMA_MODEL], embed_models=[embeddings.EMBED_MODEL])
 
-    return _ollama_chat(
-        model=model,
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user},
-        ],
-        temperature=0.2,
-    )
+@st.fragment(run_every=0.5)
+def pending_answer(queue: LLMQueue):
+    """
+    Mostra a resposta em andamento (fila/tokens) sem travar o resto da página:
+    só este trecho roda de novo a cada 0,5 s.
+    """
+    job = queue.get(st.session_state.get("llm_job"))
+    if job is None:
+        st.session_state.pop("llm_job", None)
+        return
+    queue.touch(job)
+
+    if not job.done:
+        with st.chat_message("assistant"):
+            if job.text:
+                st.markdown(job.text)
+            c1, c2 = st.columns([5, 1])
+            c1.caption(_job_status(queue, job))
+            if c2.button("Cancelar", key=f"cancel_{job.id}"):
+                queue.cancel(job)
+        return
+
+    # terminou: vai pro histórico e a página toda é redesenhada
+    st.session_state.chat_messages.append(_finish_job(job))
+    st.session_state.pop("llm_job", None)
+    st.rerun()
 #-------------------
 
 # -----------------------------------------
@@ -562,6 +385,10 @@ def answer_with_local_rag(question: str, model: str, index, max_context_docs: in
 # -----------------------------------------
 st.title("Painel de Gestão da Coleção - Laboratório de Zoologia IF Barbacena")
 
+# sessão ativa: mantém o modelo do assistente aquecido em segundo plano
+warm_keeper = get_warm_keeper()
+warm_keeper.activity()
+
 
 # logo (se existir)
 logo_path = Path("assets/logo_horizontal_barbacena-2.png")
@@ -570,7 +397,14 @@ FOTOS_DIR = Path("assets/fotos_colecao")
 FOTOS_DIR.mkdir(parents=True, exist_ok=True)
 
 KML_PATH = Path("assets/coordenadas/coletas.kml")
-df_kml = parse_kml_points(KML_PATH)
+
+# colunas consultadas pela busca de espécies da barra lateral
+SEARCH_COLUMNS = ["Nome cientifico", "Nome comum"]
+
+# mapa base: servidor local de tiles (subido pelo run_painel.py) ou Mapbox online
+TILES_URL = os.environ.get("PAINEL_TILES_URL", "").rstrip("/")
+MAP_STYLE = f"{TILES_URL}/style.json" if TILES_URL else "mapbox://styles/mapbox/satellite-streets-v12"
+kml_mtime = KML_PATH.stat().st_mtime if KML_PATH.exists() else 0.0
 
 if logo_path.exists():
     st.image(str(logo_path))
@@ -582,48 +416,18 @@ arquivos = [
     "dados_painel/Referência Reptilia.xlsx",
 ]
 
-dfs = load_data(arquivos)
-
 # ===============================
 # COORDENADAS (KML + FALLBACK)  ✅ ÚNICO BLOCO
 # ===============================
-dfs = dfs.copy()
-
-# garante chave limpa
-if "N tombo coleção" in dfs.columns:
-    dfs["N tombo coleção"] = dfs["N tombo coleção"].astype(str).str.strip()
-
-# remove qualquer coluna antiga de coordenadas pra evitar colisão
-for c in ["lat", "lon", "long"]:
-    if c in dfs.columns:
-        dfs.drop(columns=[c], inplace=True)
-
-# merge com KML (se existir)
-if "N tombo coleção" in dfs.columns and not df_kml.empty:
-    df_kml = df_kml.copy()
-    df_kml["N tombo coleção"] = df_kml["N tombo coleção"].astype(str).str.strip()
-    dfs = dfs.merge(df_kml, on="N tombo coleção", how="left")
-
-# garante que as colunas existam SEMPRE (mesmo se não tiver KML)
-if "lat" not in dfs.columns:
-    dfs["lat"] = pd.NA
-if "lon" not in dfs.columns:
-    dfs["lon"] = pd.NA
-
-# fallback só onde estiver vazio
-dfs["lat"] = pd.to_numeric(dfs["lat"], errors="coerce").fillna(-21.2264)
-dfs["lon"] = pd.to_numeric(dfs["lon"], errors="coerce").fillna(-43.7742)
-
-# seu padrão antigo usava "long"
-dfs["long"] = dfs["lon"]
+journal = get_journal()
+edicoes = journal.version()
+dfs, kml_report = load_data_with_coords(arquivos, str(KML_PATH), kml_mtime, edicoes)
 
 if dfs.empty:
     st.warning("Nenhum arquivo foi carregado. Verifique a pasta `dados_painel/` e os nomes dos arquivos.")
     st.stop()
 
 
-df_filtered = dfs.copy()
-
 # -----------------------
 # SIDEBAR: FILTROS (dinâmicos)
 # -----------------------
@@ -632,7 +436,8 @@ st.sidebar.header("Filtros")
 if st.sidebar.button("Limpar TODOS os filtros"):
     keys_to_delete = [
         k for k in st.session_state.keys()
-        if k.endswith("_ms") or k.endswith("_touched") or k.endswith("_range")
+        if k.endswith("_ms") or k.endswith("_touched") or k.endswith("_range") or k.startswith("tax_")
+        or k == "busca_especie"
     ]
     for k in keys_to_delete:
         del st.session_state[k]
@@ -652,16 +457,70 @@ filter_order = [
     "Sexo",
 ]
 
-df_filtered = dfs.copy()
+# condições dos filtros acumuladas num Filtro (posições de linha ou SQL);
+# o DF filtrado só é montado uma vez, no fim
+backend = query_backend(arquivos, str(KML_PATH), kml_mtime, edicoes)
+filtro = backend.filtro()
+if backend.aviso:
+    st.sidebar.caption(backend.aviso)
+elif backend.engine != "pandas":
+    st.sidebar.caption(f"Consultas no {backend.engine}")
+
+tax_tree = taxonomy_tree(arquivos, str(KML_PATH), kml_mtime, edicoes)
+tax_levels = tax_tree["levels"]
+
+# clique no sunburst (rodada anterior): aplica nos filtros antes de criar os widgets
+tax_pending = st.session_state.pop("tax_pending", None)
+if tax_pending:
+    apply_taxonomy_node(tax_tree, tax_pending)
+
+# estado dos filtros (vira a chave dos caches que dependem do filtro)
+filter_state = {"_linhas": int(dfs.shape[0])}
+
+tax_parents = None  # ids dos nós selecionados no nível taxonômico anterior
 
 for col in filter_order:
-    if col in df_filtered.columns:
-        selected = cascade_filter_autoall(df_filtered, col)
-        s = df_filtered[col].fillna("(vazio)").astype(str)
-        df_filtered = df_filtered[s.isin(selected)]
+    if col in dfs.columns:
+        if col in tax_levels:
+            # níveis taxonômicos: opções saem da árvore (sem varrer o DF)
+            nodes = children(tax_tree, tax_levels.index(col), tax_parents)
+            options = sorted(nodes["label"].unique())
+            selected = cascade_filter_autoall(dfs, col, options=options)
+            filter_state[col] = selected
+            tax_parents = nodes.loc[nodes["label"].isin(selected), "id"].tolist()
+            # rótulos da árvore = mesmos valores da coluna, então vira um isin comum
+            filtro.isin(col, selected, options)
+            continue
 
-if "Data entrada" in df_filtered.columns:
-    df_filtered = date_range_filter(df_filtered, "Data entrada")
+        # opções = valores presentes nas linhas que sobraram
+        options = filtro.options(col)
+        selected = cascade_filter_autoall(dfs, col, options=options)
+        filter_state[col] = selected
+        filtro.isin(col, selected, options)
+
+if "Data entrada" in dfs.columns:
+    date_range_filter(filtro, "Data entrada")
+    filter_state["Data entrada"] = st.session_state.get("d_Data entrada_range")
+
+# busca por nome: sem acento, singular/plural e com correção de digitação
+busca = st.sidebar.text_input(
+    "Buscar espécie", key="busca_especie", placeholder="nome científico ou comum",
+).strip()
+if busca:
+    nomes, corrigidos = name_search(arquivos, str(KML_PATH), kml_mtime, edicoes).search(busca)
+    filtro.any_in(SEARCH_COLUMNS, nomes)
+    filter_state["busca"] = busca
+    if corrigidos:
+        st.sidebar.caption("Buscando por: " + ", ".join(corrigidos.values()))
+    st.sidebar.caption(f"{len(nomes)} nome(s) encontrado(s).")
+
+# sem filtro nenhum, o próprio DF compartilhado (sem cópia)
+df_filtered = filtro.frame()
+
+# (a versão do diário de correções entra junto: uma correção muda os agregados)
+filter_key = hashlib.sha1(
+    json.dumps([filter_state, edicoes], sort_keys=True, default=str, ensure_ascii=False).encode("utf-8")
+).hexdigest()
 
 
 # -----------------------
@@ -669,44 +528,126 @@ if "Data entrada" in df_filtered.columns:
 # -----------------------
 kpi1, kpi2, kpi3, kpi4, kpi5 = st.columns(5)
 
+kpi = filtro.kpis()
+
 with kpi1:
-    st.metric("Quantidade de indivíduos", int(df_filtered.shape[0]))
+    st.metric("Quantidade de indivíduos", kpi["linhas"])
 
 with kpi2:
-    st.metric("Mamíferos", int(df_filtered.loc[df_filtered.get("Classe").astype(str) == "Mammalia"].shape[0]) if "Classe" in df_filtered.columns else 0)
+    st.metric("Mamíferos", kpi["Mammalia"])
 
 with kpi3:
-    st.metric("Aves", int(df_filtered.loc[df_filtered.get("Classe").astype(str) == "Aves"].shape[0]) if "Classe" in df_filtered.columns else 0)
+    st.metric("Aves", kpi["Aves"])
 
 with kpi4:
-    st.metric("Répteis", int(df_filtered.loc[df_filtered.get("Classe").astype(str) == "Reptilia"].shape[0]) if "Classe" in df_filtered.columns else 0)
+    st.metric("Répteis", kpi["Reptilia"])
 
 with kpi5:
-    st.metric("Anfíbios", int(df_filtered.loc[df_filtered.get("Classe").astype(str) == "Amphibia"].shape[0]) if "Classe" in df_filtered.columns else 0)
+    st.metric("Anfíbios", kpi["Amphibia"])
 
 
 kpi6, kpi7, kpi8, kpi9 = st.columns(4)
 
 with kpi6:
-    st.metric("Quantidade de ordens distintas", int(df_filtered.get("Ordem").nunique()))
+    st.metric("Quantidade de ordens distintas", kpi["Ordem"])
 with kpi7:
-    st.metric("Quantidade de famílias distintas", int(df_filtered.get("Familia").nunique()))
+    st.metric("Quantidade de famílias distintas", kpi["Familia"])
 with kpi8:
-    st.metric("Quantidade de espécies distintas", int(df_filtered.get("Nome cientifico").nunique()))
+    st.metric("Quantidade de espécies distintas", kpi["Nome cientifico"])
 with kpi9:
-    st.metric("Quantidade de municípios com coleta", int(df_filtered.get("Municipio").nunique()))
+    st.metric("Quantidade de municípios com coleta", kpi["Municipio"])
+
+# -----------------------
+# TAXONOMIA (sunburst com drill-down)
+# -----------------------
+import plotly.graph_objects as go
+
+if not tax_tree["nodes"].empty:
+    st.subheader("Taxonomia (clique num grupo para filtrar)")
+
+    tax_nodes = tax_tree["nodes"]
+    fig_tax = go.Figure(go.Sunburst(
+        ids=tax_nodes["id"],
+        labels=tax_nodes["label"],
+        parents=tax_nodes["parent"],
+        values=tax_nodes["count"],
+        customdata=tax_nodes["id"],
+        branchvalues="total",
+        maxdepth=3,
+        level=st.session_state.get("tax_applied") or "",
+        hovertemplate="<b>%{label}</b><br>%{value} exemplares<extra></extra>",
+    ))
+    fig_tax.update_layout(margin=dict(t=10, l=10, r=10, b=10), height=520)
+
+    tax_event = st.plotly_chart(
+        fig_tax,
+        use_container_width=True,
+        on_select="rerun",
+        selection_mode="points",
+        key="tax_sunburst",
+    )
+
+    tax_points = (tax_event or {}).get("selection", {}).get("points", []) if tax_event else []
+    if tax_points:
+        p = tax_points[0]
+        node_id = p.get("customdata") or p.get("id")
+        if node_id is None:
+            idx = p.get("point_index", p.get("point_number"))
+            node_id = tax_nodes["id"].iloc[idx] if idx is not None else None
+        if isinstance(node_id, list):
+            node_id = node_id[0] if node_id else None
+        if node_id and node_id != st.session_state.get("tax_applied"):
+            st.session_state["tax_applied"] = node_id
+            st.session_state["tax_pending"] = node_id
+            st.rerun()
 
 st.subheader("Amostragem dos Dados (clique numa linha para ver foto)")
 
-# Mostra a tabela com seleção de linha
-event = st.dataframe(
-    df_filtered,
-    use_container_width=True,
-    hide_index=True,
-    selection_mode="single-row",
-    on_select="rerun",
+modo_edicao = st.toggle(
+    "Corrigir registros",
+    key="modo_edicao",
+    help="Edite as células e salve: as correções aparecem na hora e ficam num diário "
+         "até serem gravadas nas planilhas (python app/correcoes.py compactar).",
 )
 
+event = None
+if modo_edicao:
+    # a chave muda com os filtros e com o diário: edição não salva não vai parar em outra linha
+    editor_key = f"editor_{filter_key}"
+    st.data_editor(
+        df_filtered,
+        use_container_width=True,
+        hide_index=True,
+        num_rows="fixed",
+        disabled=[c for c in df_filtered.columns if correcoes.is_readonly(c)],
+        key=editor_key,
+    )
+    alteradas = st.session_state.get(editor_key, {}).get("edited_rows", {})
+    if st.button(f"Salvar correções ({len(alteradas)} linha(s))", disabled=not alteradas):
+        # linha da tabela -> posição no dataset (o índice do df_filtered)
+        changes = {int(df_filtered.index[int(i)]): cols for i, cols in alteradas.items()}
+        n, recusadas = correcoes.record_edits(journal, dfs, kml_report, arquivos, changes)
+        st.toast(f"{n} correção(ões) salva(s)")
+        for motivo in recusadas:
+            st.toast(f"Não salva: coluna {motivo}", icon="⚠️")
+        st.rerun()
+else:
+    # Mostra a tabela com seleção de linha
+    event = st.dataframe(
+        df_filtered,
+        use_container_width=True,
+        hide_index=True,
+        selection_mode="single-row",
+        on_select="rerun",
+    )
+
+pendentes = journal.pending_count() if edicoes else 0
+if pendentes:
+    st.caption(
+        f"{pendentes} correção(ões) ainda não gravada(s) nas planilhas "
+        "(`python app/correcoes.py compactar`)."
+    )
+
 selected_tombo = None
 if event and "selection" in event and event["selection"].get("rows"):
     row_idx = event["selection"]["rows"][0]  # índice na visão atual do df_filtered
@@ -768,15 +709,10 @@ if uploaded_files:
 # -----------------------
 # CONTAGEM POR MUNICÍPIO
 # -----------------------
+import plotly.express as px
+
 if "Municipio" in df_filtered.columns:
-    municipio_count = (
-        df_filtered.assign(Municipio=df_filtered["Municipio"].fillna("(vazio)").astype(str))
-        .groupby("Municipio")
-        .size()
-        .reset_index(name="Contagem")
-        .sort_values(by="Contagem", ascending=False)
-        .reset_index(drop=True)
-    )
+    municipio_count = filtro.count_by("Municipio")
 
     fig_municipio = px.bar(
         municipio_count,
@@ -791,17 +727,7 @@ if "Municipio" in df_filtered.columns:
 # CONTAGEM POR MÊS
 # -----------------------
 if "Data entrada" in df_filtered.columns:
-    df_tmp = df_filtered.copy()
-    df_tmp["Data entrada"] = pd.to_datetime(df_tmp["Data entrada"], errors="coerce")
-    df_tmp["Mês"] = df_tmp["Data entrada"].dt.to_period("M").astype(str)
-
-    mes_count = (
-        df_tmp.dropna(subset=["Mês"])
-        .groupby("Mês")
-        .size()
-        .reset_index(name="Contagem")
-        .sort_values("Mês")
-    )
+    mes_count = filtro.count_by_month("Data entrada")
 
     fig_mes = px.bar(
         mes_count,
@@ -816,9 +742,9 @@ if "Data entrada" in df_filtered.columns:
 # BOXPLOT DO PESO
 # -----------------------
 if "Peso (g)" in df_filtered.columns:
-    df_box = df_filtered.copy()
-    df_box["Peso (g)"] = pd.to_numeric(df_box["Peso (g)"], errors="coerce")
-    df_box = df_box.dropna(subset=["Peso (g)"])
+    # só as linhas com peso (e o peso já como número)
+    peso = pd.to_numeric(df_filtered["Peso (g)"], errors="coerce")
+    df_box = df_filtered.loc[peso.notna()].assign(**{"Peso (g)": peso.dropna()})
 
     st.subheader("Boxplot do Peso (g) por variável categórica")
 
@@ -873,9 +799,9 @@ if "Peso (g)" in df_filtered.columns:
             "Cp internasal (mm)",
             "Cp carpo (mm)",
         ]
-        columns_to_describe = [c for c in columns_to_describe if c in df_box.columns]
-        if columns_to_describe:
-            st.dataframe(df_box[columns_to_describe].describe().T.round(2), use_container_width=True)
+        stats = filtro.describe(columns_to_describe, "Peso (g)")
+        if not stats.empty:
+            st.dataframe(stats.round(2), use_container_width=True)
     else:
         st.info("Nenhuma coluna categórica padrão (Nome cientifico/Familia/Sexo/Idade/Municipio) foi encontrada para o boxplot.")
 else:
@@ -885,56 +811,90 @@ else:
 # -----------------------
 # MAPA (pydeck)
 # -----------------------
+import pydeck as pdk
+
 st.subheader("Mapa de Coordenadas (WIP)")
 
-df_geo = df_filtered.copy()
+# só as colunas que o mapa usa (nada de mandar o DF inteiro pro navegador)
+geo_cols = ["lat", "lon", KML_COL, "N tombo coleção", "Nome cientifico"]
+df_geo = df_filtered.reindex(columns=geo_cols)
 df_geo["lat"] = pd.to_numeric(df_geo["lat"], errors="coerce")
 df_geo["lon"] = pd.to_numeric(df_geo["lon"], errors="coerce")
 df_geo = df_geo.dropna(subset=["lat", "lon"])
+df_geo["N tombo coleção"] = df_geo["N tombo coleção"].fillna("").astype(str)
+df_geo["Nome cientifico"] = df_geo["Nome cientifico"].fillna("").astype(str)
 
 if df_geo.empty:
     st.info("Sem coordenadas válidas para exibir no mapa.")
 else:
-    # enquadramento automático
-    view_state = pdk.data_utils.compute_view(df_geo[["lon", "lat"]])
-    view_state.pitch = 0
-    view_state.bearing = 0
+    agrupar = st.toggle(
+        "Agrupar pontos próximos",
+        value=True,
+        help="Agrupa os exemplares por região (com contagem). "
+             "Os exemplares sem coordenada no KML aparecem como um único marcador no local padrão.",
+    )
 
-    # garante colunas pro tooltip
-    if "N tombo coleção" not in df_geo.columns:
-        df_geo["N tombo coleção"] = ""
-    if "Nome cientifico" not in df_geo.columns:
-        df_geo["Nome cientifico"] = ""
+    layer_data = map_layer_data(filter_key, agrupar, df_geo)
 
-    layer = pdk.Layer(
-        "ScatterplotLayer",
-        data=df_geo,
-        get_position="[lon, lat]",
+    # enquadramento automático
+    view_state = pdk.data_utils.compute_view([r["p"] for r in layer_data])
+
+    if agrupar:
+        df_map = map_aggregates(filter_key, df_geo)
+
+        layer = pdk.Layer(
+            "ScatterplotLayer",
+            data=layer_data,
+            get_position="p",
+            get_fill_color="c",
+            get_radius="r",
+            radius_units="pixels",
+            pickable=True,
+            auto_highlight=True,
+            highlight_color=[0, 0, 0, 255],
+        )
+        tooltip_html = """
+            <b>{t}</b><br/>
+            <b>Espécies:</b> {e}
+            """
+        st.caption(
+            f"{int(df_map['n'].sum())} exemplares em {len(df_map)} marcadores "
+            f"({int(df_map.loc[df_map['fallback'], 'n'].sum())} sem coordenada no KML)."
+        )
+    else:
+        layer = pdk.Layer(
+            "ScatterplotLayer",
+            data=layer_data,
+            get_position="p",
 
-        # 🔴 cor forte (vermelho) com leve transparência
-        get_fill_color=[220, 38, 38, 180],   # RGBA
+            # 🔴 cor forte (vermelho) com leve transparência
+            get_fill_color=[220, 38, 38, 180],   # RGBA
 
-        # 🔹 ponto menor, consistente em qualquer zoom
-        get_radius=.004,
-        radius_units="pixels",
+            # 🔹 ponto menor, consistente em qualquer zoom
+            get_radius=.004,
+            radius_units="pixels",
 
-        pickable=True,
-        auto_highlight=True,
+            pickable=True,
+            auto_highlight=True,
 
-        # destaque no hover
-        highlight_color=[0, 0, 0, 255],
-    )
+            # destaque no hover
+            highlight_color=[0, 0, 0, 255],
+        )
+        tooltip_html = """
+            <b>N tombo coleção — Nome científico:</b><br/>
+            {t}
+            """
+
+    view_state.pitch = 0
+    view_state.bearing = 0
 
     st.pydeck_chart(
         pdk.Deck(
-            map_style="mapbox://styles/mapbox/satellite-streets-v12",
+            map_style=MAP_STYLE,
             initial_view_state=view_state,
             layers=[layer],
             tooltip={
-                "html": """
-                <b>N tombo coleção:</b> {N tombo coleção}<br/>
-                <b>Nome científico:</b> {Nome cientifico}
-                """,
+                "html": tooltip_html,
                 "style": {
                     "backgroundColor": "rgba(255,255,255,0.95)",
                     "color": "black",
@@ -945,72 +905,204 @@ else:
         )
     )
 
+with st.expander("Junção com o KML (tombos sem coordenada)", expanded=False):
+    st.write(
+        f"{kml_report['casadas']} de {kml_report['linhas']} exemplares com coordenada do KML; "
+        f"{kml_report['sem_tombo']} sem 'N tombo coleção'."
+    )
+    c1, c2 = st.columns(2)
+    with c1:
+        st.caption(f"Na planilha, sem ponto no KML ({len(kml_report['tombos_sem_kml'])})")
+        st.dataframe(pd.DataFrame({"Tombo": kml_report["tombos_sem_kml"]}), hide_index=True, use_container_width=True)
+    with c2:
+        st.caption(f"No KML, sem exemplar na planilha ({len(kml_report['kml_sem_tombo'])})")
+        st.dataframe(pd.DataFrame({"Tombo": kml_report["kml_sem_tombo"]}), hide_index=True, use_container_width=True)
+
+# -----------------------
+# FICHAS POR ESPÉCIE
+# -----------------------
+dataset_fp = dataset_fingerprint(arquivos, KML_PATH)
+versao = data_version(dataset_fp, edicoes)
+species = species_store()
+ensure_species_facts(species, versao, dfs)
+species_names = species.names(versao)
+
+st.subheader("Ficha da espécie")
+if species_names:
+    especie = st.selectbox("Espécie (Nome cientifico)", species_names, index=None, placeholder="Escolha uma espécie...")
+    ficha = species.get(versao, especie) if especie else None
+    if ficha:
+        fatos = ficha["fatos"]
+        taxon = " › ".join(fatos[k] for k in ["classe", "ordem", "familia"] if fatos.get(k))
+        st.caption(" · ".join(x for x in [fatos.get("nome_comum"), taxon] if x))
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("Exemplares", fatos["exemplares"])
+        m2.metric("Municípios", fatos.get("n_municipios", 0))
+        m3.metric("Com foto", fatos.get("com_foto", 0))
+        if fatos.get("primeira_entrada"):
+            m4.metric("Entradas", f"{fatos['primeira_entrada'][:4]}–{fatos['ultima_entrada'][:4]}")
+        if ficha["resumo"]:
+            st.markdown(ficha["resumo"])
+            st.caption(f"Resumo gerado por {ficha['modelo']} a partir dos fatos abaixo.")
+        else:
+            st.caption("Resumo ainda não gerado (rode `python app/especies.py --resumos`).")
+        c1, c2 = st.columns(2)
+        with c1:
+            if fatos.get("municipios"):
+                st.dataframe(pd.DataFrame(fatos["municipios"], columns=["Município", "Exemplares"]),
+                             hide_index=True, use_container_width=True)
+        with c2:
+            if fatos.get("medidas"):
+                medidas = pd.DataFrame.from_dict(fatos["medidas"], orient="index").rename(
+                    columns={"n": "N", "media": "Média", "min": "Mín.", "max": "Máx."})
+                st.dataframe(medidas, use_container_width=True)
+
 st.subheader("Assistente (pergunte sobre os arquivos)")
-if st.button("Inicializar assistente (warmup)"):
-    _ollama_chat(DEFAULT_OLLAMA_MODEL, [{"role":"user","content":"responda apenas: ok"}], temperature=0.0)
-    st.success("Assistente pronto.")
 
 # UI / Config
-c1, c2, c3 = st.columns([2, 1, 1])
+c1, c2, c3, c4 = st.columns([2, 1, 1, 1])
 with c1:
     model_name = st.text_input("Modelo Ollama", value=DEFAULT_OLLAMA_MODEL, help="Ex: llama3.2, mistral, phi3, etc.")
 with c2:
     topk = st.number_input("Top-K trechos", min_value=3, max_value=20, value=8, step=1)
 with c3:
     temp = st.slider("Temperatura", min_value=0.0, max_value=1.0, value=0.2, step=0.05)
+with c4:
+    context_tokens = st.number_input(
+        "Contexto (tokens)", min_value=300, max_value=8000, value=contexto.CONTEXT_TOKENS, step=100,
+        help="Limite aproximado de tokens dos trechos enviados ao modelo (prompt menor = 1ª palavra mais rápida).",
+    )
 
-ollama_ok = _ollama_is_up()
+ollama_ok = ollama_client.is_up()
 if not ollama_ok:
     st.warning(
         "Ollama não parece estar rodando. "
         "Instale o Ollama e abra o app, ou inicie o serviço, e tente novamente.\n\n"
         f"Host atual: {OLLAMA_HOST}"
     )
-
-# Cria o corpus e o índice (cacheado)
-# Use o DFS completo (antes do filtro) pra responder perguntas gerais,
-# e df_kml para coordenadas.
-corpus_docs = build_corpus_from_dataframes(dfs, df_kml)
-index = build_bm25_index(corpus_docs)
+else:
+    modelo = model_name.strip() or DEFAULT_OLLAMA_MODEL
+    warm_keeper.watch(modelo)
+    estado = warm_keeper.status.get(modelo)
+    if estado == "carregando":
+        st.caption(f"Carregando o modelo {modelo} na memória (em segundo plano)...")
+    elif estado == "carregado":
+        st.caption(f"Modelo {modelo} carregado na memória.")
+    elif estado == "falhou":
+        st.caption(f"Não foi possível carregar o modelo {modelo}. Ele está instalado? (ollama pull {modelo})")
+
+# Índice do assistente (cacheado), sobre todas as planilhas (antes do
+# filtro) pra responder perguntas gerais
+index = build_bm25_index(dataset_fp, tuple(arquivos), str(KML_PATH))
+answer_cache = get_answer_cache(dataset_fp)
+query_prep = query_engine(versao, dfs)
+
+# busca semântica: os embeddings são calculados em segundo plano na 1ª vez
+vectors = get_vector_index(dataset_fp, embeddings.EMBED_MODEL, index)
+if ollama_ok:
+    vectors.ensure_started()
+if vectors.ready:
+    st.caption(f"Busca semântica ativa ({embeddings.EMBED_MODEL}, {len(vectors.matrix)} trechos).")
+elif vectors.status == "calculando":
+    st.caption(f"Calculando embeddings ({embeddings.EMBED_MODEL}): {vectors.done}/{vectors.total} trechos novos. Enquanto isso, só busca por palavras.")
+elif vectors.status == "erro":
+    st.caption(f"Busca semântica indisponível ({embeddings.EMBED_MODEL}): {vectors.error}. Usando só busca por palavras.")
 
 if "chat_messages" not in st.session_state:
     st.session_state.chat_messages = [
         {"role": "assistant", "content": "Me pergunte algo sobre a coleção (dados e coordenadas). Ex: 'quantos por município?' ou 'onde foi coletado o tombo X?'"}
     ]
 
+llm_queue = get_llm_queue()
+
 for m in st.session_state.chat_messages:
     with st.chat_message(m["role"]):
         st.markdown(m["content"])
+        if m.get("table") is not None:
+            st.dataframe(m["table"], hide_index=True, use_container_width=True)
+        if m.get("caption"):
+            st.caption(m["caption"])
 
 prompt = st.chat_input("Pergunte algo...")
 
 if prompt:
+    # pergunta nova cancela a anterior que ainda estava pendente
+    old_job = llm_queue.get(st.session_state.pop("llm_job", None))
+    if old_job is not None:
+        llm_queue.cancel(old_job)
+        if old_job.done:
+            st.session_state.chat_messages.append(_finish_job(old_job))
+        else:
+            # ainda gerando: o worker para no próximo pedaço
+            partial = (old_job.text.strip() + "\n\n_(resposta cancelada)_").strip()
+            st.session_state.chat_messages.append({"role": "assistant", "content": partial})
+
+    # resumo das conversas anteriores (sem a pergunta atual), para perguntas de seguimento
+    history = contexto.history_summary(st.session_state.chat_messages)
     st.session_state.chat_messages.append({"role": "user", "content": prompt})
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    with st.chat_message("assistant"):
-        if not ollama_ok:
-            st.error("Sem Ollama rodando, não consigo chamar o modelo local.")
-            answer = "Ollama não está disponível."
-        else:
-            with st.spinner("Pensando (local)..."):
-                try:
-                    # (opcional) dica de schema
-                    schema_hint = ""
-                    if isinstance(dfs, pd.DataFrame) and not dfs.empty:
-                        cols = ", ".join(list(dfs.columns)[:50])
-                        schema_hint = f"\n\nColunas disponíveis: {cols}"
-                    answer = answer_with_local_rag(
-                        question=prompt + schema_hint,
-                        model=model_name.strip() or DEFAULT_OLLAMA_MODEL,
-                        index=index,
-                        max_context_docs=int(topk),
-                    )
-                except Exception as e:
-                    answer = f"Erro ao consultar o Ollama/local RAG: {e}"
-
-        st.markdown(answer)
-
-    st.session_state.chat_messages.append({"role": "assistant", "content": answer})
+    # perguntas de contagem/agrupamento/tombo: resposta exata, sem chamar o modelo
+    t0 = time.perf_counter()
+    exact = consultas.answer(prompt, query_prep)
+    answer = None
+    table = None
+    caption = None
+
+    # "o que temos de <espécie>?": ficha pré-calculada (especies.py)
+    especie = especies.find_species(prompt, species_names) if exact is None else None
+    ficha = species.get(versao, especie) if especie else None
+
+    if exact is not None:
+        answer = exact["texto"]
+        table = exact["tabela"]
+        caption = f"Consulta direta nos dados ({(time.perf_counter() - t0) * 1000:.0f} ms)."
+    elif ficha is not None:
+        answer = especies.facts_text(ficha["fatos"])
+        if ficha["resumo"]:
+            answer += "\n\n" + ficha["resumo"]
+        caption = f"Ficha pré-calculada da espécie ({(time.perf_counter() - t0) * 1000:.0f} ms)."
+    elif not ollama_ok:
+        st.error("Sem Ollama rodando, não consigo chamar o modelo local.")
+        answer = "Ollama não está disponível."
+    else:
+        # colunas vão no prompt de sistema (a pergunta é também a consulta da busca)
+        columns = list(dfs.columns) if isinstance(dfs, pd.DataFrame) and not dfs.empty else None
+        try:
+            with st.spinner("Buscando trechos..."):
+                cached, make_chunks = plan_answer(
+                    question=prompt,
+                    model=model_name.strip() or DEFAULT_OLLAMA_MODEL,
+                    index=index,
+                    max_context_docs=int(topk),
+                    temperature=float(temp),
+                    cache=answer_cache,
+                    dataset_fp=dataset_fp,
+                    vectors=vectors,
+                    columns=columns,
+                    history=history,
+                    context_tokens=int(context_tokens),
+                )
+            if cached is not None:
+                answer = cached
+                caption = "Resposta do cache (pergunta repetida)."
+            else:
+                # o modelo roda na fila compartilhada; a página segue respondendo
+                job = llm_queue.submit(st.session_state.setdefault("session_id", uuid.uuid4().hex), make_chunks)
+                st.session_state["llm_job"] = job.id
+        except Exception as e:
+            answer = f"Erro ao consultar o Ollama/local RAG: {e}"
+
+    if answer is not None:
+        with st.chat_message("assistant"):
+            st.markdown(answer)
+            if table is not None:
+                st.dataframe(table, hide_index=True, use_container_width=True)
+            if caption:
+                st.caption(caption)
+        st.session_state.chat_messages.append({"role": "assistant", "content": answer, "table": table, "caption": caption})
+
+if st.session_state.get("llm_job") is not None:
+    pending_answer(llm_queue)
 
@@ -0,0 +1,244 @@
+"""
+Busca densa (embeddings) do assistente, somada ao BM25.
+
+- Os documentos do corpus são enviados ao endpoint de embeddings do Ollama
+  em lotes. Cada vetor fica guardado em disco pelo hash do texto do
+  documento (.cache_painel/rag/emb/<modelo>/), então quando os dados mudam
+  só os documentos novos/alterados são calculados de novo.
+- Para o índice atual, os vetores (normalizados, float16) são gravados numa
+  matriz N x D ao lado do índice BM25 e abertos com mmap.
+- A busca é força bruta (produto escalar em blocos): com alguns milhares de
+  documentos é mais rápido que manter um IVF.
+- BM25 e vetores são combinados por Reciprocal Rank Fusion (RRF).
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from rag_store import RAG_DIR
+
+EMBED_MODEL = os.environ.get("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+EMBED_BATCH = 64
+
+# similaridade de cosseno mínima para um trecho entrar no contexto
+MIN_SIMILARITY = 0.35
+# constante do RRF (valor usual da literatura)
+RRF_K = 60
+# linhas por bloco no produto escalar (limita a memória por consulta)
+SEARCH_BLOCK = 65536
+
+EMB_DIR = RAG_DIR / "emb"
+
+
+def _slug(model: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", model)
+
+
+def doc_hash(doc: str) -> bytes:
+    # hex (e não o digest cru): o dtype "S" do NumPy corta bytes nulos no fim
+    return hashlib.sha1(doc.encode("utf-8")).hexdigest().encode("ascii")
+
+
+def _normalize(vecs) -> np.ndarray:
+    m = np.asarray(vecs, dtype=np.float32)
+    if m.ndim == 1:
+        m = m[None, :]
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+
+class EmbeddingStore:
+    """
+    Vetores já calculados, por hash do documento, em "shards" no disco
+    (<id>.hashes.npy + <id>.vecs.npy). Cada rodada grava um shard novo.
+    """
+
+    def __init__(self, model: str, folder: Path | None = None):
+        self.model = model
+        self.folder = Path(folder or EMB_DIR / _slug(model))
+        self._shards: list[np.ndarray] = []
+        self._where: dict[bytes, tuple[int, int]] = {}
+        self._load()
+
+    def _load(self):
+        if not self.folder.exists():
+            return
+        for h_path in sorted(self.folder.glob("*.hashes.npy")):
+            v_path = h_path.with_name(h_path.name.replace(".hashes.npy", ".vecs.npy"))
+            if not v_path.exists():
+                continue
+            hashes = np.load(h_path)
+            vecs = np.load(v_path, mmap_mode="r")
+            s = len(self._shards)
+            self._shards.append(vecs)
+            for row, h in enumerate(hashes.tolist()):
+                self._where[h] = (s, row)
+
+    def __contains__(self, h: bytes) -> bool:
+        return h in self._where
+
+    def get(self, h: bytes) -> np.ndarray:
+        s, row = self._where[h]
+        return self._shards[s][row]
+
+    def add(self, hashes: list[bytes], vecs: np.ndarray):
+        if not hashes:
+            return
+        self.folder.mkdir(parents=True, exist_ok=True)
+        name = f"{time.time_ns()}-{os.getpid()}"
+        h_arr = np.array(hashes, dtype="S40")
+        v_arr = np.asarray(vecs, dtype=np.float16)
+        # grava o .vecs antes do .hashes: shard sem .hashes é ignorado no _load
+        for suffix, arr in [(".vecs.npy", v_arr), (".hashes.npy", h_arr)]:
+            fd, tmp = tempfile.mkstemp(dir=self.folder, prefix=".tmp-", suffix=".npy")
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, arr)
+            os.replace(tmp, self.folder / f"{name}{suffix}")
+        s = len(self._shards)
+        self._shards.append(v_arr)
+        for row, h in enumerate(hashes):
+            self._where[h] = (s, row)
+
+
+def build_matrix(docs, model: str, embed_fn, store: EmbeddingStore | None = None,
+                 batch: int = EMBED_BATCH, progress=None) -> np.ndarray:
+    """
+    Matriz (N x D, float16, linhas normalizadas) alinhada com `docs`.
+    `embed_fn(model, textos)` só é chamada para os documentos que o
+    `store` ainda não tem. `progress(feitos, total)` é opcional.
+    """
+    store = store or EmbeddingStore(model)
+    hashes = [doc_hash(d) for d in docs]
+
+    # documentos repetidos (mesmo hash) só são calculados uma vez
+    todo, seen = [], set()
+    for i, h in enumerate(hashes):
+        if h not in store and h not in seen:
+            seen.add(h)
+            todo.append(i)
+
+    total = len(todo)
+    if progress:
+        progress(0, total)
+    for lo in range(0, total, batch):
+        ids = todo[lo:lo + batch]
+        vecs = _normalize(embed_fn(model, [docs[i] for i in ids]))
+        store.add([hashes[i] for i in ids], vecs)
+        if progress:
+            progress(min(lo + batch, total), total)
+
+    if not hashes:
+        return np.zeros((0, 0), dtype=np.float16)
+    return np.stack([store.get(h) for h in hashes]).astype(np.float16)
+
+
+def matrix_path(index_folder: Path, model: str) -> Path:
+    return Path(index_folder) / f"emb-{_slug(model)}.npy"
+
+
+def save_matrix(matrix: np.ndarray, path: Path):
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-", suffix=".npy")
+    with os.fdopen(fd, "wb") as f:
+        np.save(f, matrix)
+    os.replace(tmp, path)
+
+
+def vector_search(matrix: np.ndarray, query_vec, top_k: int = 4,
+                  min_similarity: float = MIN_SIMILARITY) -> list[tuple[float, int]]:
+    """
+    [(similaridade, doc_id), ...] em ordem decrescente (só >= min_similarity).
+    """
+    n = len(matrix)
+    if n == 0 or top_k <= 0:
+        return []
+    q = _normalize(query_vec)[0]
+    if matrix.shape[1] != q.shape[0]:
+        return []
+    sims = np.empty(n, dtype=np.float32)
+    for lo in range(0, n, SEARCH_BLOCK):
+        sims[lo:lo + SEARCH_BLOCK] = matrix[lo:lo + SEARCH_BLOCK].astype(np.float32) @ q
+    k = min(top_k, n)
+    cand = np.argpartition(-sims, k - 1)[:k]
+    cand = cand[np.argsort(-sims[cand], kind="stable")]
+    return [(float(sims[i]), int(i)) for i in cand if sims[i] >= min_similarity]
+
+
+def fuse(rankings: list[list[tuple[float, int]]], top_k: int = 4, k: int = RRF_K) -> list[tuple[float, int]]:
+    """
+    Reciprocal Rank Fusion: cada lista contribui 1 / (k + posição) por doc.
+    Retorna [(score_rrf, doc_id), ...] em ordem decrescente.
+    """
+    scores: dict[int, float] = {}
+    for ranking in rankings:
+        for pos, (_, doc_id) in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + pos + 1)
+    best = sorted(scores.items(), key=lambda kv: -kv[1])[:top_k]
+    return [(s, i) for i, s in best]
+
+
+class VectorIndex:
+    """
+    Vetores do índice atual, calculados em segundo plano (a página não
+    espera). Enquanto não fica pronto, o assistente usa só o BM25.
+    Estados: "pendente", "calculando", "pronto", "erro".
+    """
+
+    RETRY_AFTER = 60.0
+
+    def __init__(self, index: dict, model: str, embed_fn):
+        self.index = index
+        self.model = model
+        self.embed_fn = embed_fn
+        self.status = "pendente"
+        self.error = ""
+        self.done = 0
+        self.total = 0
+        self.matrix: np.ndarray | None = None
+        self._failed_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "pronto"
+
+    def ensure_started(self):
+        with self._lock:
+            if self.status in ("calculando", "pronto"):
+                return
+            if self.status == "erro" and time.monotonic() - self._failed_at < self.RETRY_AFTER:
+                return
+            self.status = "calculando"
+        threading.Thread(target=self._build, daemon=True, name="painel-embeddings").start()
+
+    def _progress(self, done: int, total: int):
+        self.done, self.total = done, total
+
+    def _build(self):
+        try:
+            if self.index.get("folder") is None:
+                # índice só em memória (ver rag_store.load_or_build): matriz também
+                self.matrix = build_matrix(self.index["docs"], self.model, self.embed_fn, progress=self._progress)
+                self.status = "pronto"
+                return
+            path = matrix_path(self.index["folder"], self.model)
+            if not path.exists():
+                matrix = build_matrix(self.index["docs"], self.model, self.embed_fn, progress=self._progress)
+                save_matrix(matrix, path)
+            self.matrix = np.load(path, mmap_mode="r")
+            self.status = "pronto"
+        except Exception as e:
+            self.error = str(e)
+            self._failed_at = time.monotonic()
+            self.status = "erro"
+
+    def search(self, query_vec, top_k: int = 4) -> list[tuple[float, int]]:
+        if not self.ready:
+            return []
+        return vector_search(self.matrix, query_vec, top_k=top_k)
@@ -0,0 +1,330 @@
+"""
+Fichas por espécie ("Nome cientifico"), calculadas em lote.
+
+Para cada espécie: número de exemplares, classificação, municípios, período
+de entrada, estatísticas das medidas (mm/g) e quantos exemplares têm foto.
+Opcionalmente o modelo local escreve um resumo curto a partir desses fatos.
+
+Tudo fica em .cache_painel/especies.sqlite:
+  - fatos     fatos de uma espécie, pelo hash do conteúdo
+  - resumos   texto do modelo, por (hash dos fatos, modelo)
+  - datasets  fingerprint do dataset -> espécie -> hash dos fatos
+
+Como o resumo é guardado pelo hash dos fatos, quando as planilhas mudam só
+as espécies cujos fatos mudaram precisam de resumo novo; e o job grava um
+resumo por vez, então se for interrompido continua de onde parou.
+
+Uso (na raiz do projeto):
+    python app/especies.py                  # só os fatos
+    python app/especies.py --resumos        # + resumos do modelo local
+"""
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+
+import snapshot
+from analisador import fold
+from cache_painel import BASE_DIR, cache_path, dataset_fingerprint
+from dados import ARQUIVOS, FOTOS_DIR, KML_PATH
+
+NAME_COL = "Nome cientifico"
+TOMBO_COL = "N tombo coleção"
+DATE_COL = "Data entrada"
+# colunas de classificação (valor mais frequente da espécie)
+TAXON_COLS = ["Nome comum", "Classe", "Ordem", "Familia"]
+MUNICIPIO_COL = "Municipio"
+PHOTO_COL = "Foto"
+PHOTO_EXTS = {".png", ".jpg", ".jpeg", ".webp"}
+TOP_MUNICIPIOS = 10
+
+# "o que temos de X?", "fale sobre X", "resumo de X", ou só "X"
+_ABOUT_RE = re.compile(
+    r"^(?:o que (?:temos|tem|ha|existe)|(?:me )?fal[ae](?: me)?|resumo|ficha|informac(?:ao|oes)|dados)?"
+    r"(?: (?:de|do|da|dos|das|sobre|a respeito de))?(?: (?:especie|exemplares))?(?: (?:de|do|da))?$"
+)
+
+
+def _is_measure(col: str) -> bool:
+    return col.endswith("(mm)") or col.endswith("(g)")
+
+
+def _clean(s: pd.Series) -> pd.Series:
+    s = s.astype("string").str.strip()
+    return s.where(s != "")
+
+
+def _value_counts(names: pd.Series, values: pd.Series) -> pd.DataFrame:
+    # (espécie, valor, n) em ordem decrescente de n dentro de cada espécie
+    vc = pd.DataFrame({"k": names, "v": _clean(values)}).dropna().value_counts().reset_index(name="n")
+    return vc.sort_values(["k", "n", "v"], ascending=[True, False, True], kind="stable")
+
+
+def _photo_names(fotos_dir) -> str:
+    # nomes dos arquivos de foto numa string só (busca por substring, como find_photos_by_tombo)
+    folder = Path(fotos_dir) if fotos_dir else None
+    if folder is None or not folder.is_dir():
+        return ""
+    return "\n".join(p.name.lower() for p in folder.iterdir() if p.is_file() and p.suffix.lower() in PHOTO_EXTS)
+
+
+def species_facts(df: pd.DataFrame, fotos_dir=None) -> dict[str, dict]:
+    """
+    Nome científico -> fatos (só tipos JSON: números, textos, listas).
+    Cada campo é calculado para todas as espécies de uma vez (groupby).
+    """
+    if not isinstance(df, pd.DataFrame) or df.empty or NAME_COL not in df.columns:
+        return {}
+    names = _clean(df[NAME_COL])
+    df = df[names.notna()]
+    names = names[df.index]
+    sizes = names.value_counts()
+    out = {name: {"nome": name, "exemplares": int(n)} for name, n in sorted(sizes.items())}
+
+    for col in TAXON_COLS:
+        if col in df.columns:
+            key = fold(col).replace(" ", "_")
+            modes = _value_counts(names, df[col]).drop_duplicates("k")
+            for name in out:
+                out[name][key] = None
+            for name, v in zip(modes["k"], modes["v"]):
+                out[name][key] = v
+
+    if MUNICIPIO_COL in df.columns:
+        vc = _value_counts(names, df[MUNICIPIO_COL])
+        for name in out:
+            out[name]["municipios"], out[name]["n_municipios"] = [], 0
+        for name, g in vc.groupby("k", sort=False):
+            out[name]["municipios"] = [[m, int(n)] for m, n in zip(g["v"].head(TOP_MUNICIPIOS), g["n"])]
+            out[name]["n_municipios"] = int(len(g))
+
+    if DATE_COL in df.columns:
+        dates = pd.to_datetime(df[DATE_COL], errors="coerce").groupby(names).agg(["min", "max"])
+        for name, lo, hi in zip(dates.index, dates["min"], dates["max"]):
+            out[name]["primeira_entrada"] = None if pd.isna(lo) else lo.date().isoformat()
+            out[name]["ultima_entrada"] = None if pd.isna(hi) else hi.date().isoformat()
+
+    measures = [c for c in df.columns if _is_measure(str(c))]
+    for name in out:
+        out[name]["medidas"] = {}
+    if measures:
+        nums = df[measures].apply(pd.to_numeric, errors="coerce")
+        long = nums.assign(_k=names).melt(id_vars="_k", var_name="col").dropna()
+        agg = long.groupby(["_k", "col"], sort=False)["value"].agg(["count", "mean", "min", "max"])
+        order = {c: i for i, c in enumerate(measures)}
+        for (name, col), (n, mean, lo, hi) in sorted(agg.iterrows(), key=lambda r: (r[0][0], order[r[0][1]])):
+            out[name]["medidas"][col] = {"n": int(n), "media": round(float(mean), 2),
+                                         "min": round(float(lo), 2), "max": round(float(hi), 2)}
+
+    with_photo = pd.Series(False, index=df.index)
+    if PHOTO_COL in df.columns:
+        with_photo |= _clean(df[PHOTO_COL]).str.lower().isin(["sim", "s", "x"]).fillna(False).astype(bool)
+    photos = _photo_names(fotos_dir)
+    if photos and TOMBO_COL in df.columns:
+        tombos = _clean(df[TOMBO_COL]).str.lower()
+        with_photo |= tombos.map(lambda t: isinstance(t, str) and t in photos, na_action=None).astype(bool)
+    for name, n in with_photo.groupby(names).sum().items():
+        out[name]["com_foto"] = int(n)
+    return out
+
+
+def facts_hash(facts: dict) -> str:
+    return hashlib.sha1(json.dumps(facts, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def facts_text(facts: dict) -> str:
+    """
+    Fatos em texto corrido (markdown), para o assistente e para o prompt do resumo.
+    """
+    lines = [f"**{facts['nome']}**" + (f" ({facts['nome_comum']})" if facts.get("nome_comum") else "")]
+    taxon = " › ".join(facts[k] for k in ["classe", "ordem", "familia"] if facts.get(k))
+    if taxon:
+        lines.append(f"- Classificação: {taxon}")
+    lines.append(f"- Exemplares na coleção: {facts['exemplares']} ({facts.get('com_foto', 0)} com foto)")
+    if facts.get("municipios"):
+        mun = ", ".join(f"{m} ({n})" for m, n in facts["municipios"])
+        extra = facts.get("n_municipios", 0) - len(facts["municipios"])
+        lines.append(f"- Municípios: {mun}" + (f" e mais {extra}" if extra > 0 else ""))
+    if facts.get("primeira_entrada"):
+        lines.append(f"- Entradas entre {facts['primeira_entrada']} e {facts['ultima_entrada']}")
+    for col, s in facts.get("medidas", {}).items():
+        lines.append(f"- {col}: média {s['media']} (mín. {s['min']}, máx. {s['max']}; n={s['n']})")
+    return "\n".join(lines)
+
+
+def find_species(question: str, names) -> str | None:
+    """
+    Espécie citada numa pergunta do tipo "o que temos de X?" / "fale sobre X" / "X".
+    Perguntas com outros termos (contagem por ano etc.) ficam para consultas.py/LLM.
+    """
+    q = fold(question).strip(" ?!.")
+    for name in sorted(names, key=len, reverse=True):
+        f = fold(name)
+        if len(f) < 4 or f not in q:
+            continue
+        rest = re.sub(r"\s+", " ", q.replace(f, " ")).strip(" ?!.,")
+        if _ABOUT_RE.match(rest):
+            return name
+    return None
+
+
+class SpeciesStore:
+    """
+    Fatos e resumos por espécie em SQLite (ver o topo do módulo).
+    """
+
+    def __init__(self, path=None):
+        self.path = path or cache_path("especies.sqlite")
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(str(self.path), check_same_thread=False, timeout=5)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.executescript(
+            "CREATE TABLE IF NOT EXISTS fatos (hash TEXT PRIMARY KEY, nome TEXT, fatos TEXT);"
+            "CREATE TABLE IF NOT EXISTS resumos (hash TEXT, modelo TEXT, resumo TEXT, criado REAL,"
+            " PRIMARY KEY (hash, modelo));"
+            "CREATE TABLE IF NOT EXISTS datasets (dataset_fp TEXT, nome TEXT, hash TEXT,"
+            " PRIMARY KEY (dataset_fp, nome));"
+        )
+        self._con.commit()
+
+    def has_dataset(self, dataset_fp: str) -> bool:
+        with self._lock:
+            return self._con.execute("SELECT 1 FROM datasets WHERE dataset_fp=? LIMIT 1", (dataset_fp,)).fetchone() is not None
+
+    def put_facts(self, dataset_fp: str, facts_by_name: dict[str, dict]) -> int:
+        """
+        Grava os fatos desta versão do dataset. Retorna quantas espécies são novas ou mudaram.
+        """
+        rows = [(name, facts_hash(f), f) for name, f in facts_by_name.items()]
+        with self._lock:
+            known = {h for (h,) in self._con.execute("SELECT hash FROM fatos")}
+            self._con.executemany(
+                "INSERT OR IGNORE INTO fatos VALUES (?, ?, ?)",
+                [(h, name, json.dumps(f, ensure_ascii=False)) for name, h, f in rows],
+            )
+            self._con.execute("DELETE FROM datasets WHERE dataset_fp=?", (dataset_fp,))
+            self._con.executemany("INSERT INTO datasets VALUES (?, ?, ?)", [(dataset_fp, name, h) for name, h, _ in rows])
+            self._con.commit()
+        return sum(1 for _, h, _ in rows if h not in known)
+
+    def names(self, dataset_fp: str) -> list[str]:
+        with self._lock:
+            return [n for (n,) in self._con.execute("SELECT nome FROM datasets WHERE dataset_fp=? ORDER BY nome", (dataset_fp,))]
+
+    def get(self, dataset_fp: str, name: str) -> dict | None:
+        """
+        {"fatos": ..., "resumo": texto ou None, "modelo": ...} (resumo mais recente, de qualquer modelo).
+        """
+        with self._lock:
+            row = self._con.execute(
+                "SELECT f.fatos, r.resumo, r.modelo FROM datasets d JOIN fatos f ON f.hash = d.hash"
+                " LEFT JOIN resumos r ON r.hash = d.hash"
+                " WHERE d.dataset_fp=? AND d.nome=? ORDER BY r.criado DESC LIMIT 1",
+                (dataset_fp, name),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"fatos": json.loads(row[0]), "resumo": row[1], "modelo": row[2]}
+
+    def pending(self, dataset_fp: str, model: str) -> list[tuple[str, dict]]:
+        """
+        Espécies do dataset ainda sem resumo deste modelo: [(hash, fatos), ...].
+        """
+        with self._lock:
+            rows = self._con.execute(
+                "SELECT f.hash, f.fatos FROM datasets d JOIN fatos f ON f.hash = d.hash"
+                " LEFT JOIN resumos r ON r.hash = d.hash AND r.modelo = ?"
+                " WHERE d.dataset_fp=? AND r.hash IS NULL ORDER BY d.nome",
+                (model, dataset_fp),
+            ).fetchall()
+        return [(h, json.loads(f)) for h, f in rows]
+
+    def put_summary(self, h: str, model: str, text: str):
+        with self._lock:
+            self._con.execute("INSERT OR REPLACE INTO resumos VALUES (?, ?, ?, ?)", (h, model, text, time.time()))
+            self._con.commit()
+
+    def keep_only(self, dataset_fp: str):
+        """
+        Esquece as outras versões do dataset (e fatos/resumos que só elas usavam).
+        """
+        with self._lock:
+            self._con.execute("DELETE FROM datasets WHERE dataset_fp<>?", (dataset_fp,))
+            self._con.execute("DELETE FROM fatos WHERE hash NOT IN (SELECT hash FROM datasets)")
+            self._con.execute("DELETE FROM resumos WHERE hash NOT IN (SELECT hash FROM datasets)")
+            self._con.commit()
+
+
+def summary_messages(facts: dict) -> list[dict]:
+    return [
+        {"role": "system", "content": (
+            "Você escreve fichas curtas de uma coleção zoológica. Responda em português, "
+            "em 2 a 4 frases, usando SOMENTE os fatos fornecidos (não invente hábitos nem distribuição)."
+        )},
+        {"role": "user", "content": f"Fatos da espécie na coleção:\n{facts_text(facts)}\n\nEscreva o resumo."},
+    ]
+
+
+def load_dataset(arquivos, kml_path) -> pd.DataFrame:
+    # o mesmo dataset pronto que o painel usa (ver snapshot.py), para as fichas baterem
+    return snapshot.load_with_coords(arquivos, kml_path)[0]
+
+
+def refresh_facts(store: SpeciesStore, df: pd.DataFrame, dataset_fp: str, fotos_dir=None) -> int:
+    changed = store.put_facts(dataset_fp, species_facts(df, fotos_dir))
+    store.keep_only(dataset_fp)
+    return changed
+
+
+def _log(msg: str):
+    print(msg, flush=True)
+
+
+def run(arquivos=None, kml_path=None, fotos_dir=None, model: str | None = None,
+        store: SpeciesStore | None = None, log=_log) -> str:
+    """
+    Job em lote: fatos de todas as espécies e, com `model`, os resumos que faltam.
+    Retorna a fingerprint do dataset processado.
+    """
+    arquivos = [str(BASE_DIR / p) for p in (arquivos or ARQUIVOS)]
+    kml_path = str(BASE_DIR / (kml_path or KML_PATH))
+    store = store or SpeciesStore()
+    dataset_fp = dataset_fingerprint(arquivos, kml_path)
+
+    df = load_dataset(arquivos, kml_path)
+    changed = refresh_facts(store, df, dataset_fp, BASE_DIR / (fotos_dir or FOTOS_DIR))
+    log(f"{len(store.names(dataset_fp))} espécies ({changed} novas ou alteradas), dataset {dataset_fp}")
+
+    if model:
+        import ollama_client
+
+        todo = store.pending(dataset_fp, model)
+        log(f"{len(todo)} resumos a gerar com {model}")
+        for i, (h, facts) in enumerate(todo, 1):
+            t0 = time.perf_counter()
+            text = ollama_client.chat(model, summary_messages(facts), temperature=0.2).strip()
+            if text:
+                store.put_summary(h, model, text)
+            log(f"[{i}/{len(todo)}] {facts['nome']} ({time.perf_counter() - t0:.1f} s)")
+    return dataset_fp
+
+
+def main(argv=None):
+    from ollama_client import DEFAULT_OLLAMA_MODEL
+
+    ap = argparse.ArgumentParser(description="Fichas/resumos por espécie do painel")
+    ap.add_argument("--resumos", action="store_true", help="gera os resumos que faltam com o modelo local")
+    ap.add_argument("--modelo", default=DEFAULT_OLLAMA_MODEL, help="modelo do Ollama para os resumos")
+    args = ap.parse_args(argv)
+    run(model=args.modelo if args.resumos else None)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
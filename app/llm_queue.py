@@ -0,0 +1,176 @@
+"""
+Fila de pedidos ao modelo local, compartilhada por todas as sessões.
+
+O Ollama roda numa CPU só; se cada sessão chamar o modelo direto, os
+pedidos se atropelam e a página de quem perguntou fica travada até o fim.
+Aqui cada pergunta vira um `Job` numa fila FIFO, atendida por um número
+fixo de workers (concorrência limitada). A página só consulta o job
+(posição na fila, texto parcial, tempos) e continua respondendo.
+
+Um job é cancelado quando:
+  - a sessão pede (botão "Cancelar" ou nova pergunta);
+  - a sessão some: quem espera a resposta chama `touch()` periodicamente;
+    sem sinal por `STALE_AFTER` segundos, o job é descartado.
+Cancelar no meio da geração fecha o gerador (e a conexão com o Ollama).
+"""
+import itertools
+import os
+import threading
+import time
+from collections import deque
+
+MAX_CONCURRENT = int(os.environ.get("PAINEL_LLM_CONCURRENCY", "1"))
+
+# sessão sem dar sinal por esse tempo = aba fechada
+STALE_AFTER = 15.0
+# jobs terminados ficam disponíveis por esse tempo (depois são esquecidos)
+KEEP_FINISHED = 300.0
+
+
+class Job:
+    """
+    Um pedido na fila. Estados: "na_fila", "gerando", "pronto", "erro", "cancelado".
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, session_id: str, make_chunks):
+        self.id = next(self._ids)
+        self.session_id = session_id
+        self.make_chunks = make_chunks
+        self.status = "na_fila"
+        self.error = ""
+        self.chunks: list[str] = []
+        self.created = time.monotonic()
+        self.started: float | None = None
+        self.first_token: float | None = None
+        self.finished: float | None = None
+        self.last_seen = self.created
+        self._cancel = threading.Event()
+
+    @property
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("pronto", "erro", "cancelado")
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.created
+
+    def ttft(self) -> float | None:
+        return None if self.first_token is None else self.first_token - self.created
+
+
+class LLMQueue:
+    """
+    Fila FIFO + `max_concurrent` threads de trabalho.
+    """
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT, stale_after: float = STALE_AFTER):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.stale_after = stale_after
+        self._pending: deque[Job] = deque()
+        self._jobs: dict[int, Job] = {}
+        self._cond = threading.Condition()
+        for i in range(self.max_concurrent):
+            threading.Thread(target=self._worker, daemon=True, name=f"painel-llm-{i}").start()
+
+    # ---- lado da sessão ----
+    def submit(self, session_id: str, make_chunks) -> Job:
+        """
+        Enfileira `make_chunks()` (função que devolve um iterável de pedaços de texto).
+        """
+        job = Job(session_id, make_chunks)
+        with self._cond:
+            self._forget_old()
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            self._cond.notify()
+        return job
+
+    def get(self, job_id: int) -> Job | None:
+        return self._jobs.get(job_id)
+
+    def position(self, job: Job) -> int:
+        """
+        1 = próximo a ser atendido; 0 = já saiu da fila.
+        """
+        with self._cond:
+            for i, j in enumerate(self._pending):
+                if j is job:
+                    return i + 1
+        return 0
+
+    def running(self) -> int:
+        return sum(1 for j in list(self._jobs.values()) if j.status == "gerando")
+
+    def touch(self, job: Job):
+        job.last_seen = time.monotonic()
+
+    def cancel(self, job: Job):
+        job._cancel.set()
+        with self._cond:
+            if job in self._pending:
+                self._pending.remove(job)
+                self._finish(job, "cancelado")
+
+    def cancel_session(self, session_id: str):
+        for job in list(self._jobs.values()):
+            if job.session_id == session_id and not job.done:
+                self.cancel(job)
+
+    # ---- workers ----
+    def _stale(self, job: Job) -> bool:
+        return time.monotonic() - job.last_seen > self.stale_after
+
+    def _finish(self, job: Job, status: str, error: str = ""):
+        job.status = status
+        job.error = error
+        job.finished = time.monotonic()
+
+    def _forget_old(self):
+        now = time.monotonic()
+        for jid, job in list(self._jobs.items()):
+            if job.done and now - job.finished > KEEP_FINISHED:
+                del self._jobs[jid]
+
+    def _next_job(self) -> Job:
+        with self._cond:
+            while True:
+                while not self._pending:
+                    self._cond.wait()
+                job = self._pending.popleft()
+                if job.cancelled or self._stale(job):
+                    self._finish(job, "cancelado")
+                    continue
+                job.status = "gerando"
+                job.started = time.monotonic()
+                return job
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            chunks = None
+            try:
+                chunks = iter(job.make_chunks())
+                for piece in chunks:
+                    if job.first_token is None:
+                        job.first_token = time.monotonic()
+                    job.chunks.append(piece)
+                    if job.cancelled or self._stale(job):
+                        job._cancel.set()
+                        break
+                self._finish(job, "cancelado" if job.cancelled else "pronto")
+            except Exception as e:
+                self._finish(job, "erro", str(e))
+            finally:
+                # fecha o gerador: encerra o streaming HTTP se foi cancelado no meio
+                close = getattr(chunks, "close", None)
+                if close is not None:
+                    close()
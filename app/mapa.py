@@ -0,0 +1,209 @@
+"""
+Agregação dos pontos do mapa (pydeck) no servidor.
+
+Em vez de mandar um ponto por exemplar para o navegador, os pontos são
+agrupados em células de grade (lat/lon) com contagem e lista de espécies.
+Os exemplares sem coordenada no KML (que caem no ponto padrão, marcados
+na coluna `KML_COL` do dataset) viram UM marcador só, com rótulo próprio.
+
+Também monta o payload mínimo das camadas: JSON simples, um registro por
+ponto só com a posição (arredondada) e os campos do tooltip, em vez do DF
+inteiro serializado.
+"""
+import numpy as np
+import pandas as pd
+
+# ponto usado quando o tombo não tem coordenada no KML
+FALLBACK_LAT = -21.2264
+FALLBACK_LON = -43.7742
+FALLBACK_LABEL = "Local padrão (sem coordenada no KML)"
+# coluna do dataset: True quando lat/lon vieram do KML, False no ponto padrão
+# (um exemplar de verdade pode estar a metros do ponto padrão, no campus)
+KML_COL = "coord_kml"
+
+# tamanho inicial da célula da grade, em graus (~1,1 km)
+GRID_CELL_DEG = 0.01
+
+# teto de marcadores enviados ao mapa (a célula cresce até caber)
+MAX_CELLS = 2000
+
+# quantas espécies listar no tooltip de cada marcador
+MAX_SPECIES_PER_CELL = 5
+
+# casas decimais das posições no payload (5 casas ~ 1 m)
+POSITION_DECIMALS = 5
+
+# cores RGBA dos marcadores
+COLOR_POINT = [220, 38, 38, 180]
+COLOR_FALLBACK = [245, 158, 11, 200]
+
+
+def _cell_keys(lat: np.ndarray, lon: np.ndarray, cell_deg: float) -> np.ndarray:
+    # índice inteiro da célula; |ix| < 2e6 para qualquer célula >= 0.0001°
+    iy = np.floor(lat / cell_deg).astype(np.int64)
+    ix = np.floor(lon / cell_deg).astype(np.int64)
+    return iy * 4_000_000 + ix
+
+
+def _species_summary(cells: np.ndarray, especies: pd.Series, max_species: int) -> pd.Series:
+    """
+    Texto "Espécie A (3), Espécie B (1) +N outras" por célula.
+    """
+    s = pd.DataFrame({
+        "cell": cells,
+        "especie": especies.fillna("(vazio)").astype(str).str.strip().to_numpy(),
+    })
+    cont = (
+        s.groupby(["cell", "especie"], sort=False)
+        .size()
+        .reset_index(name="n")
+        .sort_values(["cell", "n"], ascending=[True, False])
+    )
+    total = cont.groupby("cell").size()
+    top = cont.groupby("cell").head(max_species)
+
+    txt = (top["especie"] + " (" + top["n"].astype(str) + ")").groupby(top["cell"]).agg(", ".join)
+    extra = (total - max_species).clip(lower=0).reindex(txt.index)
+    sufixo = pd.Series(np.where(extra > 0, " +" + extra.astype(str) + " outras", ""), index=txt.index)
+    return txt + sufixo
+
+
+def _marker_radius(n: pd.Series) -> pd.Series:
+    # raio em pixels: cresce com a raiz da contagem, com teto
+    return (4 + 3 * np.sqrt(n.astype("float64"))).clip(upper=40)
+
+
+def aggregate_points(
+    df_geo: pd.DataFrame,
+    cell_deg: float = GRID_CELL_DEG,
+    max_cells: int = MAX_CELLS,
+    max_species: int = MAX_SPECIES_PER_CELL,
+) -> pd.DataFrame:
+    """
+    Agrupa os exemplares em células de grade e retorna 1 linha por marcador:
+      - 'lat', 'lon'   centroide da célula
+      - 'n'            quantidade de exemplares
+      - 'rotulo'       tombo (se for 1 exemplar) ou "N exemplares"
+      - 'especies'     espécies mais frequentes da célula
+      - 'fallback'     True no marcador do local padrão
+      - 'raio'         raio do marcador (pixels)
+
+    O número de linhas nunca passa de `max_cells` (+1 do local padrão):
+    se houver células demais, a célula dobra de tamanho até caber.
+    """
+    out_cols = ["lat", "lon", "n", "rotulo", "especies", "fallback", "raio"]
+    if df_geo is None or df_geo.empty:
+        return pd.DataFrame(columns=out_cols)
+
+    lat = pd.to_numeric(df_geo["lat"], errors="coerce").to_numpy(dtype="float64")
+    lon = pd.to_numeric(df_geo["lon"], errors="coerce").to_numpy(dtype="float64")
+    tombo = df_geo.get("N tombo coleção", pd.Series("", index=df_geo.index))
+    especie = df_geo.get("Nome cientifico", pd.Series("", index=df_geo.index))
+    do_kml = df_geo.get(KML_COL, pd.Series(True, index=df_geo.index)).to_numpy(dtype=bool)
+
+    ok = np.isfinite(lat) & np.isfinite(lon)
+    fb = ~do_kml & ok
+    pts = ok & ~fb
+
+    partes = []
+
+    if pts.any():
+        lat_p, lon_p = lat[pts], lon[pts]
+        cells = _cell_keys(lat_p, lon_p, cell_deg)
+        while pd.unique(cells).size > max_cells:
+            cell_deg *= 2
+            cells = _cell_keys(lat_p, lon_p, cell_deg)
+
+        work = pd.DataFrame({
+            "cell": cells,
+            "lat": lat_p,
+            "lon": lon_p,
+            "tombo": tombo.to_numpy()[pts],
+        })
+        agg = work.groupby("cell", sort=False).agg(
+            lat=("lat", "mean"),
+            lon=("lon", "mean"),
+            n=("lat", "size"),
+            tombo=("tombo", "first"),
+        )
+        agg["especies"] = _species_summary(cells, especie[pts], max_species)
+        agg["rotulo"] = np.where(
+            agg["n"] == 1,
+            agg["tombo"].astype(str),
+            agg["n"].astype(str) + " exemplares",
+        )
+        agg["fallback"] = False
+        partes.append(agg.reset_index(drop=True))
+
+    if fb.any():
+        n_fb = int(fb.sum())
+        especies_fb = _species_summary(np.zeros(n_fb, dtype=np.int64), especie[fb], max_species)
+        partes.append(pd.DataFrame([{
+            "lat": FALLBACK_LAT,
+            "lon": FALLBACK_LON,
+            "n": n_fb,
+            "rotulo": f"{FALLBACK_LABEL} — {n_fb} exemplares",
+            "especies": especies_fb.iloc[0],
+            "fallback": True,
+        }]))
+
+    if not partes:
+        return pd.DataFrame(columns=out_cols)
+
+    res = pd.concat(partes, ignore_index=True)
+    res["raio"] = _marker_radius(res["n"])
+    return res[out_cols]
+
+
+def positions(lon, lat) -> list:
+    """
+    [[lon, lat], ...] arredondados (menos bytes no JSON).
+    """
+    pos = np.column_stack([np.asarray(lon, dtype="float64"), np.asarray(lat, dtype="float64")])
+    return np.round(pos, POSITION_DECIMALS).tolist()
+
+
+def point_payload(df_geo: pd.DataFrame) -> list[dict]:
+    """
+    Payload da camada de exemplares (1 ponto por exemplar), só com:
+      - 'p'  [lon, lat]
+      - 't'  texto do tooltip (tombo + nome científico)
+    O texto vai inteiro em cada registro: o tooltip do pydeck lê {t} do próprio ponto.
+    """
+    if df_geo is None or df_geo.empty:
+        return []
+
+    lat = pd.to_numeric(df_geo["lat"], errors="coerce").to_numpy(dtype="float64")
+    lon = pd.to_numeric(df_geo["lon"], errors="coerce").to_numpy(dtype="float64")
+    ok = np.isfinite(lat) & np.isfinite(lon)
+
+    tombo = df_geo.get("N tombo coleção", pd.Series("", index=df_geo.index))
+    especie = df_geo.get("Nome cientifico", pd.Series("", index=df_geo.index))
+    texto = (
+        tombo.fillna("").astype(str).str.strip()
+        + " — "
+        + especie.fillna("").astype(str).str.strip()
+    ).to_numpy()[ok]
+
+    return [{"p": p, "t": t} for p, t in zip(positions(lon[ok], lat[ok]), texto.tolist())]
+
+
+def aggregate_payload(df_map: pd.DataFrame) -> list[dict]:
+    """
+    Payload da camada agregada (saída de `aggregate_points`), só com:
+      - 'p'  [lon, lat]
+      - 'r'  raio (pixels)
+      - 'c'  cor RGBA
+      - 't'  rótulo do marcador
+      - 'e'  espécies
+    """
+    if df_map is None or df_map.empty:
+        return []
+
+    pos = positions(df_map["lon"], df_map["lat"])
+    raio = np.round(df_map["raio"].to_numpy(dtype="float64"), 1).tolist()
+    fb = df_map["fallback"].to_numpy(dtype=bool).tolist()
+    return [
+        {"p": p, "r": r, "c": COLOR_FALLBACK if f else COLOR_POINT, "t": t, "e": e}
+        for p, r, f, t, e in zip(pos, raio, fb, df_map["rotulo"].tolist(), df_map["especies"].tolist())
+    ]
@@ -0,0 +1,290 @@
+"""
+Servidor falso do Ollama, para testar e medir o assistente sem o modelo.
+
+Responde os endpoints que o painel usa, com o mesmo formato do Ollama:
+  /api/tags, /api/ps, /api/version                   (GET)
+  /api/chat, /api/generate                           (streaming NDJSON ou não)
+  /api/embed, /api/embeddings                        (vetores determinísticos)
+
+O tempo de resposta segue um perfil configurável:
+  - `latency`      espera fixa antes do 1º token (s)
+  - `prefill_tps`  tokens do prompt "lidos" por segundo (prompt maior = 1º token mais tarde)
+  - `tps`          tokens gerados por segundo
+  - `tokens`       tamanho da resposta (em tokens)
+e `missing` lista endpoints que devolvem 404 (ex.: "chat" imita um Ollama
+antigo, sem /api/chat, para exercitar o fallback para /api/generate).
+`models`, se preenchido, lista os modelos "baixados": pedir outro devolve o
+404 {"error": "model ... not found"} do Ollama de verdade.
+
+`--verificar` sobe o servidor e confere que o ollama_client distingue os dois
+404 (endpoint ausente cai para /api/generate; modelo ausente é ModelNotFound).
+
+Uso:
+    python app/mock_ollama.py --port 11435 --latencia 0.3 --tps 20
+    python app/mock_ollama.py --verificar
+    OLLAMA_HOST=http://127.0.0.1:11435 streamlit run app/dashboard_llm.py
+"""
+import argparse
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from contexto import count_tokens
+
+MOCK_PORT = 11435
+EMBED_DIM = 64
+
+_WORDS = ("Na coleção há registros desse grupo em Barbacena e região , "
+          "com exemplares depositados entre 2014 e 2024 .").split()
+
+
+@dataclass
+class Profile:
+    latency: float = 0.2
+    prefill_tps: float = 400.0
+    tps: float = 20.0
+    tokens: int = 40
+    missing: set = field(default_factory=set)
+    models: set = field(default_factory=set)
+    model: str = "mock"
+
+    def knows(self, model: str) -> bool:
+        # vazio = aceita qualquer nome (o padrão, como no benchmark)
+        if not self.models:
+            return True
+        full = model if ":" in model else f"{model}:latest"
+        return model in self.models or full in self.models
+
+    def first_token_delay(self, prompt: str) -> float:
+        prefill = count_tokens(prompt) / self.prefill_tps if self.prefill_tps > 0 else 0.0
+        return self.latency + prefill
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def fake_embedding(text: str, dim: int = EMBED_DIM) -> list[float]:
+    # saco de palavras com hash: textos com palavras em comum ficam próximos
+    v = [0.0] * dim
+    for w in re.findall(r"\w+", (text or "").lower()):
+        v[int(hashlib.md5(w.encode("utf-8")).hexdigest(), 16) % dim] += 1.0
+    return v
+
+
+def _prompt_of(path: str, body: dict) -> str:
+    if path == "/api/chat":
+        return "\n".join(m.get("content") or "" for m in body.get("messages", []))
+    return body.get("prompt") or ""
+
+
+def make_handler(profile: Profile, loaded: set):
+    class MockHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _json(self, status: int, obj):
+            data = json.dumps(obj).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _missing(self, path: str) -> bool:
+            name = path.rsplit("/", 1)[-1]
+            if name in profile.missing:
+                self._json(404, {"error": "404 page not found"})
+                return True
+            return False
+
+        def _chunk(self, obj):
+            data = (json.dumps(obj) + "\n").encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self._missing(self.path):
+                return
+            if self.path == "/api/tags":
+                names = sorted(profile.models) or [profile.model]
+                self._json(200, {"models": [{"name": m, "model": m} for m in names]})
+            elif self.path == "/api/ps":
+                self._json(200, {"models": [{"name": m, "model": m} for m in sorted(loaded)]})
+            elif self.path == "/api/version":
+                self._json(200, {"version": "0.0.0-mock"})
+            else:
+                self._json(404, {"error": "404 page not found"})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            if self._missing(self.path):
+                return
+            model = body.get("model") or profile.model
+            if not profile.knows(model):
+                self._json(404, {"error": f'model "{model}" not found, try pulling it first'})
+                return
+            loaded.add(model if ":" in model else f"{model}:latest")
+
+            if self.path == "/api/embed":
+                texts = body.get("input") or []
+                texts = [texts] if isinstance(texts, str) else texts
+                self._json(200, {"model": model, "embeddings": [fake_embedding(t) for t in texts]})
+            elif self.path == "/api/embeddings":
+                self._json(200, {"embedding": fake_embedding(body.get("prompt") or "")})
+            elif self.path in ("/api/chat", "/api/generate"):
+                self._generate(body, model)
+            else:
+                self._json(404, {"error": "404 page not found"})
+
+        def _generate(self, body: dict, model: str):
+            chat = self.path == "/api/chat"
+            prompt = _prompt_of(self.path, body)
+            if not chat and not prompt and not body.get("messages"):
+                # pedido vazio = só carregar o modelo (warm)
+                self._json(200, {"model": model, "created_at": _now(), "response": "", "done": True})
+                return
+
+            t0 = time.perf_counter()
+            time.sleep(profile.first_token_delay(prompt))
+            words = [_WORDS[i % len(_WORDS)] for i in range(profile.tokens)]
+            pieces = [w if i == 0 else " " + w for i, w in enumerate(words)]
+            final = {
+                "model": model, "created_at": _now(), "done": True, "done_reason": "stop",
+                "prompt_eval_count": count_tokens(prompt), "eval_count": len(pieces),
+            }
+
+            def piece_obj(text):
+                if chat:
+                    return {"model": model, "created_at": _now(), "message": {"role": "assistant", "content": text}, "done": False}
+                return {"model": model, "created_at": _now(), "response": text, "done": False}
+
+            if body.get("stream") is False:
+                time.sleep(len(pieces) / profile.tps if profile.tps > 0 else 0.0)
+                obj = {**piece_obj("".join(pieces)), **final}
+                obj["total_duration"] = int((time.perf_counter() - t0) * 1e9)
+                self._json(200, obj)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for i, p in enumerate(pieces):
+                    if i and profile.tps > 0:
+                        time.sleep(1.0 / profile.tps)
+                    self._chunk(piece_obj(p))
+                final["total_duration"] = int((time.perf_counter() - t0) * 1e9)
+                self._chunk({**piece_obj(""), **final})
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # o cliente cancelou no meio
+                pass
+
+    return MockHandler
+
+
+def start(profile: Profile | None = None, port: int = 0) -> tuple[ThreadingHTTPServer, str]:
+    """
+    Sobe o servidor numa thread (port=0 escolhe uma porta livre).
+    Retorna (servidor, url). Para parar: servidor.shutdown().
+    """
+    httpd = ThreadingHTTPServer(("127.0.0.1", port), make_handler(profile or Profile(), set()))
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True, name="mock-ollama").start()
+    return httpd, f"http://127.0.0.1:{httpd.server_address[1]}"
+
+
+def add_profile_args(ap: argparse.ArgumentParser):
+    ap.add_argument("--latencia", type=float, default=0.2, help="espera antes do 1º token (s)")
+    ap.add_argument("--prefill", type=float, default=400.0, help="tokens do prompt lidos por segundo")
+    ap.add_argument("--tps", type=float, default=20.0, help="tokens gerados por segundo")
+    ap.add_argument("--tokens", type=int, default=40, help="tamanho da resposta (tokens)")
+    ap.add_argument("--sem", action="append", default=[], metavar="ENDPOINT",
+                    help="endpoint que responde 404 (ex.: chat, embed); pode repetir")
+    ap.add_argument("--modelos", action="append", default=[], metavar="MODELO",
+                    help="modelo instalado; os outros respondem 404 \"model not found\" (padrão: aceita todos)")
+
+
+def profile_from_args(args) -> Profile:
+    return Profile(latency=args.latencia, prefill_tps=args.prefill, tps=args.tps,
+                   tokens=args.tokens, missing=set(args.sem), models=set(args.modelos))
+
+
+def verificar() -> int:
+    """
+    Passa ollama_client.chat/chat_stream pelos dois tipos de 404 do Ollama.
+    Retorna o número de falhas.
+    """
+    import ollama_client
+
+    falhas = 0
+
+    def check(nome: str, ok: bool):
+        nonlocal falhas
+        falhas += not ok
+        print(f"{'ok    ' if ok else 'FALHOU'}  {nome}")
+
+    def run(fn, model, host):
+        try:
+            out = fn(model, [{"role": "user", "content": "oi"}], host=host)
+            return "".join(out) if fn is ollama_client.chat_stream else out
+        except Exception as e:
+            # o erro vira resultado: quem confere é o check
+            return e
+
+    for fn in (ollama_client.chat, ollama_client.chat_stream):
+        # servidor novo a cada caso: a capacidade "chat" é lembrada por host
+        for sem_chat in (False, True):
+            perfil = Profile(latency=0.0, tps=0.0, tokens=5, models={"mock"},
+                             missing={"chat"} if sem_chat else set())
+            caso = f"{fn.__name__}, {'sem' if sem_chat else 'com'} /api/chat"
+
+            httpd, host = start(perfil)
+            try:
+                resp = run(fn, "mock", host)
+                chat_cap = ollama_client.capabilities(host).get("chat")
+                check(f"{caso}: modelo instalado responde", isinstance(resp, str) and bool(resp))
+                check(f"{caso}: capacidade chat = {not sem_chat}", chat_cap is (not sem_chat))
+            finally:
+                httpd.shutdown()
+
+            httpd, host = start(perfil)
+            try:
+                resp = run(fn, "nao-existe", host)
+                chat_cap = ollama_client.capabilities(host).get("chat")
+                check(f"{caso}: modelo ausente é ModelNotFound", isinstance(resp, ollama_client.ModelNotFound))
+                # só o 404 de endpoint pode desligar o /api/chat
+                check(f"{caso}: modelo ausente não mexe na capacidade chat",
+                      chat_cap is (False if sem_chat else None))
+            finally:
+                httpd.shutdown()
+    return falhas
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Servidor falso do Ollama (testes e benchmark)")
+    ap.add_argument("--port", type=int, default=MOCK_PORT)
+    ap.add_argument("--verificar", action="store_true",
+                    help="confere o ollama_client contra os dois tipos de 404 e sai")
+    add_profile_args(ap)
+    args = ap.parse_args(argv)
+    if args.verificar:
+        return 1 if verificar() else 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(profile_from_args(args), set()))
+    httpd.daemon_threads = True
+    print(f"Ollama falso em http://127.0.0.1:{args.port}")
+    httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
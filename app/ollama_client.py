@@ -0,0 +1,387 @@
+"""
+Cliente do Ollama local usado pelo assistente (sem Streamlit).
+
+Tenta /api/chat e, se o endpoint não existir (versões antigas do Ollama),
+cai para /api/generate com as mensagens convertidas num prompt único.
+
+`chat_stream` consome a resposta em NDJSON (1 objeto JSON por linha) e vai
+devolvendo os pedaços de texto conforme o modelo gera, para a interface
+mostrar a resposta desde o primeiro token.
+
+Todas as chamadas usam uma única `requests.Session` (pool de conexões com
+keep-alive). O status do servidor fica em cache com TTL e é renovado em
+segundo plano, e o endpoint que funciona em cada host (/api/chat ou
+/api/generate) é lembrado, então um turno de conversa custa 1 ida e volta
+e um rerun da página não custa nenhuma.
+
+O `requests` só é importado no primeiro pedido (~80 ms), fora do caminho
+da primeira renderização da página.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import requests
+
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://127.0.0.1:11434")
+DEFAULT_OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "llama3.2:3b")
+
+# resposta inteira (sem streaming)
+TIMEOUT = 180
+# streaming: (conexão, tempo máximo sem chegar nenhum pedaço)
+STREAM_TIMEOUT = (5, 180)
+
+# quanto tempo o Ollama mantém o modelo na memória depois de cada pedido
+# (o padrão dele é 5 min; recarregar o modelo custa dezenas de segundos na CPU)
+KEEP_ALIVE = os.environ.get("PAINEL_OLLAMA_KEEP_ALIVE", "30m")
+
+# por quanto tempo o status do servidor vale antes de ser conferido de novo
+HEALTH_TTL = 15.0
+HEALTH_TIMEOUT = 2.0
+
+_lock = threading.Lock()
+_session: requests.Session | None = None
+
+# host -> (ok, instante da checagem); host -> True enquanto é conferido em segundo plano
+_health: dict[str, tuple[bool, float]] = {}
+_health_refreshing: dict[str, bool] = {}
+
+# host -> {"chat": bool}  (False = sem /api/chat, vai direto pro /api/generate)
+_caps: dict[str, dict] = {}
+
+
+def session() -> requests.Session:
+    """
+    Sessão HTTP compartilhada (pool com keep-alive) entre reruns e usuários.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            _session = s
+        return _session
+
+
+def _probe(host: str) -> bool:
+    try:
+        r = session().get(f"{host}/api/tags", timeout=HEALTH_TIMEOUT)
+        ok = r.status_code == 200
+    except Exception:
+        ok = False
+    _set_health(host, ok)
+    return ok
+
+
+def _set_health(host: str, ok: bool):
+    with _lock:
+        _health[host] = (ok, time.monotonic())
+        _health_refreshing[host] = False
+
+
+def _refresh_in_background(host: str):
+    with _lock:
+        if _health_refreshing.get(host):
+            return
+        _health_refreshing[host] = True
+    threading.Thread(target=_probe, args=(host,), daemon=True, name="ollama-health").start()
+
+
+def is_up(host: str | None = None, ttl: float = HEALTH_TTL) -> bool:
+    """
+    Status do servidor. Só a primeira chamada espera a resposta; depois
+    devolve o último valor conhecido e, se passou do TTL, confere de novo
+    em segundo plano.
+    """
+    host = host or OLLAMA_HOST
+    cached = _health.get(host)
+    if cached is None:
+        return _probe(host)
+    ok, checked = cached
+    if time.monotonic() - checked > ttl:
+        _refresh_in_background(host)
+    return ok
+
+
+def capabilities(host: str | None = None) -> dict:
+    """
+    O que já se sabe do host (ex.: {"chat": False} depois de um 404 em /api/chat).
+    """
+    return dict(_caps.get(host or OLLAMA_HOST, {}))
+
+
+def _set_capability(host: str, name: str, value: bool):
+    with _lock:
+        _caps.setdefault(host, {})[name] = value
+
+
+def _chat_supported(host: str) -> bool:
+    return _caps.get(host, {}).get("chat", True)
+
+
+class ModelNotFound(RuntimeError):
+    pass
+
+
+def _model_missing(r: requests.Response) -> bool:
+    # o Ollama responde 404 tanto para endpoint ausente quanto para
+    # {"error": "model \"x\" not found, try pulling it first"}
+    return r.status_code == 404 and "model" in r.text.lower()
+
+
+def _raise_model_missing(model: str):
+    raise ModelNotFound(f"modelo não encontrado no Ollama: {model} (confira o nome ou rode `ollama pull {model}`)")
+
+
+def _post(host: str, path: str, payload: dict, **kwargs) -> requests.Response:
+    import requests
+
+    try:
+        r = session().post(f"{host}{path}", json=payload, **kwargs)
+    except requests.ConnectionError:
+        _set_health(host, False)
+        raise
+    _set_health(host, True)
+    return r
+
+
+def messages_to_prompt(messages: list[dict]) -> str:
+    """
+    Converte messages -> um prompt único para o /api/generate
+    (mantém o comportamento "chat", mas usando generate).
+    """
+    system_parts = [m["content"] for m in messages if m.get("role") == "system" and m.get("content")]
+    system_text = "\n".join(system_parts).strip()
+
+    convo_text = ""
+    for m in messages:
+        role = m.get("role", "")
+        content = (m.get("content") or "").strip()
+        if not content:
+            continue
+        if role == "system":
+            continue
+        if role == "user":
+            convo_text += f"\nUSUÁRIO:\n{content}\n"
+        elif role == "assistant":
+            convo_text += f"\nASSISTENTE:\n{content}\n"
+        else:
+            convo_text += f"\n{role.upper()}:\n{content}\n"
+
+    prompt = ""
+    if system_text:
+        prompt += f"SISTEMA:\n{system_text}\n"
+    prompt += convo_text.strip()
+    prompt += "\n\nASSISTENTE:\n"
+    return prompt
+
+
+def chat(model: str, messages: list[dict], temperature: float = 0.2, host: str | None = None) -> str:
+    """
+    Resposta completa de uma vez ("stream": False).
+    Tenta usar /api/chat. Se não existir (404), cai para /api/generate
+    (e lembra disso para as próximas chamadas a este host). Modelo que o
+    Ollama não tem (404 "model ... not found") é erro: ModelNotFound.
+    """
+    host = host or OLLAMA_HOST
+    temperature = float(temperature)
+
+    # --------
+    # 1) Tenta /api/chat
+    # --------
+    if _chat_supported(host):
+        try:
+            payload = {
+                "model": model,
+                "messages": messages,
+                "stream": False,
+                "options": {"temperature": temperature},
+                "keep_alive": KEEP_ALIVE,
+            }
+            r = _post(host, "/api/chat", payload, timeout=TIMEOUT)
+
+            # modelo errado não diz nada sobre o endpoint: não mexe na capacidade
+            if _model_missing(r):
+                _raise_model_missing(model)
+            if r.status_code == 404:
+                _set_capability(host, "chat", False)
+                raise RuntimeError("Ollama sem endpoint /api/chat (404)")
+
+            r.raise_for_status()
+            _set_capability(host, "chat", True)
+            data = r.json()
+            content = (data.get("message") or {}).get("content", "")
+            content = (content or "").strip()
+            if content:
+                return content
+
+            # fallback se veio num formato inesperado
+            return str(data)
+
+        except ModelNotFound:
+            raise
+        except Exception:
+            pass
+
+    # --------
+    # 2) Fallback: /api/generate
+    # --------
+    payload = {
+        "model": model,
+        "prompt": messages_to_prompt(messages),
+        "stream": False,
+        "options": {"temperature": temperature},
+        "keep_alive": KEEP_ALIVE,
+    }
+    r = _post(host, "/api/generate", payload, timeout=TIMEOUT)
+    if _model_missing(r):
+        _raise_model_missing(model)
+    r.raise_for_status()
+    data = r.json()
+    resp = (data.get("response") or "").strip()
+    return resp if resp else str(data)
+
+
+def _iter_ndjson(r: requests.Response, field):
+    """
+    Lê o corpo em NDJSON e devolve o texto de cada pedaço.
+    `field` extrai o texto de um objeto (message.content ou response).
+    """
+    # chunk_size=None: entrega cada pedaço assim que chega (o padrão, 512 bytes,
+    # seguraria vários tokens antes de mostrar)
+    for line in r.iter_lines(chunk_size=None):
+        if not line:
+            continue
+        data = json.loads(line)
+        if data.get("error"):
+            raise RuntimeError(data["error"])
+        piece = field(data)
+        if piece:
+            yield piece
+    # sem `break` no "done": ler o corpo até o fim devolve a conexão ao pool
+
+
+def chat_stream(model: str, messages: list[dict], temperature: float = 0.2, host: str | None = None):
+    """
+    Igual a `chat`, mas em streaming: gera os pedaços de texto conforme chegam.
+    O fallback para /api/generate só acontece antes do primeiro pedaço
+    (depois disso não dá pra recomeçar a resposta).
+    """
+    host = host or OLLAMA_HOST
+    options = {"temperature": float(temperature)}
+
+    # --------
+    # 1) Tenta /api/chat
+    # --------
+    if _chat_supported(host):
+        started = False
+        try:
+            payload = {"model": model, "messages": messages, "stream": True, "options": options, "keep_alive": KEEP_ALIVE}
+            with _post(host, "/api/chat", payload, stream=True, timeout=STREAM_TIMEOUT) as r:
+                if _model_missing(r):
+                    _raise_model_missing(model)
+                if r.status_code == 404:
+                    _set_capability(host, "chat", False)
+                    raise RuntimeError("Ollama sem endpoint /api/chat (404)")
+                r.raise_for_status()
+                _set_capability(host, "chat", True)
+                for piece in _iter_ndjson(r, lambda d: (d.get("message") or {}).get("content", "")):
+                    started = True
+                    yield piece
+            if started:
+                return
+        except ModelNotFound:
+            raise
+        except Exception:
+            if started:
+                raise
+
+    # --------
+    # 2) Fallback: /api/generate
+    # --------
+    payload = {
+        "model": model, "prompt": messages_to_prompt(messages), "stream": True,
+        "options": options, "keep_alive": KEEP_ALIVE,
+    }
+    with _post(host, "/api/generate", payload, stream=True, timeout=STREAM_TIMEOUT) as r:
+        if _model_missing(r):
+            _raise_model_missing(model)
+        r.raise_for_status()
+        yield from _iter_ndjson(r, lambda d: d.get("response", ""))
+
+
+def embed(model: str, texts: list[str], host: str | None = None, timeout=TIMEOUT) -> list[list[float]]:
+    """
+    Embeddings de vários textos numa chamada (/api/embed). Em versões antigas
+    do Ollama, cai para /api/embeddings (1 texto por chamada).
+    """
+    host = host or OLLAMA_HOST
+    if not texts:
+        return []
+
+    if _caps.get(host, {}).get("embed", True):
+        r = _post(host, "/api/embed", {"model": model, "input": list(texts), "keep_alive": KEEP_ALIVE}, timeout=timeout)
+        # 404 com "model ... not found" é modelo não baixado, não endpoint ausente
+        if r.status_code == 404 and not _model_missing(r):
+            _set_capability(host, "embed", False)
+        else:
+            r.raise_for_status()
+            _set_capability(host, "embed", True)
+            return r.json()["embeddings"]
+
+    out = []
+    for t in texts:
+        r = _post(host, "/api/embeddings", {"model": model, "prompt": t, "keep_alive": KEEP_ALIVE}, timeout=timeout)
+        r.raise_for_status()
+        out.append(r.json()["embedding"])
+    return out
+
+
+def full_model_name(model: str) -> str:
+    return model if ":" in model else f"{model}:latest"
+
+
+def loaded_models(host: str | None = None) -> set[str] | None:
+    """
+    Modelos carregados na memória agora (/api/ps), ou None se não deu pra saber.
+    """
+    host = host or OLLAMA_HOST
+    try:
+        r = session().get(f"{host}/api/ps", timeout=HEALTH_TIMEOUT)
+        if r.status_code != 200:
+            return None
+        return {full_model_name(m.get("name") or m.get("model", "")) for m in r.json().get("models", [])}
+    except Exception:
+        return None
+
+
+def is_loaded(model: str, host: str | None = None) -> bool | None:
+    loaded = loaded_models(host)
+    return None if loaded is None else full_model_name(model) in loaded
+
+
+def warm(model: str, host: str | None = None, embed: bool = False) -> bool:
+    """
+    Carrega o modelo na memória sem gerar nada (pedido vazio + keep_alive)
+    e renova o tempo que ele fica carregado.
+    """
+    host = host or OLLAMA_HOST
+    if embed:
+        path, payload = "/api/embed", {"model": model, "input": "", "keep_alive": KEEP_ALIVE}
+    else:
+        path, payload = "/api/generate", {"model": model, "keep_alive": KEEP_ALIVE}
+    try:
+        r = _post(host, path, payload, timeout=TIMEOUT)
+        return r.status_code == 200
+    except Exception:
+        return False
@@ -0,0 +1,103 @@
+"""
+Aquece os caches persistentes do painel antes da primeira visita.
+
+O launcher (run_painel.py) roda este script em segundo plano enquanto o
+Streamlit sobe; assim a primeira página só lê o que já está em disco:
+  1. snapshot das planilhas, do KML e das coordenadas (snapshot.py)
+  2. índice dos nomes das fotos (snapshot.py)
+  3. índice BM25 do assistente (rag_store.py)
+  4. fichas por espécie (especies.py)
+  5. banco SQL das consultas, se PAINEL_BACKEND pedir um (banco.py)
+  6. modelo do Ollama carregado, se o servidor estiver no ar
+
+Os caches do Streamlit (st.cache_data) são por processo e não dá para
+enchê-los de fora; por isso o painel lê estes arquivos em disco. Se a página
+pedir um arquivo que o prewarm ainda está montando, ela espera por ele em vez
+de refazer o trabalho (ver snapshot._cached).
+
+Uso (na raiz do projeto):
+    python app/prewarm.py
+    python app/prewarm.py --sem-modelo
+"""
+import argparse
+import sys
+import time
+
+import snapshot
+from cache_painel import BASE_DIR, dataset_fingerprint
+from dados import ARQUIVOS, FOTOS_DIR, KML_PATH
+
+_t0 = time.perf_counter()
+
+
+def _log(msg: str):
+    print(f"[{time.perf_counter() - _t0:6.2f} s] {msg}", flush=True)
+
+
+def run(model: bool = True, log=_log) -> str:
+    """
+    Monta tudo o que falta. Retorna a fingerprint do dataset aquecido.
+    """
+    arquivos = [str(BASE_DIR / p) for p in ARQUIVOS]
+    kml_path = str(BASE_DIR / KML_PATH)
+    dataset_fp = dataset_fingerprint(arquivos, kml_path)
+
+    t = time.perf_counter()
+    dfs, report, erros = snapshot.load_with_coords(arquivos, kml_path)
+    for e in erros:
+        log(f"aviso: {e}")
+    log(f"planilhas + coordenadas: {len(dfs)} registros ({time.perf_counter() - t:.2f} s)")
+
+    t = time.perf_counter()
+    fotos = snapshot.photo_files(BASE_DIR / FOTOS_DIR)
+    log(f"fotos: {len(fotos)} arquivos ({time.perf_counter() - t:.2f} s)")
+
+    import rag_store
+
+    t = time.perf_counter()
+    index = rag_store.load_or_build(arquivos, kml_path, dataset_fp=dataset_fp)
+    log(f"índice do assistente: {index['N']} trechos ({time.perf_counter() - t:.2f} s)")
+    for f in index.get("meta", {}).get("falhas", []):
+        log(f"aviso: {f} não pôde ser lida; índice não gravado (tenta de novo na próxima partida)")
+
+    import especies
+
+    t = time.perf_counter()
+    store = especies.SpeciesStore()
+    if not store.has_dataset(dataset_fp):
+        especies.refresh_facts(store, dfs, dataset_fp, BASE_DIR / FOTOS_DIR)
+    log(f"fichas: {len(store.names(dataset_fp))} espécies ({time.perf_counter() - t:.2f} s)")
+
+    import banco
+
+    if banco.BACKEND != "pandas":
+        t = time.perf_counter()
+        backend = banco.open_backend(dfs, dataset_fp)
+        log(f"banco de consultas: {backend.engine}{f' ({backend.aviso})' if backend.aviso else ''} "
+            f"({time.perf_counter() - t:.2f} s)")
+
+    snapshot.prune()
+
+    if model:
+        import ollama_client
+
+        if ollama_client.is_up():
+            t = time.perf_counter()
+            ok = ollama_client.warm(ollama_client.DEFAULT_OLLAMA_MODEL)
+            log(f"modelo {ollama_client.DEFAULT_OLLAMA_MODEL}: {'carregado' if ok else 'falhou'} "
+                f"({time.perf_counter() - t:.2f} s)")
+        else:
+            log("Ollama fora do ar: modelo não aquecido")
+    return dataset_fp
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Aquece os caches do painel")
+    ap.add_argument("--sem-modelo", action="store_true", help="não carrega o modelo do Ollama")
+    args = ap.parse_args(argv)
+    run(model=not args.sem_modelo)
+    _log("pronto")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
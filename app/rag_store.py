@@ -0,0 +1,235 @@
+"""
+Índice do assistente persistido em disco, chaveado pela fingerprint do dataset.
+
+Layout em .cache_painel/rag/:
+  parts/<chave>/   postings + documentos de UMA planilha (ou do KML)
+  index/<fp>/      índice final: arrays .npy (abertos com mmap), vocab.json,
+                   trigramas (tri_*.npy + trigrams.json), docs.bin +
+                   docs_off.npy (textos), meta.json
+
+Na inicialização o índice é só aberto (mmap), sem reconstruir nada. Se uma
+planilha muda, só a partição dela é re-tokenizada; as outras vêm do disco e
+o índice final é remontado a partir dos postings (operações NumPy).
+"""
+import json
+import mmap
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+import bm25
+import corpus
+from analisador import TrigramIndex
+from cache_painel import CACHE_DIR, dataset_fingerprint, file_fingerprint
+from dados import parse_kml_points, read_workbook
+
+RAG_DIR = CACHE_DIR / "rag"
+PARTS_DIR = RAG_DIR / "parts"
+INDEX_DIR = RAG_DIR / "index"
+
+# quantos índices finais antigos manter em disco
+KEEP_INDEXES = 3
+
+_ARRAYS = ["indptr", "post_doc", "post_tf", "idf", "doc_len", "doc_norm"]
+
+
+class DocStore:
+    """
+    Textos do corpus lidos sob demanda de um arquivo mapeado em memória
+    (docs.bin + offsets), sem carregar tudo na inicialização.
+    """
+
+    def __init__(self, folder: Path):
+        self._off = np.load(folder / "docs_off.npy", mmap_mode="r")
+        self._fh = open(folder / "docs.bin", "rb")
+        size = os.fstat(self._fh.fileno()).st_size
+        self._buf = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return len(self._off) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        lo, hi = int(self._off[i]), int(self._off[i + 1])
+        return self._buf[lo:hi].decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def _write_docs(folder: Path, docs: list[str]):
+    encoded = [d.encode("utf-8") for d in docs]
+    off = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=off[1:])
+    with open(folder / "docs.bin", "wb") as f:
+        for e in encoded:
+            f.write(e)
+    np.save(folder / "docs_off.npy", off)
+
+
+def _publish(tmp: Path, final: Path):
+    # grava numa pasta temporária e só depois "publica" (outro processo pode estar lendo)
+    try:
+        os.replace(tmp, final)
+    except OSError:
+        # outro processo publicou primeiro: fica o dele
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _tmp_dir(parent: Path) -> Path:
+    parent.mkdir(parents=True, exist_ok=True)
+    return Path(tempfile.mkdtemp(dir=parent, prefix=".tmp-"))
+
+
+# -----------------------------------------
+# PARTIÇÕES (1 por planilha + 1 do KML)
+# -----------------------------------------
+def partition_key(kind: str, path) -> str:
+    return f"v{bm25.INDEX_VERSION}-{kind}-{Path(path).stem}-{file_fingerprint(path)}"
+
+
+def _partition_docs(kind: str, path) -> list[str]:
+    path = Path(path)
+    if not path.exists():
+        return []
+    if kind == "kml":
+        return corpus.kml_docs(parse_kml_points(path))
+    return corpus.dataframe_docs(read_workbook(path))
+
+
+def load_partition(kind: str, path) -> tuple[dict, list[str], bool]:
+    """
+    Postings + documentos de uma partição, do disco se já existirem.
+    O terceiro valor é True se a fonte não pôde ser lida (partição vazia).
+    """
+    folder = PARTS_DIR / partition_key(kind, path)
+    if (folder / "postings.npz").exists():
+        with np.load(folder / "postings.npz") as z:
+            postings = {k: z[k] for k in ["term_ids", "doc_ids", "tf", "doc_len"]}
+        postings["terms"] = json.loads((folder / "terms.json").read_text(encoding="utf-8"))
+        return postings, list(DocStore(folder)), False
+
+    try:
+        docs = _partition_docs(kind, path)
+    except Exception:
+        # planilha aberta/corrompida: não grava cache, tenta de novo depois
+        return bm25.doc_postings([]), [], True
+
+    postings = bm25.doc_postings(docs)
+    tmp = _tmp_dir(PARTS_DIR)
+    np.savez(tmp / "postings.npz", **{k: postings[k] for k in ["term_ids", "doc_ids", "tf", "doc_len"]})
+    (tmp / "terms.json").write_text(json.dumps(postings["terms"], ensure_ascii=False), encoding="utf-8")
+    _write_docs(tmp, docs)
+    _publish(tmp, folder)
+    return postings, docs, False
+
+
+# -----------------------------------------
+# ÍNDICE FINAL
+# -----------------------------------------
+def save_index(index: dict, docs: list[str], folder: Path, meta: dict | None = None):
+    tmp = _tmp_dir(folder.parent)
+    for name in _ARRAYS:
+        np.save(tmp / f"{name}.npy", index[name])
+    terms = [None] * len(index["vocab"])
+    for t, i in index["vocab"].items():
+        terms[i] = t
+    (tmp / "vocab.json").write_text(json.dumps(terms, ensure_ascii=False), encoding="utf-8")
+    _write_docs(tmp, docs)
+    fuzzy = index["fuzzy"]
+    np.save(tmp / "tri_indptr.npy", fuzzy.indptr)
+    np.save(tmp / "tri_terms.npy", fuzzy.term_ids)
+    np.save(tmp / "tri_ngrams.npy", fuzzy.term_ngrams)
+    (tmp / "trigrams.json").write_text(json.dumps(list(fuzzy.grams), ensure_ascii=False), encoding="utf-8")
+    info = {"N": index["N"], "avgdl": index["avgdl"], "k1": index["k1"], "b": index["b"], **(meta or {})}
+    (tmp / "meta.json").write_text(json.dumps(info, ensure_ascii=False), encoding="utf-8")
+    _publish(tmp, folder)
+
+
+def load_index(folder: Path) -> dict:
+    """
+    Abre um índice salvo: arrays em mmap (somente leitura), textos sob demanda.
+    """
+    meta = json.loads((folder / "meta.json").read_text(encoding="utf-8"))
+    terms = json.loads((folder / "vocab.json").read_text(encoding="utf-8"))
+    index = {name: np.load(folder / f"{name}.npy", mmap_mode="r") for name in _ARRAYS}
+    index.update({
+        "docs": DocStore(folder),
+        "vocab": {t: i for i, t in enumerate(terms)},
+        "avgdl": meta["avgdl"],
+        "k1": meta["k1"],
+        "b": meta["b"],
+        "N": meta["N"],
+        "meta": meta,
+        "folder": folder,
+        "fuzzy": TrigramIndex(
+            json.loads((folder / "trigrams.json").read_text(encoding="utf-8")),
+            np.load(folder / "tri_indptr.npy", mmap_mode="r"),
+            np.load(folder / "tri_terms.npy", mmap_mode="r"),
+            np.load(folder / "tri_ngrams.npy", mmap_mode="r"),
+        ),
+    })
+    return index
+
+
+def prune_indexes(keep: int = KEEP_INDEXES):
+    if not INDEX_DIR.exists():
+        return
+    folders = sorted(
+        (p for p in INDEX_DIR.iterdir() if p.is_dir() and not p.name.startswith(".")),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    for p in folders[keep:]:
+        shutil.rmtree(p, ignore_errors=True)
+
+    # partições que nenhum índice mantido usa mais
+    in_use = set()
+    for p in folders[:keep]:
+        try:
+            in_use.update(json.loads((p / "meta.json").read_text(encoding="utf-8")).get("partitions", []))
+        except (OSError, ValueError):
+            return
+    if PARTS_DIR.exists():
+        for p in PARTS_DIR.iterdir():
+            if p.is_dir() and not p.name.startswith(".") and p.name not in in_use:
+                shutil.rmtree(p, ignore_errors=True)
+
+
+def load_or_build(arquivos, kml_path, dataset_fp: str | None = None) -> dict:
+    """
+    Índice BM25 do dataset atual: abre do disco se já existe para esta
+    fingerprint; senão monta a partir das partições (reaproveitando as que
+    não mudaram), salva e abre. Se alguma fonte não pôde ser lida, o índice
+    fica só na memória (sem "folder"): gravá-lo sob esta fingerprint faria
+    a fonte faltar até o arquivo mudar de novo.
+    """
+    dataset_fp = dataset_fp or dataset_fingerprint(arquivos, kml_path)
+    folder = INDEX_DIR / f"v{bm25.INDEX_VERSION}-{dataset_fp}"
+    if (folder / "meta.json").exists():
+        return load_index(folder)
+
+    parts = [("xlsx", p) for p in arquivos] + ([("kml", kml_path)] if kml_path else [])
+    postings, docs, keys, falhas = [], [], [], []
+    for kind, path in parts:
+        p, d, failed = load_partition(kind, path)
+        postings.append(p)
+        docs.extend(d)
+        keys.append(partition_key(kind, path))
+        if failed:
+            falhas.append(str(path))
+
+    index = bm25.index_from_postings(bm25.merge_postings(postings), docs)
+    if falhas:
+        index.update({"meta": {"dataset_fp": dataset_fp, "falhas": falhas}, "folder": None})
+        return index
+    save_index(index, docs, folder, meta={"dataset_fp": dataset_fp, "partitions": keys})
+    prune_indexes()
+    return load_index(folder)
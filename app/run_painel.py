@@ -1,12 +1,41 @@
-import subprocess
-import webbrowser
-import time
+"""
+Launcher do painel (vira o .exe via PyInstaller; no Linux/macOS roda como .py).
+
+Dispara o aquecimento dos caches (prewarm.py), sobe o servidor de tiles e o
+Streamlit em segundo plano, consulta o endpoint de saúde do Streamlit
+(/_stcore/health) com espera crescente e abre o navegador assim que ele
+responde. As fases e seus tempos vão para a saída e
+para .cache_painel/launcher.log; a saída do Streamlit fica em
+.cache_painel/streamlit.log. Se o Streamlit morrer na partida, o launcher
+termina com erro mostrando o fim desse log.
+
+O prewarm roda em paralelo com a partida do Streamlit (saída em
+.cache_painel/prewarm.log); PAINEL_PREWARM=0 desliga. O modelo do Ollama só
+é carregado quando a página lançada é a do assistente (dashboard_llm.py). Com --prewarm o
+launcher só aquece os caches, em primeiro plano, e sai (útil em tarefa
+agendada ou depois de atualizar as planilhas).
+"""
+import argparse
 import os
 import socket
+import subprocess
 import sys
+import time
+import urllib.request
+import webbrowser
 from pathlib import Path
 
 PORT = 8501
+TILES_PORT = int(os.environ.get("PAINEL_TILES_PORT", "8765"))
+
+# tempo máximo esperando o Streamlit ficar pronto (partida a frio pode ser lenta)
+STARTUP_TIMEOUT = float(os.environ.get("PAINEL_STARTUP_TIMEOUT", "120"))
+# espera entre consultas ao endpoint de saúde: começa curta e vai crescendo
+POLL_FIRST = 0.05
+POLL_MAX = 1.0
+
+WINDOWS = os.name == "nt"
+
 
 def get_base_dir() -> Path:
     # Quando vira .exe (PyInstaller), use o caminho do executável
@@ -17,46 +46,212 @@ def get_base_dir() -> Path:
 
 BASE_DIR = get_base_dir()
 
-VENV_PYTHON = BASE_DIR / ".venv" / "Scripts" / "python.exe"
 APP_PATH = BASE_DIR / "app" / "dashboard.py"
-print(VENV_PYTHON)
-print(APP_PATH)
+TILE_SERVER_PATH = BASE_DIR / "app" / "tile_server.py"
+PREWARM_PATH = BASE_DIR / "app" / "prewarm.py"
+PREWARM = os.environ.get("PAINEL_PREWARM", "1") != "0"
+# só a página com o assistente usa o Ollama; a outra não precisa do modelo carregado
+USES_MODEL = APP_PATH.name == "dashboard_llm.py"
+LOG_DIR = Path(os.environ.get("PAINEL_CACHE_DIR", BASE_DIR / ".cache_painel"))
+
+_t0 = time.perf_counter()
+
+
+class LaunchError(RuntimeError):
+    pass
+
+
+def fase(msg: str):
+    """
+    Registra uma fase da partida com o tempo desde o início do launcher.
+    """
+    line = f"[{time.perf_counter() - _t0:6.2f} s] {msg}"
+    print(line, flush=True)
+    try:
+        LOG_DIR.mkdir(parents=True, exist_ok=True)
+        with open(LOG_DIR / "launcher.log", "a", encoding="utf-8") as f:
+            f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {line}\n")
+    except OSError:
+        pass
+
+
+def venv_python() -> Path:
+    if WINDOWS:
+        return BASE_DIR / ".venv" / "Scripts" / "python.exe"
+    return BASE_DIR / ".venv" / "bin" / "python"
+
+
+def find_python() -> Path:
+    """
+    Python que roda o Streamlit: o da .venv ao lado do projeto; rodando como
+    .py sem .venv, o próprio interpretador atual.
+    """
+    py = venv_python()
+    if py.exists():
+        return py
+    if not getattr(sys, "frozen", False):
+        return Path(sys.executable)
+    raise LaunchError(
+        f"Python do ambiente virtual (.venv) não encontrado em: {py}\n"
+        f"BASE_DIR resolvido para: {BASE_DIR}\n"
+        "Garanta que a pasta .venv esteja AO LADO do .exe (mesma pasta do executável)."
+    )
+
+
 def porta_em_uso(port):
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         return s.connect_ex(("localhost", port)) == 0
 
-if __name__ == "__main__":
 
-    # DEBUG (depois pode remover)
-    # print("BASE_DIR:", BASE_DIR)
-    # print("VENV_PYTHON:", VENV_PYTHON)
-    # print("APP_PATH:", APP_PATH)
-
-    if not VENV_PYTHON.exists():
-        raise RuntimeError(
-            f"Python do ambiente virtual (.venv) não encontrado em: {VENV_PYTHON}\n"
-            f"BASE_DIR resolvido para: {BASE_DIR}\n"
-            "Garanta que a pasta .venv esteja AO LADO do .exe (mesma pasta do executável)."
+def start_background(args: list[str], env=None, log_name: str | None = None) -> subprocess.Popen:
+    """
+    Processo em segundo plano, sem janela (Windows) e fora da sessão do
+    terminal (Linux/macOS), então continua rodando quando o launcher sai.
+    """
+    out = subprocess.DEVNULL
+    if log_name:
+        LOG_DIR.mkdir(parents=True, exist_ok=True)
+        out = open(LOG_DIR / log_name, "w", encoding="utf-8")
+    kwargs = {"creationflags": subprocess.CREATE_NO_WINDOW} if WINDOWS else {"start_new_session": True}
+    try:
+        return subprocess.Popen(
+            args, stdout=out, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+            env=env, cwd=str(BASE_DIR),  # importante: streamlit roda “a partir” do base dir
+            **kwargs,
         )
+    finally:
+        if out is not subprocess.DEVNULL:
+            out.close()  # o filho já tem a cópia dele
+
+
+def log_tail(log_name: str, lines: int = 15) -> str:
+    try:
+        text = (LOG_DIR / log_name).read_text(encoding="utf-8", errors="replace")
+    except OSError:
+        return ""
+    return "\n".join(text.strip().splitlines()[-lines:])
+
+
+def wait_ready(url: str, proc: subprocess.Popen | None = None, timeout: float = STARTUP_TIMEOUT,
+               log_name: str | None = None) -> float:
+    """
+    Consulta `url` até responder 200 (espera crescente entre as tentativas).
+    Retorna o tempo de espera; erro se o processo morrer ou o tempo acabar.
+    """
+    start = time.perf_counter()
+    delay = POLL_FIRST
+    while True:
+        if proc is not None and proc.poll() is not None:
+            tail = log_tail(log_name) if log_name else ""
+            raise LaunchError(
+                f"O servidor terminou na partida (código {proc.returncode})."
+                + (f"\n\nÚltimas linhas de {LOG_DIR / log_name}:\n{tail}" if tail else "")
+            )
+        try:
+            with urllib.request.urlopen(url, timeout=1.0) as r:
+                if r.status == 200:
+                    return time.perf_counter() - start
+        except OSError:
+            pass
+        if time.perf_counter() - start > timeout:
+            raise LaunchError(f"O servidor não respondeu em {timeout:.0f} s ({url}).")
+        time.sleep(delay)
+        delay = min(delay * 1.5, POLL_MAX)
+
+
+def show_error(msg: str):
+    fase(f"ERRO: {msg}")
+    # o .exe não tem console: mostra a mensagem numa janela
+    if WINDOWS and getattr(sys, "frozen", False):
+        import ctypes
+
+        ctypes.windll.user32.MessageBoxW(0, msg, "Painel Coleção", 0x10)
+
+
+def prewarm_command(python: Path) -> list[str]:
+    return [str(python), str(PREWARM_PATH)] + ([] if USES_MODEL else ["--sem-modelo"])
 
-    if not APP_PATH.exists():
-        raise RuntimeError(f"App Streamlit não encontrado em: {APP_PATH}")
-
-    if not porta_em_uso(PORT):
-        subprocess.Popen(
-            [
-                str(VENV_PYTHON),
-                "-m", "streamlit", "run",
-                str(APP_PATH),
-                "--server.port", str(PORT),
-                "--server.headless=true",
-                "--server.runOnSave=false",
-            ],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-            creationflags=subprocess.CREATE_NO_WINDOW,
-            cwd=str(BASE_DIR),  # importante: streamlit roda “a partir” do base dir
-        )
-        time.sleep(2)
 
-    webbrowser.open(f"http://localhost:{PORT}")
+def prewarm_foreground(python: Path) -> int:
+    fase("aquecendo caches")
+    code = subprocess.call(prewarm_command(python), cwd=str(BASE_DIR))
+    fase("caches prontos" if code == 0 else f"ERRO: prewarm terminou com código {code}")
+    return code
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Launcher do painel")
+    ap.add_argument("--prewarm", action="store_true", help="só aquece os caches (sem subir os servidores) e sai")
+    args = ap.parse_args(argv)
+    try:
+        fase(f"iniciando ({sys.platform}, base {BASE_DIR})")
+        python = find_python()
+        if args.prewarm:
+            return 0 if prewarm_foreground(python) == 0 else 1
+        if not APP_PATH.exists():
+            raise LaunchError(f"App Streamlit não encontrado em: {APP_PATH}")
+
+        # caches (planilhas, coordenadas, fotos, índice) montados enquanto o Streamlit sobe
+        prewarm = None
+        if PREWARM and PREWARM_PATH.exists():
+            prewarm = start_background(prewarm_command(python), log_name="prewarm.log")
+            fase("aquecimento dos caches iniciado")
+
+        # servidor local de tiles (mapa base offline), ao lado do Streamlit
+        env = os.environ.copy()
+        if TILE_SERVER_PATH.exists():
+            tiles = None
+            if not porta_em_uso(TILES_PORT):
+                tiles = start_background(
+                    [str(python), str(TILE_SERVER_PATH), "serve", "--port", str(TILES_PORT)],
+                    log_name="tiles.log",
+                )
+                fase(f"servidor de tiles iniciado (porta {TILES_PORT})")
+            # só aponta a página para os tiles locais se eles responderem: com um
+            # style.json morto o mapa ficaria sem mapa base nenhum
+            try:
+                waited = wait_ready(f"http://localhost:{TILES_PORT}/health", tiles, timeout=5, log_name="tiles.log")
+                fase(f"servidor de tiles pronto (esperou {waited:.2f} s)")
+                env["PAINEL_TILES_URL"] = f"http://localhost:{TILES_PORT}"
+            except LaunchError as e:
+                # sem tiles locais o mapa ainda abre (com o mapa base padrão)
+                fase(f"aviso: servidor de tiles indisponível: {e}")
+
+        app = None
+        if porta_em_uso(PORT):
+            fase(f"Streamlit já está rodando na porta {PORT}")
+        else:
+            app = start_background(
+                [
+                    str(python),
+                    "-m", "streamlit", "run",
+                    str(APP_PATH),
+                    "--server.port", str(PORT),
+                    "--server.headless=true",
+                    "--server.runOnSave=false",
+                ],
+                env=env,
+                log_name="streamlit.log",
+            )
+            fase(f"Streamlit iniciado ({python})")
+
+        waited = wait_ready(f"http://localhost:{PORT}/_stcore/health", app, log_name="streamlit.log")
+        fase(f"Streamlit pronto (esperou {waited:.2f} s)")
+
+        if prewarm is not None:
+            # a página espera pelo snapshot que estiver sendo montado; aqui só registra
+            code = prewarm.poll()
+            fase("caches já prontos" if code == 0 else
+                 "caches ainda sendo montados (ver prewarm.log)" if code is None else
+                 f"aviso: prewarm terminou com código {code} (ver prewarm.log)")
+
+        webbrowser.open(f"http://localhost:{PORT}")
+        fase("navegador aberto")
+        return 0
+    except LaunchError as e:
+        show_error(str(e))
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""
+Cópia pronta dos dados do painel em disco (.cache_painel/snapshot/), para a
+primeira visita não pagar a leitura das planilhas (~1,5 s), do KML e a
+junção das coordenadas.
+
+  wb-<planilha>-<fp>.pkl     uma planilha lida (só ela é relida se mudar)
+  kml-<fp>.pkl               pontos do KML
+  coords-v<N>-<dataset_fp>.arrow  dataset pronto: planilhas + lat/lon (+ relatório da junção nos metadados)
+  fotos.json                 nomes dos arquivos de foto (vale enquanto a pasta não muda)
+
+O dataset pronto é um arquivo Arrow IPC aberto com memory-map, só leitura:
+as colunas de texto (quase toda a memória do DataFrame) apontam direto para
+o arquivo, então sessões e processos do Streamlit compartilham as mesmas
+páginas do cache do sistema em vez de cada um ter sua cópia.
+
+Os arquivos são gravados de forma atômica (temporário + os.replace). Quem
+está montando um snapshot deixa um .lock ao lado; outro processo que
+precise do mesmo arquivo (a página, enquanto o prewarm do launcher roda)
+espera ele ficar pronto em vez de refazer o trabalho.
+"""
+import json
+import os
+import pickle
+import re
+import tempfile
+import time
+from datetime import date, datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pyarrow import ipc
+
+from cache_painel import CACHE_DIR, dataset_fingerprint, file_fingerprint
+from dados import parse_kml_points, read_workbook
+from mapa import FALLBACK_LAT, FALLBACK_LON, KML_COL
+from tombo import join_coordinates
+
+SNAP_DIR = CACHE_DIR / "snapshot"
+
+# quantas versões antigas de cada tipo manter em disco
+KEEP_VERSIONS = 3
+# .lock mais velho que isso é de um processo que morreu
+LOCK_STALE = 120.0
+LOCK_WAIT = 60.0
+PHOTO_EXTS = {".png", ".jpg", ".jpeg", ".webp"}
+# muda quando o formato do dataset pronto muda (ex.: colunas novas em arrow_ready)
+ARROW_VERSION = 4
+# coluna ao lado de uma coluna de data com o texto que não virou data ("03/02/2025?")
+ORIGINAL_SUFFIX = " (texto original)"
+
+
+def _write(path: Path, obj):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    with os.fdopen(fd, "wb") as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def _read(path: Path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def _write_arrow(path: Path, value):
+    df, report, _ = value
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    meta = {**(table.schema.metadata or {}), b"painel": json.dumps(report, ensure_ascii=False).encode("utf-8")}
+    table = table.replace_schema_metadata(meta)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    os.close(fd)
+    with pa.OSFile(tmp, "wb") as sink, ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    try:
+        os.replace(tmp, path)
+    except PermissionError:
+        # Windows: outro processo já publicou e está com o arquivo mapeado
+        os.unlink(tmp)
+        if not path.exists():
+            raise
+
+
+def _read_arrow(path: Path):
+    table = ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+    report = json.loads(table.schema.metadata[b"painel"])
+    return table.to_pandas(), report, []
+
+
+def _cached(path: Path, build, read=_read, write=_write):
+    """
+    Lê `path` se existir; senão monta com `build()` e grava. Se outro processo
+    está montando o mesmo arquivo, espera por ele (até LOCK_WAIT).
+    `build` pode devolver (valor, False) para não gravar (ex.: planilha com erro).
+    """
+    if path.exists():
+        return read(path)
+    lock = path.with_name(path.name + ".lock")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        fd = None
+        deadline = time.monotonic() + LOCK_WAIT
+        while lock.exists() and time.monotonic() < deadline:
+            try:
+                if time.time() - lock.stat().st_mtime > LOCK_STALE:
+                    break
+            except OSError:
+                pass
+            time.sleep(0.05)
+        if path.exists():
+            return read(path)
+    try:
+        value, store = build()
+        if store:
+            write(path, value)
+        return value
+    finally:
+        if fd is not None:
+            os.close(fd)
+            lock.unlink(missing_ok=True)
+
+
+def load_workbook(caminho) -> pd.DataFrame:
+    """
+    Uma planilha, do snapshot se ela não mudou.
+    """
+    p = Path(caminho)
+    return _cached(SNAP_DIR / f"wb-{p.stem}-{file_fingerprint(p)}.pkl", lambda: (read_workbook(p), True))
+
+
+def load_workbooks(arquivos) -> tuple[pd.DataFrame, list[str], list]:
+    """
+    Planilhas existentes concatenadas. Retorna (df, erros de leitura, origens),
+    com origens = [[nome do arquivo, linhas, fingerprint, colunas], ...] na ordem
+    do df (o df tem a união das colunas; `colunas` são as da própria planilha).
+    """
+    dfs, erros, origens = [], [], []
+    for caminho in arquivos:
+        if not os.path.exists(caminho):
+            continue
+        try:
+            fp = file_fingerprint(caminho)
+            dfs.append(load_workbook(caminho))
+            origens.append([Path(caminho).name, len(dfs[-1]), fp, [str(c) for c in dfs[-1].columns]])
+        except Exception as e:
+            erros.append(f"Erro ao ler {caminho}: {e}")
+    if not dfs:
+        return pd.DataFrame(), erros, origens
+    return pd.concat(dfs, ignore_index=True), erros, origens
+
+
+def load_kml(kml_path) -> pd.DataFrame:
+    p = Path(kml_path)
+    return _cached(SNAP_DIR / f"kml-{file_fingerprint(p)}.pkl", lambda: (parse_kml_points(p), True))
+
+
+def with_coords(dfs: pd.DataFrame, df_kml: pd.DataFrame) -> tuple[pd.DataFrame, dict]:
+    """
+    Planilhas + lat/lon do KML, juntados pela chave canônica do tombo (ver tombo.py).
+    `KML_COL` diz quais linhas casaram; as outras ficam no ponto padrão.
+    """
+    # remove qualquer coluna antiga de coordenadas pra evitar colisão
+    dfs = dfs.drop(columns=[c for c in ["lat", "lon", "long", KML_COL] if c in dfs.columns])
+
+    lat, lon, report = join_coordinates(dfs, df_kml)
+    # NaN = sem ponto no KML; comparar depois com o ponto padrão confundiria
+    # exemplares coletados perto dele
+    dfs[KML_COL] = ~np.isnan(lat)
+
+    # fallback só onde estiver vazio
+    dfs["lat"] = pd.Series(lat, index=dfs.index).fillna(FALLBACK_LAT)
+    dfs["lon"] = pd.Series(lon, index=dfs.index).fillna(FALLBACK_LON)
+
+    # seu padrão antigo usava "long"
+    dfs["long"] = dfs["lon"]
+    return dfs, report
+
+
+def arrow_ready(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Um tipo por coluna, para caber no Arrow: colunas de data viram datas,
+    colunas só de números viram float e o resto (número misturado com texto)
+    vira texto. O que não é data numa coluna de data vira NaT e o texto
+    original vai para a coluna "<col> (texto original)", logo ao lado
+    (só existe se houver algum), para a tabela ainda mostrar o valor duvidoso.
+    """
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        if s.dtype == object:
+            values = s.dropna()
+            if len(values) and values.map(lambda v: isinstance(v, (datetime, date))).mean() > 0.5:
+                parsed = pd.to_datetime(s, errors="coerce")
+                lost = parsed.isna() & s.notna()
+                out[col] = parsed
+                if lost.any():
+                    out[col + ORIGINAL_SUFFIX] = s.where(lost).astype("str")
+                continue
+            elif values.map(lambda v: isinstance(v, (int, float)) and not isinstance(v, bool)).all():
+                s = s.astype("float64")
+            else:
+                s = s.astype("str")
+        out[col] = s
+    return pd.DataFrame(out, index=df.index)
+
+
+def load_with_coords(arquivos, kml_path) -> tuple[pd.DataFrame, dict, list[str]]:
+    """
+    (planilhas com coordenadas, relatório da junção, erros de leitura).
+    O relatório leva também "planilhas" (origens de load_workbooks), que dizem
+    de que arquivo/linha veio cada linha (ver correcoes.py).
+    O DataFrame devolvido do disco é só leitura (colunas mapeadas do arquivo).
+    Com erro em alguma planilha o resultado não é gravado (tenta de novo depois).
+    """
+    def build():
+        dfs, erros, origens = load_workbooks(arquivos)
+        dfs, report = with_coords(dfs, load_kml(kml_path))
+        report["planilhas"] = origens
+        return (arrow_ready(dfs), report, erros), not erros
+
+    fp = dataset_fingerprint(arquivos, kml_path)
+    return _cached(SNAP_DIR / f"coords-v{ARROW_VERSION}-{fp}.arrow", build, read=_read_arrow, write=_write_arrow)
+
+
+def photo_files(fotos_dir) -> list[str]:
+    """
+    Nomes dos arquivos de imagem da pasta de fotos. A lista fica em disco e
+    só é refeita quando a pasta muda (upload/remoção muda o mtime dela).
+    """
+    folder = Path(fotos_dir)
+    try:
+        mtime = folder.stat().st_mtime_ns
+    except OSError:
+        return []
+    index_path = SNAP_DIR / "fotos.json"
+    key = f"{folder.resolve()}|{mtime}"
+    try:
+        saved = json.loads(index_path.read_text(encoding="utf-8"))
+        if saved.get("chave") == key:
+            return saved["arquivos"]
+    except (OSError, ValueError):
+        pass
+    names = sorted(p.name for p in folder.iterdir() if p.is_file() and p.suffix.lower() in PHOTO_EXTS)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=index_path.parent, prefix=".tmp-")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"chave": key, "arquivos": names}, f, ensure_ascii=False)
+    os.replace(tmp, index_path)
+    return names
+
+
+def prune(keep: int = KEEP_VERSIONS):
+    """
+    Apaga versões antigas: mantém as `keep` mais recentes de cada planilha, do KML e do dataset.
+    """
+    if not SNAP_DIR.exists():
+        return
+    groups: dict[str, list[Path]] = {}
+    for p in [*SNAP_DIR.glob("*.pkl"), *SNAP_DIR.glob("*.arrow")]:
+        # versões de formato diferentes ("coords-v2") contam no mesmo grupo
+        kind = re.sub(r"-v\d+$", "", p.stem.rsplit("-", 1)[0])
+        groups.setdefault(kind, []).append(p)
+    for files in groups.values():
+        files.sort(key=lambda p: p.stat().st_mtime, reverse=True)
+        for p in files[keep:]:
+            try:
+                p.unlink(missing_ok=True)
+            except PermissionError:
+                pass  # Windows: ainda mapeado por algum processo; sai na próxima
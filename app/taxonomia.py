@@ -0,0 +1,91 @@
+"""
+Índice da hierarquia taxonômica (Classe → Ordem → Familia → Nome cientifico).
+
+A árvore é montada uma vez no carregamento: as linhas do dataset são
+ordenadas pelo caminho taxonômico, então cada nó corresponde a um
+intervalo contínuo dessa ordem e a contagem é o tamanho do intervalo.
+Opções dos filtros em cascata e o sunburst saem direto da árvore; as
+linhas filtradas vêm do motor de filtros (ver banco.py), com os mesmos
+rótulos.
+"""
+import numpy as np
+import pandas as pd
+
+TAXONOMY_LEVELS = ["Classe", "Ordem", "Familia", "Nome cientifico"]
+
+# separador dos ids dos nós (ex.: "Mammalia › Chiroptera")
+PATH_SEP = " › "
+
+
+def build_taxonomy(df: pd.DataFrame, levels=TAXONOMY_LEVELS) -> dict:
+    """
+    Retorna um dict com:
+      - 'levels'  níveis presentes no DF (na ordem da hierarquia)
+      - 'nodes'   DF com 1 linha por nó: id, parent, depth, label, count
+
+    Os rótulos seguem o mesmo critério dos filtros da barra lateral
+    (`fillna("(vazio)").astype(str)`), para os valores baterem.
+    """
+    levels = [c for c in levels if c in df.columns]
+    n = len(df)
+    empty_nodes = pd.DataFrame(columns=["id", "parent", "depth", "label", "count"])
+    if not levels or n == 0:
+        return {"levels": levels, "nodes": empty_nodes}
+
+    labels = df[levels].fillna("(vazio)").astype(str)
+    # lexsort usa a última chave como primária
+    order = np.lexsort([labels[c].to_numpy() for c in reversed(levels)])
+    sorted_labels = [labels[c].to_numpy()[order] for c in levels]
+
+    parts = []
+    changed = np.zeros(n, dtype=bool)
+    changed[0] = True
+    path = None
+    for depth, col in enumerate(levels):
+        col_vals = sorted_labels[depth].astype(object)
+        # nó novo sempre que este nível OU algum acima muda
+        changed = changed.copy()
+        changed[1:] |= col_vals[1:] != col_vals[:-1]
+        starts = np.flatnonzero(changed)
+        ends = np.append(starts[1:], n)
+
+        if path is None:
+            parent = np.full(len(starts), "", dtype=object)
+            path = col_vals
+        else:
+            parent = path[starts]
+            path = path + PATH_SEP + col_vals
+
+        parts.append(pd.DataFrame({
+            "id": path[starts],
+            "parent": parent,
+            "depth": depth,
+            "label": col_vals[starts],
+            "count": ends - starts,
+        }))
+
+    nodes = pd.concat(parts, ignore_index=True)
+    return {"levels": levels, "nodes": nodes}
+
+
+def children(tree: dict, depth: int, parent_ids=None) -> pd.DataFrame:
+    """
+    Nós do nível `depth` cujo pai está em `parent_ids` (None = todos).
+    """
+    nodes = tree["nodes"]
+    sel = nodes[nodes["depth"] == depth]
+    if parent_ids is not None and depth > 0:
+        sel = sel[sel["parent"].isin(parent_ids)]
+    return sel
+
+
+def node_path(tree: dict, node_id: str) -> list[str]:
+    """
+    Rótulos do caminho do nó, da raiz até ele (ex.: ["Mammalia", "Chiroptera"]).
+    """
+    nodes = tree["nodes"].set_index("id")
+    out = []
+    while node_id and node_id in nodes.index:
+        out.append(nodes.at[node_id, "label"])
+        node_id = nodes.at[node_id, "parent"]
+    return out[::-1]
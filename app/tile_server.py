@@ -0,0 +1,317 @@
+"""
+Servidor local de tiles (mapa base) para o painel funcionar offline.
+
+Ordem de busca de cada tile:
+  1) cache em disco  (.cache_painel/tiles/{z}/{x}/{y})
+  2) arquivo MBTiles local (pré-semeado com o comando `seed`)
+  3) servidor de origem (só se estiver online); o tile baixado vai pro cache
+
+Os tiles são servidos com cabeçalhos de cache HTTP (Cache-Control imutável
++ ETag), então o navegador não pede o mesmo tile de novo.
+
+Uso:
+  python app/tile_server.py serve --port 8765
+  python app/tile_server.py seed            (baixa a região pro MBTiles)
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+TILES_PORT = int(os.environ.get("PAINEL_TILES_PORT", "8765"))
+MBTILES_PATH = Path(os.environ.get("PAINEL_MBTILES", BASE_DIR / "assets" / "mapa" / "barbacena.mbtiles"))
+TILES_CACHE_DIR = BASE_DIR / ".cache_painel" / "tiles"
+
+# imagem de satélite (equivalente ao satellite-streets que o painel usava)
+TILES_UPSTREAM = os.environ.get(
+    "PAINEL_TILES_UPSTREAM",
+    "https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}",
+)
+
+# região semeada por padrão: Minas Gerais (zoom baixo) + Barbacena (zoom alto)
+SEED_REGIONS = [
+    # (lon_min, lat_min, lon_max, lat_max, zoom_min, zoom_max)
+    (-51.1, -22.95, -39.8, -14.2, 5, 10),
+    (-44.1, -21.5, -43.5, -21.0, 11, 16),
+]
+
+# tile nunca muda: 1 ano + immutable
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _content_type(data: bytes) -> str:
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if data[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+def lonlat_to_tile(lon: float, lat: float, z: int) -> tuple[int, int]:
+    n = 2 ** z
+    x = int((lon + 180.0) / 360.0 * n)
+    lat_r = math.radians(lat)
+    y = int((1.0 - math.asinh(math.tan(lat_r)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tiles_in_region(lon_min, lat_min, lon_max, lat_max, z_min, z_max):
+    for z in range(z_min, z_max + 1):
+        x0, y0 = lonlat_to_tile(lon_min, lat_max, z)
+        x1, y1 = lonlat_to_tile(lon_max, lat_min, z)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                yield z, x, y
+
+
+class TileStore:
+    """
+    Cache em disco + MBTiles (somente leitura) + origem opcional.
+    """
+
+    def __init__(self, mbtiles_path: Path = MBTILES_PATH, cache_dir: Path = TILES_CACHE_DIR,
+                 upstream: str | None = TILES_UPSTREAM):
+        self.mbtiles_path = Path(mbtiles_path)
+        self.cache_dir = Path(cache_dir)
+        self.upstream = upstream or None
+        self._local = threading.local()
+        # depois de uma falha de rede, não tenta a origem de novo por um tempo
+        self._offline_until = 0.0
+
+    def _mbtiles(self):
+        if not self.mbtiles_path.exists():
+            return None
+        con = getattr(self._local, "con", None)
+        if con is None:
+            uri = f"file:{self.mbtiles_path.as_posix()}?mode=ro"
+            con = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self._local.con = con
+        return con
+
+    def _cache_path(self, z: int, x: int, y: int) -> Path:
+        return self.cache_dir / str(z) / str(x) / str(y)
+
+    def get(self, z: int, x: int, y: int, cache: bool = True) -> bytes | None:
+        p = self._cache_path(z, x, y)
+        if p.exists():
+            return p.read_bytes()
+
+        con = self._mbtiles()
+        if con is not None:
+            # MBTiles usa o esquema TMS (y invertido)
+            row = con.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                (z, x, (2 ** z - 1) - y),
+            ).fetchone()
+            if row is not None:
+                return bytes(row[0])
+
+        data = self._fetch_upstream(z, x, y)
+        if data is not None and cache:
+            p.parent.mkdir(parents=True, exist_ok=True)
+            # temporário próprio: duas threads buscando o mesmo tile não disputam o arquivo
+            fd, tmp = tempfile.mkstemp(dir=p.parent, prefix=".tmp-")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, p)
+        return data
+
+    def _fetch_upstream(self, z: int, x: int, y: int) -> bytes | None:
+        if not self.upstream or time.monotonic() < self._offline_until:
+            return None
+        url = self.upstream.format(z=z, x=x, y=y)
+        try:
+            req = urllib.request.Request(url, headers={"User-Agent": "painel-zoologia-tiles"})
+            with urllib.request.urlopen(req, timeout=5) as r:
+                if r.status != 200:
+                    return None
+                return r.read()
+        except urllib.error.HTTPError:
+            # o servidor respondeu (ex.: 404 fora da cobertura): só este tile falta
+            return None
+        except OSError:
+            # sem rede / DNS / timeout: para de tentar por um minuto
+            self._offline_until = time.monotonic() + 60
+            return None
+        except Exception:
+            return None
+
+
+def seed_mbtiles(store: TileStore, regions=SEED_REGIONS, out_path: Path = MBTILES_PATH) -> int:
+    """
+    Baixa os tiles das regiões para o MBTiles (pula os que já existem).
+    Retorna quantos tiles novos foram gravados.
+    """
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(out_path)
+    con.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)")
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, "
+        "tile_row INTEGER, tile_data BLOB, PRIMARY KEY (zoom_level, tile_column, tile_row))"
+    )
+    lon_min = min(r[0] for r in regions)
+    lat_min = min(r[1] for r in regions)
+    lon_max = max(r[2] for r in regions)
+    lat_max = max(r[3] for r in regions)
+    con.executemany(
+        "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+        [
+            ("name", "Painel Zoologia - Barbacena/MG"),
+            ("format", "jpg"),
+            ("bounds", f"{lon_min},{lat_min},{lon_max},{lat_max}"),
+            ("minzoom", str(min(r[4] for r in regions))),
+            ("maxzoom", str(max(r[5] for r in regions))),
+        ],
+    )
+
+    novos = 0
+    for region in regions:
+        for z, x, y in tiles_in_region(*region):
+            tms_y = (2 ** z - 1) - y
+            exists = con.execute(
+                "SELECT 1 FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                (z, x, tms_y),
+            ).fetchone()
+            if exists:
+                continue
+            data = store.get(z, x, y, cache=False)
+            if data is None:
+                continue
+            con.execute("INSERT INTO tiles VALUES (?, ?, ?, ?)", (z, x, tms_y, sqlite3.Binary(data)))
+            novos += 1
+            if novos % 500 == 0:
+                con.commit()
+                print(f"{novos} tiles gravados...")
+    con.commit()
+    con.close()
+    return novos
+
+
+def style_json(base_url: str) -> dict:
+    """
+    Estilo MapLibre/Mapbox GL com uma única camada raster apontando pra este servidor.
+    """
+    return {
+        "version": 8,
+        "sources": {
+            "local": {
+                "type": "raster",
+                "tiles": [f"{base_url}/tiles/{{z}}/{{x}}/{{y}}"],
+                "tileSize": 256,
+                "maxzoom": 19,
+            }
+        },
+        "layers": [{"id": "local", "type": "raster", "source": "local"}],
+    }
+
+
+def make_handler(store: TileStore):
+    class TileHandler(BaseHTTPRequestHandler):
+        server_version = "PainelTiles/1.0"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, body: bytes = b"", headers: dict | None = None):
+            self.send_response(status)
+            self.send_header("Access-Control-Allow-Origin", "*")
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if body and self.command != "HEAD":
+                self.wfile.write(body)
+
+        def do_HEAD(self):
+            self.do_GET()
+
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+
+            if path == "/health":
+                self._send(200, b"ok", {"Content-Type": "text/plain"})
+                return
+
+            if path == "/style.json":
+                host = self.headers.get("Host") or f"127.0.0.1:{self.server.server_address[1]}"
+                body = json.dumps(style_json(f"http://{host}")).encode("utf-8")
+                self._send(200, body, {"Content-Type": "application/json", "Cache-Control": "no-cache"})
+                return
+
+            parts = path.strip("/").split("/")
+            if len(parts) != 4 or parts[0] != "tiles":
+                self._send(404)
+                return
+            try:
+                z, x, y = int(parts[1]), int(parts[2]), int(parts[3].split(".")[0])
+            except ValueError:
+                self._send(400)
+                return
+
+            data = store.get(z, x, y)
+            if data is None:
+                self._send(404, b"", {"Cache-Control": "no-store"})
+                return
+
+            etag = '"' + hashlib.md5(data).hexdigest() + '"'
+            headers = {"Cache-Control": CACHE_CONTROL, "ETag": etag}
+            if self.headers.get("If-None-Match") == etag:
+                self._send(304, b"", headers)
+                return
+
+            headers["Content-Type"] = _content_type(data)
+            headers["Last-Modified"] = formatdate(usegmt=True)
+            self._send(200, data, headers)
+
+    return TileHandler
+
+
+def serve(port: int = TILES_PORT, store: TileStore | None = None):
+    store = store or TileStore()
+    httpd = ThreadingHTTPServer(("127.0.0.1", port), make_handler(store))
+    httpd.daemon_threads = True
+    print(f"Servidor de tiles em http://127.0.0.1:{port} (MBTiles: {store.mbtiles_path})")
+    httpd.serve_forever()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Cache/servidor local de tiles do painel")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p_serve = sub.add_parser("serve", help="sobe o servidor de tiles")
+    p_serve.add_argument("--port", type=int, default=TILES_PORT)
+    p_serve.add_argument("--offline", action="store_true", help="não busca tiles na origem")
+
+    p_seed = sub.add_parser("seed", help="baixa a região (MG/Barbacena) para o MBTiles")
+    p_seed.add_argument("--out", type=Path, default=MBTILES_PATH)
+
+    args = ap.parse_args(argv)
+
+    if args.cmd == "serve":
+        store = TileStore(upstream=None if args.offline else TILES_UPSTREAM)
+        serve(args.port, store)
+    elif args.cmd == "seed":
+        # lê só da origem (o cache em disco também é aproveitado)
+        store = TileStore(mbtiles_path=Path("__sem_mbtiles__"))
+        n = seed_mbtiles(store, out_path=args.out)
+        print(f"{n} tiles novos gravados em {args.out}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
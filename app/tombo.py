@@ -0,0 +1,165 @@
+"""
+Normalização do "N tombo coleção" e junção das coordenadas do KML.
+
+As planilhas e o KML escrevem o mesmo tombo de jeitos diferentes
+("CZ IFSEMG An 001", "An 1", 123.0, "123", "CZ IFSEMG M 10 a 12 e 15"...).
+Aqui tudo vira uma chave canônica ("AN 1", "M 10", "123") calculada uma
+vez por valor distinto, e a junção é feita por hash sobre essas chaves.
+"""
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# prefixo institucional, que nem sempre aparece
+_PREFIX_RE = re.compile(r"^(?:CZ\b\s*)?(?:IFSEMG\b\s*)?")
+
+# sigla (opcional) + número: "AN 001", "M-12", "R12", "123"
+_SIGLA_NUM_RE = re.compile(r"^([A-Z]{1,3})?\s*[-_.]?\s*0*(\d+)$")
+
+# listas e intervalos no KML: "M 10 a 12 e 15", "AN 5 AO 9", "M 1, 2 E 3"
+_RANGE_RE = re.compile(r"(\d+)\s*(?:A|AO|ATE|-)\s*(\d+)")
+
+# teto de tombos gerados por um único intervalo (evita "1 a 99999")
+MAX_RANGE = 200
+
+
+def _clean(value) -> str | None:
+    if value is None:
+        return None
+    if isinstance(value, float):
+        if np.isnan(value):
+            return None
+        if value.is_integer():
+            return str(int(value))
+    s = str(value).strip()
+    if not s or s.lower() in {"nan", "none", "<na>"}:
+        return None
+    s = unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode("ascii")
+    s = re.sub(r"\s+", " ", s.upper())
+    # "123.0" vindo de planilha lida como texto
+    s = re.sub(r"^(\d+)\.0+$", r"\1", s)
+    # anotações soltas: "R 12?", "AN 7*"
+    s = s.strip(" ?*.,;")
+    return s or None
+
+
+def canonical_tombo(value) -> str | None:
+    """
+    Chave canônica de um tombo: "CZ IFSEMG An 001" -> "AN 1", 123.0 -> "123".
+    Valores fora do padrão voltam só limpos (maiúsculas, sem acento).
+    """
+    s = _clean(value)
+    if s is None:
+        return None
+    s = _PREFIX_RE.sub("", s).strip()
+    m = _SIGLA_NUM_RE.match(s)
+    if not m:
+        return s or None
+    sigla, num = m.group(1), int(m.group(2))
+    return f"{sigla} {num}" if sigla else str(num)
+
+
+def expand_tombos(value) -> list[str]:
+    """
+    Um nome do KML pode cobrir vários tombos:
+      "CZ IFSEMG M 10 a 12 e 15" -> ["M 10", "M 11", "M 12", "M 15"]
+    Se não for lista/intervalo, retorna só a chave canônica.
+    """
+    s = _clean(value)
+    if s is None:
+        return []
+    s = _PREFIX_RE.sub("", s).strip()
+
+    m = re.match(r"^([A-Z]{1,3})\s+(\d.*)$", s)
+    if not m or not re.search(r"\d\D+\d", m.group(2)):
+        key = canonical_tombo(s)
+        return [key] if key else []
+
+    sigla, resto = m.group(1), m.group(2)
+    nums = []
+    for parte in re.split(r"\s*(?:,|\bE\b)\s*", resto):
+        r = _RANGE_RE.fullmatch(parte.strip())
+        if r:
+            a, b = int(r.group(1)), int(r.group(2))
+            if a <= b and b - a < MAX_RANGE:
+                nums.extend(range(a, b + 1))
+                continue
+        d = re.fullmatch(r"0*(\d+)", parte.strip())
+        if d:
+            nums.append(int(d.group(1)))
+    if not nums:
+        key = canonical_tombo(s)
+        return [key] if key else []
+    return [f"{sigla} {n}" for n in dict.fromkeys(nums)]
+
+
+def canonicalize_series(s: pd.Series) -> pd.Series:
+    """
+    Versão vetorizada de `canonical_tombo`: normaliza só os valores distintos
+    e devolve uma Series categórica (códigos inteiros, sem cópia de strings por linha).
+    """
+    codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    keys = pd.Series([canonical_tombo(v) for v in uniques], dtype="object")
+    cats = pd.Index(keys.dropna().unique())
+    key_codes = cats.get_indexer(keys) if len(keys) else np.array([], dtype=np.intp)
+    row_codes = np.where(codes >= 0, key_codes[codes] if len(key_codes) else -1, -1)
+    return pd.Series(pd.Categorical.from_codes(row_codes, categories=cats), index=s.index)
+
+
+def kml_keys(df_kml: pd.DataFrame) -> pd.DataFrame:
+    """
+    KML com 1 linha por chave canônica (nomes com lista/intervalo são expandidos).
+    Colunas: 'tombo_key', 'lat', 'lon'.
+    """
+    if df_kml is None or df_kml.empty:
+        return pd.DataFrame(columns=["tombo_key", "lat", "lon"])
+    out = df_kml[["lat", "lon"]].copy()
+    out["tombo_key"] = [expand_tombos(v) for v in df_kml["N tombo coleção"]]
+    out = out.explode("tombo_key").dropna(subset=["tombo_key"])
+    return out.drop_duplicates(subset=["tombo_key"])[["tombo_key", "lat", "lon"]].reset_index(drop=True)
+
+
+def join_coordinates(df: pd.DataFrame, df_kml: pd.DataFrame, key_col: str = "N tombo coleção"):
+    """
+    Junta lat/lon do KML às linhas de `df` pela chave canônica do tombo.
+
+    Retorna (lat, lon, relatorio):
+      - lat, lon: arrays float64 alinhados com `df` (NaN onde não casou)
+      - relatorio: dict com 'linhas', 'casadas', 'sem_tombo',
+        'tombos_sem_kml' (chaves da planilha sem ponto) e
+        'kml_sem_tombo' (chaves do KML sem exemplar na planilha)
+    """
+    n = len(df)
+    lat = np.full(n, np.nan)
+    lon = np.full(n, np.nan)
+    report = {"linhas": n, "casadas": 0, "sem_tombo": n, "tombos_sem_kml": [], "kml_sem_tombo": []}
+    if n == 0 or key_col not in df.columns:
+        return lat, lon, report
+
+    keys = canonicalize_series(df[key_col])
+    cats = keys.cat.categories
+    codes = keys.cat.codes.to_numpy()
+    report["sem_tombo"] = int((codes < 0).sum())
+
+    kml = kml_keys(df_kml)
+    if kml.empty:
+        report["tombos_sem_kml"] = sorted(cats.tolist())
+        return lat, lon, report
+
+    # hash join: 1 lookup por chave distinta, depois só indexação por inteiros
+    kml_index = pd.Index(kml["tombo_key"])
+    cat_to_kml = kml_index.get_indexer(cats)
+    row_kml = np.where(codes >= 0, cat_to_kml[codes], -1) if len(cats) else np.full(n, -1)
+
+    hit = row_kml >= 0
+    lat[hit] = kml["lat"].to_numpy(dtype="float64")[row_kml[hit]]
+    lon[hit] = kml["lon"].to_numpy(dtype="float64")[row_kml[hit]]
+
+    report["casadas"] = int(hit.sum())
+    report["tombos_sem_kml"] = sorted(cats[cat_to_kml < 0].tolist())
+    used = np.zeros(len(kml_index), dtype=bool)
+    used[cat_to_kml[cat_to_kml >= 0]] = True
+    report["kml_sem_tombo"] = sorted(kml_index[~used].tolist())
+    return lat, lon, report
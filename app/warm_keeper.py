@@ -0,0 +1,108 @@
+"""
+Mantém os modelos do assistente carregados no Ollama enquanto o painel está em uso.
+
+Uma thread por processo:
+  - na partida, carrega os modelos (sem gerar nada, ver ollama_client.warm);
+  - enquanto houver sessões ativas (a página chama `activity()` a cada rerun),
+    confere a cada `CHECK_EVERY` s se o modelo continua na memória (/api/ps)
+    e recarrega se o Ollama o descarregou; e renova o keep_alive a cada
+    `PING_EVERY` s;
+  - sem ninguém usando por `IDLE_AFTER` s, para de renovar e deixa o Ollama
+    liberar a memória quando o keep_alive vencer.
+
+Além dos modelos fixos (o padrão e o de embeddings), só o último modelo
+escolhido no campo "Modelo Ollama" é mantido: escolher outro tira o anterior.
+Modelo que não carregou ("falhou", ex.: nome digitado errado) só é tentado
+de novo depois de `FAIL_BACKOFF` s.
+
+Assim a primeira pergunta de quem abre o painel não paga o carregamento do modelo.
+"""
+import threading
+import time
+
+import ollama_client
+
+CHECK_EVERY = 30.0
+PING_EVERY = 10 * 60.0
+IDLE_AFTER = 30 * 60.0
+FAIL_BACKOFF = 10 * 60.0
+
+
+class WarmKeeper:
+    """
+    Estados por modelo: "carregando", "carregado", "falhou".
+    """
+
+    def __init__(self, models: list[str], embed_models: list[str] | None = None, host: str | None = None):
+        self.host = host
+        self.models = {m: False for m in models}
+        self.models.update({m: True for m in (embed_models or [])})  # modelo -> é de embeddings?
+        self.status: dict[str, str] = {m: "carregando" for m in self.models}
+        self.fixed = set(self.models)
+        self.selected: str | None = None
+        self.last_activity = time.monotonic()
+        self._last_ping: dict[str, float] = {}
+        self._failed_at: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        threading.Thread(target=self._loop, daemon=True, name="painel-warm-keeper").start()
+
+    def activity(self):
+        self.last_activity = time.monotonic()
+
+    def watch(self, model: str, embed: bool = False):
+        """
+        Passa a manter também este modelo (ex.: digitado no campo "Modelo Ollama"),
+        no lugar do escolhido antes.
+        """
+        model = (model or "").strip()
+        if not model:
+            return
+        with self._lock:
+            if model in self.fixed or model == self.selected:
+                return
+            if self.selected is not None:
+                for d in (self.models, self.status, self._last_ping, self._failed_at):
+                    d.pop(self.selected, None)
+            self.selected = model
+            self.models[model] = embed
+            self.status[model] = "carregando"
+        self._wake.set()
+
+    def _active(self) -> bool:
+        return time.monotonic() - self.last_activity < IDLE_AFTER
+
+    def _tick(self):
+        with self._lock:
+            models = dict(self.models)
+        loaded = ollama_client.loaded_models(self.host)
+        now = time.monotonic()
+        for model, embed in models.items():
+            if now - self._failed_at.get(model, float("-inf")) < FAIL_BACKOFF:
+                continue
+            # /api/ps indisponível (Ollama antigo): só renova pelo intervalo
+            missing = loaded is not None and ollama_client.full_model_name(model) not in loaded
+            due = now - self._last_ping.get(model, float("-inf")) > PING_EVERY
+            if missing or due:
+                ok = ollama_client.warm(model, host=self.host, embed=embed)
+                with self._lock:
+                    if model not in self.models:
+                        continue  # trocado enquanto carregava
+                    self.status[model] = "carregado" if ok else "falhou"
+                    if ok:
+                        self._last_ping[model] = now
+                        self._failed_at.pop(model, None)
+                    else:
+                        self._failed_at[model] = now
+            elif loaded is not None:
+                self.status[model] = "carregado"
+
+    def _loop(self):
+        while True:
+            if self._active() and ollama_client.is_up(self.host):
+                try:
+                    self._tick()
+                except Exception:
+                    pass
+            self._wake.wait(CHECK_EVERY)
+            self._wake.clear()